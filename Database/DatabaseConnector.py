@@ -1,27 +1,294 @@
+import atexit
+import os
 import sqlite3
+import threading
+import time
 from sqlite3 import Error
 import os.path as path
+from urllib.request import pathname2url
+
+from Database import QueryStats
+
+# Tuning applied to every pooled connection. mmap_size is in bytes and a
+# negative cache_size is in KiB.
+MMAP_SIZE = int(os.environ.get('AKOBOT_DB_MMAP_SIZE', 256 * 2 ** 20))
+CACHE_SIZE = int(os.environ.get('AKOBOT_DB_CACHE_SIZE', -16 * 2 ** 10))
+CACHED_STATEMENTS = 256
+# "rw" (default) or "ro". Serving nodes never write to the database so can
+# open it read only and immutable, which skips locking altogether and lets
+# every worker process share the OS page cache through mmap.
+DB_MODE = os.environ.get('AKOBOT_DB_MODE', 'rw')
+# Most connections a pool keeps open, and how long in seconds a thread waits
+# for one of them to be returned before giving up
+POOL_SIZE = int(os.environ.get('AKOBOT_DB_POOL_SIZE', 8))
+POOL_TIMEOUT = float(os.environ.get('AKOBOT_DB_POOL_TIMEOUT', 30))
+
+
+def database_path(db_file_name):
+    # We assume that the database is in the current directory since this
+    # is how it's laid out at the moment
+    base_dir = path.dirname(path.abspath(__file__))
+    return path.join(base_dir, db_file_name)
+
+
+class ConnectionPool:
+    def __init__(self, db_file_name, read_only=None, max_connections=None,
+                 timeout=None):
+        """
+        A bounded set of connections to the database shared by every thread.
+        A thread checks a connection out on first use and keeps it until it
+        is released, then the next thread reuses it rather than opening
+        another one.
+
+        Parameters
+        ----------
+        db_file_name: str
+            The database file, relative to this directory
+        read_only: bool
+            Open the database read only and immutable. The file must not
+            change while it is open.
+            default: AKOBOT_DB_MODE is "ro"
+        max_connections: int
+            The most connections open at once
+            default: AKOBOT_DB_POOL_SIZE
+        timeout: float
+            Seconds to wait for a connection when they are all checked out
+            default: AKOBOT_DB_POOL_TIMEOUT
+        """
+        self.full_path = database_path(db_file_name)
+        if read_only is None:
+            read_only = DB_MODE == "ro"
+        self.read_only = read_only
+        self.max_connections = max_connections or POOL_SIZE
+        self.timeout = POOL_TIMEOUT if timeout is None else timeout
+        self.local = threading.local()
+        self.available = threading.Condition()
+        # Connections waiting to be checked out, the most recently returned
+        # last so its pages are the most likely to still be cached
+        self.idle = []
+        # (thread, connection) for every connection checked out
+        self.in_use = []
+        self.opened = 0
+        print(self.full_path)
+
+    def connect(self):
+        # A connection moves between threads as it's checked out and
+        # returned, but is only used by one thread at a time
+        if self.read_only:
+            uri = "file:{}?mode=ro&immutable=1".format(
+                pathname2url(self.full_path))
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False,
+                                   cached_statements=CACHED_STATEMENTS)
+        else:
+            conn = sqlite3.connect(self.full_path, check_same_thread=False,
+                                   cached_statements=CACHED_STATEMENTS)
+            try:
+                # WAL lets readers carry on while another connection writes
+                conn.execute("PRAGMA journal_mode = WAL")
+                conn.execute("PRAGMA synchronous = NORMAL")
+            except Error as e:
+                # e.g. the database file is read only
+                print(e)
+        conn.execute("PRAGMA mmap_size = {:d}".format(MMAP_SIZE))
+        conn.execute("PRAGMA cache_size = {:d}".format(CACHE_SIZE))
+        return conn
+
+    def connection(self, owner=None):
+        """
+        Parameters
+        ----------
+        owner: object
+            Recorded as the owner if this call checks the connection out, so
+            only it releases the connection through release_owned
+
+        Returns
+        -------
+        sqlite3.Connection
+            The calling thread's connection, checked out on first use
+        """
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.checkout()
+            self.local.conn = conn
+            self.local.owner = owner
+        return conn
+
+    def checkout(self):
+        deadline = time.monotonic() + self.timeout
+        with self.available:
+            while True:
+                if self.idle:
+                    conn = self.idle.pop()
+                    break
+                if len(self.in_use) < self.max_connections:
+                    conn = None
+                    self.opened += 1
+                    break
+                if self.reclaim_finished_threads():
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise sqlite3.OperationalError(
+                        "no database connection was returned within "
+                        "{:g}s".format(self.timeout))
+                self.available.wait(remaining)
+            # Reserve the slot before connecting outside the lock
+            self.in_use.append((threading.current_thread(), conn))
+        if conn is None:
+            try:
+                conn = self.connect()
+            except Error:
+                with self.available:
+                    self.in_use.remove((threading.current_thread(), None))
+                    self.available.notify()
+                raise
+            with self.available:
+                index = self.in_use.index((threading.current_thread(), None))
+                self.in_use[index] = (threading.current_thread(), conn)
+        return conn
+
+    def release(self):
+        """Returns the calling thread's connection to the pool if it has one"""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            return
+        self.local.conn = None
+        self.local.owner = None
+        if conn.in_transaction:
+            conn.rollback()
+        with self.available:
+            self.in_use.remove((threading.current_thread(), conn))
+            self.idle.append(conn)
+            self.available.notify()
+
+    def release_owned(self, owner):
+        """Releases the calling thread's connection if owner checked it out"""
+        if getattr(self.local, "conn", None) is not None \
+                and self.local.owner is owner:
+            self.release()
+
+    def reclaim_finished_threads(self):
+        """
+        Returns connections left checked out by threads that have finished,
+        the caller must hold self.available
+
+        Returns
+        -------
+        bool
+            Whether any were returned
+        """
+        in_use = []
+        for thread, conn in self.in_use:
+            if thread.is_alive() or conn is None:
+                in_use.append((thread, conn))
+            else:
+                if conn.in_transaction:
+                    conn.rollback()
+                self.idle.append(conn)
+        reclaimed = len(in_use) < len(self.in_use)
+        self.in_use = in_use
+        return reclaimed
+
+    def close(self):
+        """Closes every connection in the pool"""
+        with self.available:
+            for conn in self.idle:
+                conn.close()
+            for _, conn in self.in_use:
+                if conn is not None:
+                    conn.close()
+            self.idle = []
+            self.in_use = []
+            self.available.notify_all()
+        self.local = threading.local()
+
+    def stats(self):
+        with self.available:
+            return {"path": self.full_path,
+                    "read_only": self.read_only,
+                    "open": len(self.idle) + len(self.in_use),
+                    "idle": len(self.idle),
+                    "in_use": len(self.in_use),
+                    "opened": self.opened,
+                    "max": self.max_connections}
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_connection_pool(db_file_name='AKODatabase.db'):
+    """
+    Returns
+    -------
+    ConnectionPool
+        The pool shared by every DBConnection to db_file_name in this process
+    """
+    pool = _pools.get(db_file_name)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(db_file_name)
+            if pool is None:
+                pool = _pools[db_file_name] = ConnectionPool(db_file_name)
+    return pool
+
+
+def release_connections():
+    """
+    Returns the calling thread's connections to their pools, e.g. at the end
+    of a request
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.release()
+
+
+def close_connection_pools():
+    """Closes every pooled connection, e.g. before the process exits"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+atexit.register(close_connection_pools)
 
 
 class DBConnection:
     def __init__(self, db_file_name):
-        # We assume that the database is in the current directory since this
-        # is how it's laid out at the moment
-
-        base_dir = path.dirname(path.abspath(__file__))
-        full_path = path.join(base_dir, db_file_name)
-        print(full_path)
-        self.conn = None
+        self.pool = None
         try:
-            self.conn = sqlite3.connect(full_path, check_same_thread=False)
+            self.pool = get_connection_pool(db_file_name)
         except Error as e:
             print(e)
 
+    @property
+    def conn(self):
+        """The calling thread's connection or None once closed"""
+        if self.pool is None:
+            return None
+        return self.pool.connection(owner=self)
+
     def send_query(self, query, params=None):
         # This method will just be used to send queries, it will be changed in
         # the future since different queries require different methods and
         # returns.
         if params is None:
             params = {}
-        cur = self.conn.cursor()
-        return cur.execute(query, params)
+        start = time.perf_counter()
+        cur = self.conn.cursor().execute(query, params)
+        if QueryStats.ENABLED:
+            return QueryStats.InstrumentedCursor(
+                cur, QueryStats.get_query_stats(), query, params, start)
+        return cur
+
+    def close(self):
+        """
+        Releases this handle, it can't be used afterwards. The thread's
+        connection goes back to the pool if this handle checked it out,
+        otherwise it's left to the handle that did.
+        """
+        if self.pool is not None:
+            self.pool.release_owned(self)
+        self.pool = None
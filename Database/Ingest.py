@@ -0,0 +1,198 @@
+"""
+Ingest.py
+
+Loads Darwin running data CSVs (e.g. TrainingData/NRCH_LIVST_OD_*.csv) into
+main.Data and its typed copy main.Running. Files are parsed in parallel and
+inserted in chunks, one transaction per chunk. Stops already in main.Data
+(the same rid and tpl) are skipped, so files can be loaded again safely. Run
+from the repository root:
+
+    python Database/Ingest.py TrainingData/*.csv
+    python Database/Ingest.py --db AKODatabase.db --workers 4 data/2018/*.csv
+"""
+import sys, os
+currentdir = os.path.dirname(os.path.realpath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.append(parentdir)
+
+import argparse
+import csv
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from Database.DatabaseConnector import CACHE_SIZE, DBConnection
+from Database.Migrations import COPY_LOCATIONS, COPY_RUNNING, migrate
+
+# The columns of the CSVs that are kept, the rest aren't read by anything
+# (see migration 5)
+DATA_COLUMNS = ["rid", "tpl", "pta", "ptd", "arr_at", "dep_at"]
+CREATE_DATA = "CREATE TABLE IF NOT EXISTS main.Data ({})".format(
+    ", ".join(column + " TEXT" for column in DATA_COLUMNS))
+# Inserts keep four indexes up to date, which slows down sharply once they
+# no longer fit in the page cache
+INGEST_CACHE_SIZE = -256 * 2 ** 10
+INSERT_DATA = "INSERT OR IGNORE INTO main.Data ({}) VALUES ({})".format(
+    ", ".join(DATA_COLUMNS), ", ".join("?" * len(DATA_COLUMNS)))
+
+
+def parse_file(file_name):
+    """
+    Reads the stops from one CSV. Passing points (no public arrival or
+    departure time) are left out as nothing queries them.
+
+    Parameters
+    ----------
+    file_name: str
+        The CSV to read, its header must name the columns
+
+    Returns
+    -------
+    rows - list of tuple - the stops, in DATA_COLUMNS order
+    read - int - the number of rows in the file
+    rejected - int - the number of rows without a rid or tpl
+    """
+    rows = []
+    read = 0
+    rejected = 0
+    with open(file_name, newline='') as csv_file:
+        reader = csv.reader(csv_file)
+        header = next(reader, [])
+        positions = [header.index(column) if column in header else None
+                     for column in DATA_COLUMNS]
+        rid, tpl, pta, ptd = positions[:4]
+        if rid is None or tpl is None:
+            raise ValueError("{} has no rid or tpl column".format(file_name))
+        for row in reader:
+            read += 1
+            if len(row) != len(header) or not row[rid] or not row[tpl]:
+                rejected += 1
+                continue
+            if ((pta is None or not row[pta]) and
+                    (ptd is None or not row[ptd])):
+                continue
+            rows.append(tuple(row[i] if i is not None else ''
+                              for i in positions))
+    return rows, read, rejected
+
+
+def parse_files(file_names, workers):
+    """
+    Parses file_names on a pool of worker processes, yielding each file's
+    result as soon as it is ready. At most two files per worker are held in
+    memory at once.
+    """
+    if workers <= 1:
+        for file_name in file_names:
+            yield (file_name,) + parse_file(file_name)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = []
+        for file_name in file_names:
+            pending.append((file_name, executor.submit(parse_file,
+                                                       file_name)))
+            if len(pending) >= workers * 2:
+                file_name, future = pending.pop(0)
+                yield (file_name,) + future.result()
+        for file_name, future in pending:
+            yield (file_name,) + future.result()
+
+
+def ingest(file_names, db_file_name='AKODatabase.db', chunk_size=50000,
+           workers=None):
+    """
+    Loads file_names into main.Data
+
+    Parameters
+    ----------
+    file_names: list of str
+        The CSVs to load
+    db_file_name: str
+        The database to load them into
+    chunk_size: int
+        The number of rows inserted per transaction
+    workers: int
+        The number of processes parsing files
+        default: one per CPU
+
+    Returns
+    -------
+    dict
+        Counts of the files and rows read, inserted, skipped as duplicates
+        and rejected, with the time taken
+    """
+    if workers is None:
+        workers = min(os.cpu_count() or 1, len(file_names))
+    start = time.perf_counter()
+    db_connection = DBConnection(db_file_name)
+    conn = db_connection.conn
+    with conn:
+        conn.execute(CREATE_DATA)
+    # The unique (rid, tpl) index makes INSERT OR IGNORE skip duplicates
+    migrate(db_file_name)
+
+    report = {"files": 0, "read": 0, "stops": 0, "inserted": 0,
+              "duplicates": 0, "rejected": 0}
+    conn.execute("PRAGMA cache_size = {:d}".format(INGEST_CACHE_SIZE))
+    # Everything after this is new and needs copying to main.Running
+    after_rowid = conn.execute(
+        "SELECT coalesce(max(rowid), 0) FROM main.Data").fetchone()[0]
+    def insert(chunk):
+        before = conn.total_changes
+        with conn:
+            conn.executemany(INSERT_DATA, chunk)
+        report["inserted"] += conn.total_changes - before
+
+    try:
+        # Rows from several (small) files are gathered into each chunk, as
+        # every commit adds to the write-ahead log and can checkpoint it
+        chunk = []
+        for file_name, rows, read, rejected in parse_files(file_names,
+                                                           workers):
+            report["files"] += 1
+            report["read"] += read
+            report["stops"] += len(rows)
+            report["rejected"] += rejected
+            chunk.extend(rows)
+            while len(chunk) >= chunk_size:
+                insert(chunk[:chunk_size])
+                chunk = chunk[chunk_size:]
+        if chunk:
+            insert(chunk)
+        with conn:
+            conn.execute(COPY_LOCATIONS, {"after_rowid": after_rowid})
+            conn.execute(COPY_RUNNING, {"after_rowid": after_rowid})
+            conn.execute("ANALYZE main.Data")
+            conn.execute("ANALYZE main.Running")
+    finally:
+        conn.execute("PRAGMA cache_size = {:d}".format(CACHE_SIZE))
+        db_connection.close()
+
+    report["duplicates"] = report["stops"] - report["inserted"]
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load Darwin running data CSVs into main.Data")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--db", default="AKODatabase.db",
+                        help="database file, relative to Database/")
+    parser.add_argument("--chunk-size", type=int, default=50000,
+                        help="rows inserted per transaction")
+    parser.add_argument("--workers", type=int,
+                        help="processes parsing files, default one per CPU")
+    args = parser.parse_args()
+
+    report = ingest(args.files, args.db, args.chunk_size, args.workers)
+    print("files:      {}".format(report["files"]))
+    print("rows read:  {}".format(report["read"]))
+    print("inserted:   {}".format(report["inserted"]))
+    print("duplicates: {}".format(report["duplicates"]))
+    print("rejected:   {}".format(report["rejected"]))
+    print("time:       {:.2f} s ({:.0f} rows/s)".format(
+        report["seconds"], report["read"] / max(report["seconds"], 1e-9)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+"""
+Migrations.py
+
+Schema changes to AKODatabase.db. Each migration is applied once, in order,
+and the database's PRAGMA user_version records the last one applied. Run
+from the repository root to bring a database up to date:
+
+    python Database/Migrations.py [db_file_name]
+"""
+import sys, os
+currentdir = os.path.dirname(os.path.realpath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.append(parentdir)
+
+import sqlite3
+
+from Database.DatabaseConnector import DBConnection
+
+
+def seconds(column):
+    """SQL converting an 'HH:MM' column to seconds, NULL if it isn't a time"""
+    return ("(CASE WHEN {0} GLOB '[0-2][0-9]:[0-5][0-9]' THEN "
+            "substr({0}, 1, 2) * 3600 + substr({0}, 4, 2) * 60 END)"
+            ).format(column)
+
+
+def rolled(column):
+    """
+    SQL adding a day to a time more than six hours before the train's first
+    time, i.e. one after midnight for a train that started the day before
+    """
+    return ("{0} + (CASE WHEN {0} < origin - 21600 THEN 86400 ELSE 0 END)"
+            .format(column))
+
+
+# Copies the stops of every train with a stop in main.Data after rowid
+# :after_rowid into main.Locations and main.Running
+COPY_LOCATIONS = """
+    INSERT OR IGNORE INTO main.Locations (tpl)
+    SELECT DISTINCT tpl FROM main.Data
+    WHERE rowid > :after_rowid ORDER BY tpl"""
+COPY_RUNNING = """
+    INSERT OR REPLACE INTO main.Running
+        (location_id, rid, service_date, pta, ptd, arr_at, dep_at)
+    SELECT l.id, CAST(s.rid AS INTEGER), CAST(substr(s.rid, 1, 8) AS INTEGER),
+        {rolled_pta}, {rolled_ptd}, {rolled_arr_at}, {rolled_dep_at}
+    FROM (SELECT *, first_value(coalesce(ptd, pta, dep_at, arr_at))
+                        OVER (PARTITION BY rid ORDER BY seq) AS origin
+          FROM (SELECT rid, tpl, rowid AS seq, {pta} AS pta, {ptd} AS ptd,
+                    {arr_at} AS arr_at, {dep_at} AS dep_at
+                FROM main.Data
+                WHERE rid IN (SELECT rid FROM main.Data
+                              WHERE rowid > :after_rowid))) AS s
+        JOIN main.Locations AS l ON l.tpl = s.tpl
+    WHERE s.rid GLOB '[0-9]*'""".format(
+    pta=seconds("pta"), ptd=seconds("ptd"), arr_at=seconds("arr_at"),
+    dep_at=seconds("dep_at"), rolled_pta=rolled("pta"),
+    rolled_ptd=rolled("ptd"), rolled_arr_at=rolled("arr_at"),
+    rolled_dep_at=rolled("dep_at"))
+
+# (version, description, statements). A statement is SQL or (SQL, params).
+MIGRATIONS = [
+    (1, "Covering indexes on main.Data for Predictions.harvest_data", [
+        # Departures are looked up by station and joined on rid, so both
+        # columns lead and the times ride along to avoid reading the table
+        """CREATE INDEX IF NOT EXISTS main.DataDepartures
+           ON Data (tpl, rid, ptd, dep_at)""",
+        """CREATE INDEX IF NOT EXISTS main.DataArrivals
+           ON Data (tpl, rid, pta, arr_at)""",
+        "ANALYZE main.Data",
+    ]),
+    (2, "Unique stops on main.Data so Database/Ingest.py can skip "
+        "duplicates", [
+        # Keep the first copy of any stop loaded more than once
+        """DELETE FROM main.Data WHERE rowid NOT IN
+           (SELECT MIN(rowid) FROM main.Data GROUP BY rid, tpl)""",
+        """CREATE UNIQUE INDEX IF NOT EXISTS main.DataStops
+           ON Data (rid, tpl)""",
+    ]),
+    (3, "Typed copy of main.Data in main.Locations and main.Running", [
+        """CREATE TABLE IF NOT EXISTS main.Locations (
+               id INTEGER PRIMARY KEY,
+               tpl TEXT NOT NULL UNIQUE)""",
+        # Times are seconds since midnight on the service date (so after
+        # 86400 for stops after midnight) and NULL when unknown. Keyed by
+        # location then train so each station's trains are stored together
+        # in rid order, as harvest_data reads them.
+        """CREATE TABLE IF NOT EXISTS main.Running (
+               location_id INTEGER NOT NULL REFERENCES Locations (id),
+               rid INTEGER NOT NULL,
+               service_date INTEGER NOT NULL,
+               pta INTEGER,
+               ptd INTEGER,
+               arr_at INTEGER,
+               dep_at INTEGER,
+               PRIMARY KEY (location_id, rid)) WITHOUT ROWID""",
+        (COPY_LOCATIONS, {"after_rowid": 0}),
+        (COPY_RUNNING, {"after_rowid": 0}),
+        "ANALYZE main.Running",
+    ]),
+    (4, "Count changes to main.Stations for the station index", [
+        """CREATE TABLE IF NOT EXISTS main.TableVersions (
+               name TEXT PRIMARY KEY,
+               version INTEGER NOT NULL)""",
+        "INSERT OR IGNORE INTO main.TableVersions VALUES ('Stations', 0)",
+    ] + ["""CREATE TRIGGER IF NOT EXISTS main.Stations{0}
+            AFTER {1} ON Stations BEGIN
+                UPDATE TableVersions SET version = version + 1
+                WHERE name = 'Stations';
+            END""".format(event.title(), event)
+         for event in ["INSERT", "UPDATE", "DELETE"]]),
+    (5, "Drop the columns of main.Data nothing reads", [
+        # Rebuilt as SQLite can't drop columns. The rowids are kept since
+        # Refresh.py finds the trains loaded since a rowid.
+        "DROP TABLE IF EXISTS main.DataCompact",
+        """CREATE TABLE main.DataCompact (
+               rid TEXT, tpl TEXT, pta TEXT, ptd TEXT, arr_at TEXT,
+               dep_at TEXT)""",
+        """INSERT INTO main.DataCompact
+               (rowid, rid, tpl, pta, ptd, arr_at, dep_at)
+           SELECT rowid, rid, tpl, pta, ptd, arr_at, dep_at
+           FROM main.Data""",
+        "DROP TABLE main.Data",
+        "ALTER TABLE main.DataCompact RENAME TO Data",
+        """CREATE INDEX main.DataDepartures
+           ON Data (tpl, rid, ptd, dep_at)""",
+        """CREATE INDEX main.DataArrivals
+           ON Data (tpl, rid, pta, arr_at)""",
+        "CREATE UNIQUE INDEX main.DataStops ON Data (rid, tpl)",
+        "ANALYZE main.Data",
+    ]),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+# Migrations that free enough space to be worth vacuuming the database
+# after, as the file doesn't shrink otherwise
+VACUUM_AFTER = [5]
+# What the chatbot and predictions need to be able to run
+REQUIRED_TABLES = ["Data", "Stations", "Locations", "Running"]
+REQUIRED_INDEXES = ["DataDepartures", "DataArrivals", "DataStops"]
+
+
+class SchemaError(Exception):
+    """The database is missing tables or indexes, or hasn't been migrated"""
+
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA main.user_version").fetchone()[0]
+
+
+def migrate(db_file_name='AKODatabase.db'):
+    """
+    Applies every migration the database hasn't had yet
+
+    Parameters
+    ----------
+    db_file_name: str
+        The database file to migrate
+
+    Returns
+    -------
+    list of int
+        The versions of the migrations applied
+    """
+    db_connection = DBConnection(db_file_name)
+    conn = db_connection.conn
+    applied = []
+    try:
+        for version, description, statements in MIGRATIONS:
+            if version <= get_schema_version(conn):
+                continue
+            print("Applying migration {}: {}".format(version, description))
+            with conn:
+                for statement in statements:
+                    if isinstance(statement, str):
+                        statement = (statement, ())
+                    conn.execute(*statement)
+                # PRAGMA doesn't accept bound parameters
+                conn.execute("PRAGMA main.user_version = {:d}".format(version))
+            applied.append(version)
+        if set(applied) & set(VACUUM_AFTER):
+            print("Vacuuming {}".format(db_file_name))
+            conn.execute("VACUUM")
+    except sqlite3.Error as e:
+        print(e)
+    finally:
+        db_connection.close()
+    return applied
+
+
+def check_schema(db_file_name='AKODatabase.db'):
+    """
+    Checks the database has every required table and index and every
+    migration applied, e.g. before serving from a read only database that
+    can't be migrated
+
+    Parameters
+    ----------
+    db_file_name: str
+        The database file to check
+
+    Raises
+    ------
+    SchemaError
+        Listing everything that is missing
+    """
+    db_connection = DBConnection(db_file_name)
+    try:
+        existing = {(row[0], row[1]) for row in db_connection.send_query(
+            "SELECT type, name FROM main.sqlite_master")}
+        version = get_schema_version(db_connection.conn)
+    finally:
+        db_connection.close()
+
+    missing = ["table " + name for name in REQUIRED_TABLES
+               if ("table", name) not in existing]
+    missing += ["index " + name for name in REQUIRED_INDEXES
+                if ("index", name) not in existing]
+    if version < SCHEMA_VERSION:
+        missing.append("migrations {} to {}".format(version + 1,
+                                                    SCHEMA_VERSION))
+    if missing:
+        raise SchemaError("{} is missing {}".format(db_file_name,
+                                                    ", ".join(missing)))
+
+
+if __name__ == '__main__':
+    db_file_name = sys.argv[1] if len(sys.argv) > 1 else 'AKODatabase.db'
+    migrate(db_file_name)
+    # Fail the deploy if any migration couldn't be applied
+    try:
+        check_schema(db_file_name)
+    except SchemaError as e:
+        sys.exit(e)
@@ -0,0 +1,233 @@
+"""
+QueryStats.py
+
+Times every statement sent through DBConnection.send_query so the slowest
+queries can be found, and logs the query plan of any slow statement
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# Set AKOBOT_QUERY_STATS=0 to stop send_query recording stats
+ENABLED = os.environ.get('AKOBOT_QUERY_STATS', '1') != '0'
+# Statements taking longer than this (in ms) are logged with their plan
+SLOW_QUERY_MS = float(os.environ.get('AKOBOT_SLOW_QUERY_MS', 100))
+# Upper bounds (in ms) of the histogram buckets, the last bucket is unbounded
+BUCKETS_MS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000]
+# Statements beyond this many are grouped together so SQL built with literal
+# values can't grow the stats without bound
+MAX_STATEMENTS = 500
+OTHER_STATEMENTS = "<other statements>"
+
+
+def normalise_query(query):
+    """Collapses the whitespace in query so formatting doesn't matter"""
+    return " ".join(query.split())
+
+
+class StatementStats:
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.histogram = [0] * (len(BUCKETS_MS) + 1)
+
+    def add(self, elapsed_ms, rows):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.rows += rows
+        self.histogram[bisect_left(BUCKETS_MS, elapsed_ms)] += 1
+
+    def to_dict(self, statement):
+        labels = ["<={}ms".format(bound) for bound in BUCKETS_MS]
+        labels.append(">{}ms".format(BUCKETS_MS[-1]))
+        return {"statement": statement,
+                "count": self.count,
+                "total_ms": round(self.total_ms, 3),
+                "mean_ms": round(self.total_ms / self.count, 3),
+                "max_ms": round(self.max_ms, 3),
+                "rows": self.rows,
+                "histogram": {label: n for label, n in
+                              zip(labels, self.histogram) if n}}
+
+
+class QueryStats:
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS):
+        """
+        Per statement timings and row counts for every query sent through
+        DBConnection.send_query. A statement is timed from being executed
+        until all of its rows have been fetched, as SQLite does most of the
+        work while the rows are being stepped through.
+
+        Parameters
+        ----------
+        slow_query_ms: float
+            Statements taking longer than this are logged with their query
+            plan, None to turn the log off
+        """
+        self.slow_query_ms = slow_query_ms
+        self.statements = {}
+        self.lock = threading.Lock()
+
+    def record(self, query, elapsed_ms, rows, conn=None, params=None):
+        """
+        Adds one run of query to the stats
+
+        Parameters
+        ----------
+        query: str
+            The SQL that was run
+        elapsed_ms: float
+            How long it took, including fetching the rows
+        rows: int
+            The number of rows returned (or changed)
+        conn: sqlite3.Connection
+            The connection it ran on, used to explain slow statements
+        params: tuple or dict
+            The parameters it ran with
+        """
+        statement = normalise_query(query)
+        with self.lock:
+            stats = self.statements.get(statement)
+            if stats is None:
+                key = statement
+                if len(self.statements) >= MAX_STATEMENTS:
+                    key = OTHER_STATEMENTS
+                stats = self.statements.setdefault(key, StatementStats())
+            stats.add(elapsed_ms, rows)
+        if (self.slow_query_ms is not None and conn is not None and
+                elapsed_ms > self.slow_query_ms):
+            self.log_slow_query(statement, elapsed_ms, rows, conn, params)
+
+    @staticmethod
+    def log_slow_query(statement, elapsed_ms, rows, conn, params):
+        try:
+            plan = [row[-1] for row in
+                    conn.execute("EXPLAIN QUERY PLAN " + statement,
+                                 params or ())]
+        except Exception as e:
+            plan = ["unable to explain: {}".format(e)]
+        print("Slow query ({:.1f} ms, {} rows): {}".format(elapsed_ms, rows,
+                                                           statement))
+        for step in plan:
+            print("    " + step)
+
+    def top(self, n=20):
+        """
+        Returns
+        -------
+        list of dict
+            The n statements with the highest total time, slowest first
+        """
+        with self.lock:
+            ranked = sorted(self.statements.items(),
+                            key=lambda item: item[1].total_ms, reverse=True)
+            return [stats.to_dict(statement) for statement, stats in
+                    ranked[:n]]
+
+    def reset(self):
+        with self.lock:
+            self.statements = {}
+
+
+class InstrumentedCursor:
+    def __init__(self, cursor, query_stats, query, params, start):
+        """
+        Wraps a cursor that has just executed query, recording it in
+        query_stats once all of its rows have been fetched, or when it's
+        closed or dropped with rows left (e.g. after a single fetchone).
+        Anything not wrapped here is passed through to the cursor.
+        """
+        self.cursor = cursor
+        self.query_stats = query_stats
+        self.query = query
+        self.params = params
+        self.elapsed = time.perf_counter() - start
+        self.rows = 0
+        self.recorded = False
+        if cursor.description is None:
+            # Not a SELECT so there's nothing to fetch
+            self.rows = max(cursor.rowcount, 0)
+            self.finish()
+
+    def finish(self):
+        if not self.recorded:
+            self.recorded = True
+            self.query_stats.record(self.query, self.elapsed * 1000,
+                                    self.rows, self.cursor.connection,
+                                    self.params)
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = self.cursor.fetchall()
+        self.elapsed += time.perf_counter() - start
+        self.rows += len(rows)
+        self.finish()
+        return rows
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = self.cursor.fetchone()
+        self.elapsed += time.perf_counter() - start
+        if row is None:
+            self.finish()
+        else:
+            self.rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = (self.cursor.fetchmany() if size is None
+                else self.cursor.fetchmany(size))
+        self.elapsed += time.perf_counter() - start
+        self.rows += len(rows)
+        if not rows:
+            self.finish()
+        return rows
+
+    def close(self):
+        self.finish()
+        self.cursor.close()
+
+    def __del__(self):
+        # recorded isn't set if __init__ failed, there's nothing to record
+        if getattr(self, "recorded", True):
+            return
+        try:
+            self.finish()
+        except Exception:
+            pass
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+_query_stats = None
+_query_stats_lock = threading.Lock()
+
+
+def get_query_stats():
+    """
+    Returns
+    -------
+    QueryStats
+        The stats shared by every DBConnection in this process
+    """
+    global _query_stats
+    if _query_stats is None:
+        with _query_stats_lock:
+            if _query_stats is None:
+                _query_stats = QueryStats()
+    return _query_stats
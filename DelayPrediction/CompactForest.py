@@ -0,0 +1,136 @@
+import copy
+
+import numpy as np
+
+
+class CompactForest:
+    def __init__(self, forest, max_depth=None):
+        """
+        A fitted random forest (or other averaging ensemble of regression
+        trees) flattened into a few arrays, for keeping many models in
+        memory. Each node takes 17 bytes (int32 children, int8 feature,
+        float32 threshold and value) where scikit-learn takes 72, and the
+        trees can be cut off at max_depth, dropping the nodes below it and
+        the node there predicting the mean of every journey below it.
+
+        Predictions match the forest's, apart from the values being rounded
+        to float32 and any cut off trees. Thresholds are rounded down to a
+        float32 so inputs (which the trees compare as float32) still fall
+        on the same side of them.
+
+        Parameters
+        ----------
+        forest: sklearn forest
+            The fitted forest, with estimators_ of regression trees
+        max_depth: int
+            The depth to cut the trees off at, None to keep them whole
+        """
+        left, right, feature, threshold, value, roots = [], [], [], [], [], []
+        offset = 0
+        depth = 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            nodes = tree.node_count
+            tree_left = tree.children_left.astype(np.int64)
+            tree_right = tree.children_right.astype(np.int64)
+            # Walk down the tree a level at a time from the root
+            node_depth = np.zeros(nodes, dtype=np.int64)
+            level, level_depth = np.array([0]), 0
+            while level.size:
+                node_depth[level] = level_depth
+                split = level[tree_left[level] >= 0]
+                level = np.concatenate([tree_left[split], tree_right[split]])
+                level_depth += 1
+            leaf = tree_left < 0
+            keep = np.ones(nodes, dtype=bool)
+            if max_depth is not None:
+                leaf |= node_depth >= max_depth
+                # Nodes below the cut off can't be reached so are dropped
+                keep = node_depth <= max_depth
+            index = np.cumsum(keep) - 1
+            # Leaves point to themselves so every row can take the same
+            # number of steps
+            own = np.arange(nodes)
+            left.append(index[np.where(leaf, own, tree_left)][keep] + offset)
+            right.append(index[np.where(leaf, own, tree_right)][keep] +
+                         offset)
+            feature.append(np.where(leaf, 0, tree.feature)[keep])
+            tree_threshold = tree.threshold.astype(np.float32)
+            rounded_up = tree_threshold > tree.threshold
+            tree_threshold[rounded_up] = np.nextafter(
+                tree_threshold[rounded_up], np.float32(-np.inf))
+            threshold.append(tree_threshold[keep])
+            value.append(tree.value[keep, 0, 0])
+            roots.append(offset)
+            depth = max(depth, int(node_depth[~leaf].max() + 1)
+                        if (~leaf).any() else 0)
+            offset += int(keep.sum())
+
+        self.left = np.concatenate(left).astype(np.int32)
+        self.right = np.concatenate(right).astype(np.int32)
+        self.feature = np.concatenate(feature).astype(np.int8)
+        self.threshold = np.concatenate(threshold)
+        self.value = np.concatenate(value).astype(np.float32)
+        self.roots = np.array(roots, dtype=np.int32)
+        self.depth = depth
+        self.max_depth = max_depth
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in [self.left, self.right,
+                                              self.feature, self.threshold,
+                                              self.value, self.roots])
+
+    def apply(self, x_data):
+        """
+        Returns
+        -------
+        (rows, trees) array of the node each row ends up at in each tree
+        """
+        x_data = np.asarray(x_data, dtype=np.float32)
+        rows = np.arange(len(x_data))[:, np.newaxis]
+        nodes = np.broadcast_to(self.roots, (len(x_data), len(self.roots)))
+        for _ in range(self.depth):
+            go_left = (x_data[rows, self.feature[nodes]] <=
+                       self.threshold[nodes])
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+    def predict(self, x_data):
+        """
+        Parameters
+        ----------
+        x_data - (rows, features) array
+
+        Returns
+        -------
+        array of the mean of the trees' predictions for each row
+        """
+        return self.value[self.apply(x_data)].mean(axis=1, dtype=np.float64)
+
+
+def compact(model, max_depth=None):
+    """
+    Returns
+    -------
+    The CompactForest of model if it's a forest of regression trees (or a
+    Corridor.CorridorModel wrapping one), otherwise model itself
+    """
+    estimators = getattr(model, "estimators_", None)
+    if (isinstance(estimators, list) and estimators and
+            all(hasattr(estimator, "tree_") for estimator in estimators) and
+            getattr(model, "n_outputs_", 1) == 1 and
+            not hasattr(model, "classes_")):
+        return CompactForest(model, max_depth)
+    inner = getattr(model, "estimator", None)
+    if inner is not None and hasattr(inner, "estimators_"):
+        compacted = compact(inner, max_depth)
+        if compacted is not inner:
+            model = copy.copy(model)
+            model.estimator = compacted
+    return model
+
+
+def is_compact(model):
+    """Whether model is a CompactForest or wraps one"""
+    return isinstance(getattr(model, "estimator", model), CompactForest)
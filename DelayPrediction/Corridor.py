@@ -0,0 +1,140 @@
+import sys, os
+currentdir = os.path.dirname(os.path.realpath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.append(parentdir)
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+
+from DelayPrediction.Features import day_of_week, features
+from DelayPrediction.ModelStore import FEATURE_COLUMNS
+
+# Stops in order from Norwich to London Liverpool Street
+CORRIDOR = ["NRCH", "DISS", "STWMRKT", "IPSWICH", "MANNGTR", "CLCHSTR",
+            "WITHAME", "CHLMSFD", "INT", "SHENFLD", "STFD", "LIVST"]
+# The ModelStore/FeatureStore key of the corridor wide model
+CORRIDOR_KEY = ("CORRIDOR", "ALL")
+# The per pair features plus where the journey starts and ends on the line
+# and how long it's timetabled to take (seconds)
+CORRIDOR_FEATURE_COLUMNS = FEATURE_COLUMNS + ["origin", "destination",
+                                              "scheduled_time"]
+# Every stop on the line, as main.Running rows
+CorridorQuery = """
+    SELECT r.rid, r.service_date, l.tpl, r.pta, r.ptd, r.arr_at, r.dep_at
+    FROM main.Running AS r JOIN main.Locations AS l ON l.id = r.location_id
+    WHERE l.tpl IN ({})""".format(", ".join("?" * len(CORRIDOR)))
+
+
+def stop_order(code):
+    """The position of the station with code on the line, None if off it"""
+    return CORRIDOR.index(code) if code in CORRIDOR else None
+
+
+def build_corridor_dataset(result):
+    """
+    Pairs every stop a train called at with every later stop on the line
+        and builds the features for each of those journeys
+
+    Parameters
+    ----------
+    result - list of (rid, service_date, tpl, pta, ptd, arr_at, dep_at)
+        rows from CorridorQuery
+
+    Returns
+    -------
+    data - DataFrame with the CORRIDOR_FEATURE_COLUMNS and arrival_time
+    """
+    stops = pd.DataFrame.from_records(
+        result, columns=["rid", "service_date", "tpl", "pta", "ptd",
+                         "arr_at", "dep_at"])
+    stops["order"] = stops["tpl"].map(stop_order)
+    departures = stops.dropna(subset=["ptd", "dep_at"])
+    arrivals = stops.dropna(subset=["pta", "arr_at"])
+    journeys = departures.merge(arrivals, on="rid", suffixes=("", "_to"))
+    journeys = journeys[journeys["order_to"] > journeys["order"]]
+    days = day_of_week(journeys["service_date"].values.astype(np.float64))
+    # features drops journeys with an invalid date, drop them first so the
+    # columns added below still line up
+    journeys = journeys[~np.isnan(days)]
+
+    data, _ = features(
+        journeys["rid"].values, days[~np.isnan(days)],
+        *[journeys[column].values.astype(np.float64)
+          for column in ["ptd", "dep_at", "pta_to", "arr_at_to"]])
+    data["origin"] = journeys["order"].values
+    data["destination"] = journeys["order_to"].values
+    data["scheduled_time"] = (journeys["pta_to"].values -
+                              journeys["ptd"].values)
+    return data
+
+
+def corridor_estimator():
+    # Fully grown trees fitted to every pair at once are ~70 MB, leaves of at
+    # least 20 journeys cut that to ~4 MB and predict better on unseen days
+    # (benchmarks/compare_corridor_model.py)
+    return RandomForestRegressor(n_estimators=100, min_samples_leaf=20)
+
+
+class CorridorModel:
+    def __init__(self, estimator=None):
+        """
+        One model for every origin and destination on the line. Journeys
+        are told apart by their stop order and timetabled running time, so
+        pairs with little history borrow from the rest of the line.
+
+        The timetabled running time isn't known when predicting from a
+        chat, so the median seen for the pair in training is used. Pairs
+        never seen fall back to the median running time per stop.
+
+        Parameters
+        ----------
+        estimator: sklearn regressor
+            The model fitted to the CORRIDOR_FEATURE_COLUMNS
+            default: corridor_estimator()
+        """
+        self.estimator = estimator if estimator is not None \
+            else corridor_estimator()
+        self.scheduled_times = {}
+        self.seconds_per_stop = 0.0
+
+    def fit(self, x_data, y_data):
+        x_data = np.asarray(x_data, dtype=np.float64)
+        schedule = pd.DataFrame(x_data[:, -3:], columns=["origin",
+                                                         "destination",
+                                                         "scheduled_time"])
+        medians = schedule.groupby(["origin", "destination"])[
+            "scheduled_time"].median()
+        self.scheduled_times = {(int(origin), int(destination)): seconds
+                                for (origin, destination), seconds
+                                in medians.items()}
+        stops = schedule["destination"] - schedule["origin"]
+        if len(schedule):
+            self.seconds_per_stop = float(
+                (schedule["scheduled_time"] / stops).median())
+        self.estimator.fit(x_data, y_data)
+        return self
+
+    def fill_scheduled_times(self, x_data):
+        """Fills in any scheduled_time left as NaN"""
+        x_data = np.array(x_data, dtype=np.float64)
+        for row in np.flatnonzero(np.isnan(x_data[:, -1])):
+            origin, destination = int(x_data[row, -3]), \
+                int(x_data[row, -2])
+            x_data[row, -1] = self.scheduled_times.get(
+                (origin, destination),
+                abs(destination - origin) * self.seconds_per_stop)
+        return x_data
+
+    def predict(self, x_data):
+        """
+        Parameters
+        ----------
+        x_data - array of the CORRIDOR_FEATURE_COLUMNS, scheduled_time can
+            be NaN
+
+        Returns
+        -------
+        array of predicted arrival delays (seconds)
+        """
+        return self.estimator.predict(self.fill_scheduled_times(x_data))
@@ -0,0 +1,293 @@
+import sys, os
+currentdir = os.path.dirname(os.path.realpath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.append(parentdir)
+
+import json
+import threading
+import time
+
+import numpy as np
+
+from DelayPrediction.ModelStore import FEATURE_COLUMNS, FEATURE_VERSION
+
+FEATURE_DIR = os.environ.get('AKOBOT_FEATURE_DIR',
+                             os.path.join(currentdir, 'features'))
+
+
+def array_header(array_file):
+    """
+    Reads the header of the open .npy file
+
+    Returns
+    -------
+    offset - int - where the array's data starts
+    shape - tuple - the shape it was saved with
+    dtype - numpy.dtype
+    """
+    version = np.lib.format.read_magic(array_file)
+    if version == (1, 0):
+        shape, _, dtype = np.lib.format.read_array_header_1_0(array_file)
+    else:
+        shape, _, dtype = np.lib.format.read_array_header_2_0(array_file)
+    return array_file.tell(), shape, dtype
+
+
+def map_array(path, rows):
+    """
+    Memory maps the first rows of the .npy file at path, read only. Rows
+    are appended to the end of the file without rewriting its header, so
+    how many there are comes from the manifest rather than the header.
+    """
+    with open(path, "rb") as array_file:
+        offset, shape, dtype = array_header(array_file)
+    shape = (rows,) + tuple(shape[1:])
+    if not rows:
+        # An empty map isn't allowed
+        array = np.empty(shape, dtype=dtype)
+        array.flags.writeable = False
+        return array
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape)
+
+
+class FeatureStore:
+    def __init__(self, feature_dir=FEATURE_DIR):
+        """
+        Keeps the training data for each station pair on disk as .npy files
+        (the FEATURE_COLUMNS as one float64 matrix and the arrival delays as
+        a vector) so they can be memory mapped rather than queried and
+        copied into Python objects every time a model is trained
+
+        Parameters
+        ----------
+        feature_dir: str
+            Directory the arrays and their manifests are saved in
+        """
+        self.feature_dir = feature_dir
+        self.lock = threading.Lock()
+
+    def manifest_path(self, pair):
+        return os.path.join(self.feature_dir, "{}_{}.json".format(*pair))
+
+    def read_manifest(self, pair, source_version=None):
+        """
+        Returns
+        -------
+        The manifest for the pair's arrays or None if there aren't any built
+        from source_version (any version if None) with the current feature
+        version
+        """
+        try:
+            with open(self.manifest_path(pair)) as manifest_file:
+                manifest = json.load(manifest_file)
+        except (OSError, ValueError):
+            return None
+        if (manifest.get("feature_version") != FEATURE_VERSION or
+                (source_version is not None and
+                 manifest.get("source_version") != source_version)):
+            return None
+        return manifest
+
+    def load(self, pair, source_version):
+        """
+        Memory maps the pair's arrays
+
+        Parameters
+        ----------
+        pair - tuple - (departure station, arrival station) codes
+        source_version - the version of the data the arrays must have been
+            built from, e.g. Predictions.source_version(), None for any
+
+        Returns
+        -------
+        x_data - read only (rows, len(FEATURE_COLUMNS)) float64 memmap
+        y_data - read only float64 memmap of the arrival delays
+        or None if they haven't been built from source_version
+        """
+        manifest = self.read_manifest(pair, source_version)
+        if manifest is None:
+            return None
+        try:
+            return (map_array(os.path.join(self.feature_dir, manifest["x"]),
+                              manifest["rows"]),
+                    map_array(os.path.join(self.feature_dir, manifest["y"]),
+                              manifest["rows"]))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def write_manifest(self, pair, manifest):
+        """Replaces the pair's manifest, must be called holding self.lock"""
+        with open(self.manifest_path(pair) + ".tmp", "w") as manifest_file:
+            json.dump(manifest, manifest_file)
+        os.replace(self.manifest_path(pair) + ".tmp", self.manifest_path(pair))
+
+    def save(self, pair, data, source_version, columns=FEATURE_COLUMNS):
+        """
+        Saves the pair's training data and maps it back in
+
+        Parameters
+        ----------
+        pair - tuple - (departure station, arrival station) codes
+        data - DataFrame with the columns and arrival_time
+        source_version - the version of the data it was built from
+        columns - list of str - the model inputs, in order
+
+        Returns
+        -------
+        x_data, y_data - as load
+        """
+        return self.save_arrays(pair, data[columns].values,
+                                data["arrival_time"].values, source_version,
+                                columns)
+
+    def save_arrays(self, pair, x_data, y_data, source_version,
+                    columns=FEATURE_COLUMNS):
+        """
+        As save but from the model inputs and arrival delays as arrays
+        """
+        os.makedirs(self.feature_dir, exist_ok=True)
+        stem = "{}_{}_{}_{}".format(pair[0], pair[1],
+                                    time.strftime("%Y%m%d%H%M%S"),
+                                    os.getpid())
+        files = {"x": stem + ".x.npy", "y": stem + ".y.npy"}
+        arrays = {"x": np.ascontiguousarray(x_data, dtype=np.float64),
+                  "y": np.ascontiguousarray(y_data, dtype=np.float64)}
+        for key, file_name in files.items():
+            path = os.path.join(self.feature_dir, file_name)
+            # Write then rename so other processes never map half an array
+            with open(path + ".tmp", "wb") as array_file:
+                np.save(array_file, arrays[key])
+            os.replace(path + ".tmp", path)
+
+        manifest = dict(files, pair=list(pair), columns=list(columns),
+                        feature_version=FEATURE_VERSION,
+                        source_version=source_version,
+                        rows=len(arrays["y"]),
+                        built_at=time.strftime("%Y-%m-%dT%H:%M:%S"))
+        with self.lock:
+            old_manifest = {}
+            try:
+                with open(self.manifest_path(pair)) as manifest_file:
+                    old_manifest = json.load(manifest_file)
+            except (OSError, ValueError):
+                pass
+            self.write_manifest(pair, manifest)
+            # Arrays already mapped stay readable after being unlinked
+            for key in ["x", "y"]:
+                old_file = old_manifest.get(key)
+                if old_file and old_file != files[key]:
+                    try:
+                        os.remove(os.path.join(self.feature_dir, old_file))
+                    except OSError:
+                        pass
+        return self.load(pair, source_version)
+
+    def append(self, pair, data, source_version, columns=FEATURE_COLUMNS):
+        """
+        Adds journeys to the pair's saved training data, whichever version
+        it was built from. The new rows are written to the end of the saved
+        arrays, so this takes as long as the new journeys do to write rather
+        than the whole history. Arrays already mapped are unchanged.
+
+        Parameters
+        ----------
+        pair - tuple - (departure station, arrival station) codes
+        data - DataFrame with the columns and arrival_time, the journeys
+            added since the saved data was built
+        source_version - the version of the data, including the new
+            journeys
+        columns - list of str - as save
+
+        Returns
+        -------
+        x_data, y_data - as load, or None if the pair hasn't been saved
+        """
+        with self.lock:
+            manifest = self.read_manifest(pair)
+            if manifest is None:
+                return None
+            arrays = {"x": np.ascontiguousarray(data[columns].values,
+                                                dtype=np.float64),
+                      "y": np.ascontiguousarray(data["arrival_time"].values,
+                                                dtype=np.float64)}
+            try:
+                for key, array in arrays.items():
+                    path = os.path.join(self.feature_dir, manifest[key])
+                    with open(path, "r+b") as array_file:
+                        offset, shape, dtype = array_header(array_file)
+                        if (dtype != array.dtype or
+                                tuple(shape[1:]) != array.shape[1:]):
+                            return None
+                        # Anything past the manifest's rows was left by an
+                        # append that didn't finish
+                        array_file.seek(offset + manifest["rows"] *
+                                        dtype.itemsize *
+                                        int(np.prod(shape[1:])))
+                        array_file.truncate()
+                        array_file.write(array.tobytes())
+            except (OSError, ValueError, KeyError):
+                return None
+            manifest.update(source_version=source_version,
+                            rows=manifest["rows"] + len(arrays["y"]),
+                            appended_at=time.strftime("%Y-%m-%dT%H:%M:%S"))
+            self.write_manifest(pair, manifest)
+        return self.load(pair, source_version)
+
+    def set_source_version(self, pair, source_version):
+        """
+        Marks the pair's saved training data as up to date with
+        source_version, for when none of the data added since it was built
+        is for the pair. Only the manifest is rewritten.
+
+        Returns
+        -------
+        bool - False if the pair hasn't been saved
+        """
+        with self.lock:
+            manifest = self.read_manifest(pair)
+            if manifest is None:
+                return False
+            manifest["source_version"] = source_version
+            self.write_manifest(pair, manifest)
+        return True
+
+    def get(self, pair, source_version, dataset, columns=FEATURE_COLUMNS):
+        """
+        Gets the pair's training data, building it if it hasn't been built
+        from source_version
+
+        Parameters
+        ----------
+        pair - tuple - (departure station, arrival station) codes
+        source_version - the version of the data, e.g.
+            Predictions.source_version()
+        dataset - callable - returns the DataFrame to save, only called if
+            the arrays need building
+        columns - list of str - as save
+
+        Returns
+        -------
+        x_data, y_data - as load
+        """
+        arrays = self.load(pair, source_version)
+        if arrays is None:
+            arrays = self.save(pair, dataset(), source_version, columns)
+        return arrays
+
+
+_feature_store = None
+_feature_store_lock = threading.Lock()
+
+
+def get_feature_store():
+    """
+    Returns
+    -------
+    The FeatureStore shared by every Predictions instance in this process
+    """
+    global _feature_store
+    if _feature_store is None:
+        with _feature_store_lock:
+            if _feature_store is None:
+                _feature_store = FeatureStore()
+    return _feature_store
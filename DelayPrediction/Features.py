@@ -0,0 +1,173 @@
+import sys, os
+currentdir = os.path.dirname(os.path.realpath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.append(parentdir)
+
+import numpy as np
+import pandas as pd
+
+HARVEST_COLUMNS = ["rid", "tpl_from", "ptd", "dep_at", "tpl_to", "pta",
+                   "arr_at"]
+RUNNING_COLUMNS = ["rid", "service_date", "ptd", "dep_at", "pta", "arr_at"]
+DATASET_COLUMNS = ["rid", "time_dep", "delay", "day_of_week", "weekend",
+                   "day_segment", "rush_hour", "arrival_time"]
+
+
+def parse_times(times):
+    """
+    Converts 'HH:MM' strings to seconds since midnight in bulk
+
+    Parameters
+    ----------
+    times - array-like of str
+
+    Returns
+    -------
+    seconds - float array, NaN wherever the time isn't a valid 'HH:MM'
+    """
+    try:
+        raw = np.asarray(times, dtype="S6")
+    except UnicodeEncodeError:
+        raw = np.asarray([str(t).encode("ascii", "replace") for t in times],
+                         dtype="S6")
+    if len(raw) == 0:
+        return np.empty(0)
+    # One row of character codes per time, digits become 0-9
+    chars = raw.view(np.uint8).reshape(len(raw), 6).astype(np.int16) - 48
+    digits = chars[:, [0, 1, 3, 4]]
+    valid = (((digits >= 0) & (digits <= 9)).all(axis=1) &
+             (chars[:, 2] == ord(":") - 48) & (chars[:, 5] == -48))
+    hours = digits[:, 0] * 10 + digits[:, 1]
+    minutes = digits[:, 2] * 10 + digits[:, 3]
+    valid &= (hours < 24) & (minutes < 60)
+    return np.where(valid, hours * 3600.0 + minutes * 60.0, np.nan)
+
+
+def day_segment(hours):
+    """
+    Vectorised Predictions.check_day_segment - morning(1), midday(2),
+        evening(3) or night(4)
+    """
+    return np.select([(hours >= 5) & (hours < 10),
+                      (hours >= 10) & (hours < 15),
+                      (hours >= 15) & (hours < 20)], [1, 2, 3], 4)
+
+
+def rush_hour(hours, minutes):
+    """
+    Vectorised Predictions.is_rush_hour - rush hour(1) or not(0). Unlike
+        is_rush_hour, times between 00:00 and 00:59 are 0 rather than []
+    """
+    return (((hours == 5) & (minutes >= 45)) |
+            ((hours >= 6) & (hours <= 8)) |
+            ((hours == 9) & (minutes == 0)) |
+            ((hours >= 16) & (hours <= 18))).astype(np.int64)
+
+
+def build_features(result):
+    """
+    Turns the journeys from main.Data into the dataset used for prediction,
+        in bulk rather than row by row
+
+    Parameters
+    ----------
+    result - list of (rid, tpl_from, ptd, dep_at, tpl_to, pta, arr_at) rows,
+        times as 'HH:MM'
+
+    Returns
+    -------
+    data - DataFrame with DATASET_COLUMNS, one row per usable journey
+    rejected - int - number of journeys dropped because a time or the date
+        in the RID couldn't be read
+    """
+    journeys = pd.DataFrame.from_records(result, columns=HARVEST_COLUMNS)
+    rid = journeys["rid"].astype(str)
+    # Get date based on RID
+    date = pd.to_datetime(rid.str[:8], format="%Y%m%d", errors="coerce")
+    return features(rid.values, date.dt.dayofweek.values,
+                    parse_times(journeys["ptd"].values),
+                    parse_times(journeys["dep_at"].values),
+                    parse_times(journeys["pta"].values),
+                    parse_times(journeys["arr_at"].values))
+
+
+def day_of_week(dates):
+    """
+    Gets the day of the week (Monday = 0, Sunday = 6) of YYYYMMDD dates with
+        Sakamoto's method
+
+    Parameters
+    ----------
+    dates - float array of YYYYMMDD dates
+
+    Returns
+    -------
+    float array - the day of each date, NaN if it isn't a valid date
+    """
+    year = dates // 10000
+    month = (dates // 100) % 100
+    day = dates % 100
+    valid = (month >= 1) & (month <= 12) & (day >= 1) & (day <= 31)
+    offsets = np.array([0, 3, 2, 5, 0, 3, 5, 1, 4, 6, 2, 4])
+    month_offset = offsets[np.clip(month, 1, 12).astype(np.int64) - 1]
+    year = year - (month < 3)
+    # Sakamoto's method gives Sunday = 0
+    sunday_first = (year + year // 4 - year // 100 + year // 400 +
+                    month_offset + day) % 7
+    return np.where(valid, (sunday_first + 6) % 7, np.nan)
+
+
+def build_features_from_running(result):
+    """
+    As build_features but for journeys from main.Running, whose times are
+        already seconds since midnight on the service date
+
+    Parameters
+    ----------
+    result - list of (rid, service_date, ptd, dep_at, pta, arr_at) rows,
+        service_date as YYYYMMDD and times in seconds (None if unknown)
+
+    Returns
+    -------
+    data - DataFrame with DATASET_COLUMNS, one row per usable journey. rid
+        is an integer here rather than a string.
+    rejected - int - number of journeys dropped because a time or the
+        service date was missing or invalid
+    """
+    # Every value is a number or None so the whole result converts at once,
+    # None becoming NaN
+    journeys = np.array(result, dtype=np.float64).reshape(-1, 6)
+    return features(journeys[:, 0].astype(np.int64),
+                    day_of_week(journeys[:, 1]), *journeys[:, 2:].T)
+
+
+def features(rid, days, public_departure, actual_departure, public_arrival,
+             actual_arrival):
+    """
+    Builds the dataset from arrays of journeys, with the day of the week of
+        each and times in seconds (NaN if unknown)
+    """
+    valid = ~(np.isnan(public_departure) | np.isnan(actual_departure) |
+              np.isnan(public_arrival) | np.isnan(actual_arrival) |
+              np.isnan(days))
+
+    actual_departure = actual_departure[valid]
+    # Times after midnight may have a day added, the features use the time
+    # of day
+    time_of_day = actual_departure % 86400
+    hours = (time_of_day // 3600).astype(np.int64)
+    minutes = ((time_of_day % 3600) // 60).astype(np.int64)
+    # Monday = 0, Sunday = 6
+    days = days[valid].astype(np.int64)
+
+    data = pd.DataFrame({
+        "rid": np.asarray(rid)[valid],
+        "time_dep": time_of_day,
+        "delay": actual_departure - public_departure[valid],
+        "day_of_week": days,
+        "weekend": (days > 4).astype(np.int64),
+        "day_segment": day_segment(hours),
+        "rush_hour": rush_hour(hours, minutes),
+        "arrival_time": actual_arrival[valid] - public_arrival[valid]
+    }, columns=DATASET_COLUMNS)
+    return data, int((~valid).sum())
@@ -0,0 +1,388 @@
+"""
+LookupTable.py
+
+Precomputes the delay model's predictions for each station pair over a grid
+of weekday x 5 minute departure bucket x delay minute, so serving a
+prediction is an array lookup rather than a walk through a random forest.
+Run from the repository root to build the tables, then report how far they
+are from the live models:
+
+    python DelayPrediction/LookupTable.py build
+    python DelayPrediction/LookupTable.py build NRCH:DISS IPSWICH:LIVST
+    python DelayPrediction/LookupTable.py report --samples 5000
+"""
+import sys, os
+currentdir = os.path.dirname(os.path.realpath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.append(parentdir)
+
+import argparse
+import json
+import threading
+import time
+
+import numpy as np
+
+from DelayPrediction.Features import day_segment, rush_hour
+from DelayPrediction.ModelStore import FEATURE_COLUMNS, FEATURE_VERSION, \
+    get_model_store
+
+LOOKUP_DIR = os.environ.get('AKOBOT_LOOKUP_DIR',
+                            os.path.join(currentdir, 'lookup'))
+# Set AKOBOT_DELAY_LOOKUP=0 to always ask the models
+ENABLED = os.environ.get('AKOBOT_DELAY_LOOKUP', '1') != '0'
+DEPARTURE_STEP = 300  # seconds
+DEPARTURE_BUCKETS = 86400 // DEPARTURE_STEP
+# Delays (in minutes) above this aren't in the tables, so go to the model
+MAX_DELAY = int(os.environ.get('AKOBOT_LOOKUP_MAX_DELAY', 60))
+
+
+def grid_features(max_delay=MAX_DELAY):
+    """
+    Returns
+    -------
+    (7 * DEPARTURE_BUCKETS * (max_delay + 1), len(FEATURE_COLUMNS)) array,
+        every weekday, departure bucket and delay minute in table order
+    """
+    days, buckets, delays = np.meshgrid(np.arange(7),
+                                        np.arange(DEPARTURE_BUCKETS),
+                                        np.arange(max_delay + 1),
+                                        indexing="ij")
+    departures = buckets.ravel() * DEPARTURE_STEP
+    hours = departures // 3600
+    minutes = (departures % 3600) // 60
+    return np.column_stack([departures, delays.ravel() * 60, days.ravel(),
+                            days.ravel() > 4, day_segment(hours),
+                            rush_hour(hours, minutes)]).astype(np.float64)
+
+
+def build_table(predict, max_delay=MAX_DELAY):
+    """
+    Parameters
+    ----------
+    predict - callable - predicts the delays (seconds) for an array of the
+        FEATURE_COLUMNS, e.g. a fitted model's predict
+    max_delay - int - the largest delay (minutes) in the table
+
+    Returns
+    -------
+    (7, DEPARTURE_BUCKETS, max_delay + 1) int16 array of delays in whole
+        seconds, indexed by weekday, departure bucket and delay minute
+    """
+    predictions = np.asarray(predict(grid_features(max_delay)))
+    predictions = np.clip(np.rint(predictions), np.iinfo(np.int16).min,
+                          np.iinfo(np.int16).max)
+    return predictions.astype(np.int16).reshape(7, DEPARTURE_BUCKETS,
+                                                max_delay + 1)
+
+
+class LookupTable:
+    def __init__(self, lookup_dir=LOOKUP_DIR, model_store=None):
+        """
+        The precomputed predictions for each station pair, memory mapped
+        from lookup_dir. A pair's table is only used while the model it was
+        built from is still the current one in the model store, which is
+        checked again whenever either manifest is replaced (e.g. by
+        Refresh.py in another process).
+
+        Parameters
+        ----------
+        lookup_dir: str
+            Directory the tables and their manifests are saved in
+        model_store: ModelStore
+            Where the models the tables are built from are kept
+            default: get_model_store()
+        """
+        self.lookup_dir = lookup_dir
+        self.model_store = model_store or get_model_store()
+        self.tables = {}
+        self.lock = threading.Lock()
+
+    def manifest_path(self, pair):
+        return os.path.join(self.lookup_dir, "{}_{}.json".format(*pair))
+
+    def manifest_stamp(self, pair, model_key):
+        """
+        Identifies the current versions of the pair's table manifest and the
+        model manifest for model_key. Both are replaced rather than written
+        in place, so a new inode or modification time means a new version.
+        """
+        stamp = []
+        for path in [self.manifest_path(pair),
+                     self.model_store.manifest_path(model_key)]:
+            try:
+                stat = os.stat(path)
+                stamp.append((stat.st_ino, stat.st_mtime_ns))
+            except OSError:
+                stamp.append(None)
+        return tuple(model_key), tuple(stamp)
+
+    def model_file(self, model_key):
+        """The file of the current model for model_key, None if untrained"""
+        manifest = self.model_store.read_manifest(model_key)
+        return manifest["file"] if manifest else None
+
+    def save(self, pair, table, model_key):
+        """
+        Saves the pair's table, built from the current model for model_key
+
+        Parameters
+        ----------
+        pair - tuple - (departure station, arrival station) codes
+        table - array from build_table
+        model_key - tuple - the model store key of the model it was built
+            from, the pair itself or Corridor.CORRIDOR_KEY
+        """
+        os.makedirs(self.lookup_dir, exist_ok=True)
+        file_name = "{}_{}_{}_{}.npy".format(pair[0], pair[1],
+                                             time.strftime("%Y%m%d%H%M%S"),
+                                             os.getpid())
+        path = os.path.join(self.lookup_dir, file_name)
+        with open(path + ".tmp", "wb") as table_file:
+            np.save(table_file, table)
+        os.replace(path + ".tmp", path)
+
+        manifest = {"file": file_name, "pair": list(pair),
+                    "model_key": list(model_key),
+                    "model_file": self.model_file(model_key),
+                    "feature_version": FEATURE_VERSION,
+                    "max_delay": table.shape[2] - 1,
+                    "built_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        with self.lock:
+            old_manifest = {}
+            try:
+                with open(self.manifest_path(pair)) as manifest_file:
+                    old_manifest = json.load(manifest_file)
+            except (OSError, ValueError):
+                pass
+            with open(self.manifest_path(pair) + ".tmp", "w") as manifest_file:
+                json.dump(manifest, manifest_file)
+            os.replace(self.manifest_path(pair) + ".tmp",
+                       self.manifest_path(pair))
+            self.tables.pop(pair, None)
+            if old_manifest.get("file") not in [None, file_name]:
+                try:
+                    os.remove(os.path.join(self.lookup_dir,
+                                           old_manifest["file"]))
+                except OSError:
+                    pass
+
+    def load(self, pair, model_key):
+        """
+        Gets the pair's table from memory or, failing that, from disk
+
+        Parameters
+        ----------
+        pair - tuple - (departure station, arrival station) codes
+        model_key - tuple - as save
+
+        Returns
+        -------
+        The read only table or None if there isn't one built from the
+        current model for model_key
+        """
+        stamp = self.manifest_stamp(pair, model_key)
+        cached = self.tables.get(pair)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        with self.lock:
+            table = None
+            try:
+                with open(self.manifest_path(pair)) as manifest_file:
+                    manifest = json.load(manifest_file)
+                if (manifest.get("feature_version") == FEATURE_VERSION
+                        and manifest.get("model_key") == list(model_key)
+                        and manifest.get("model_file") is not None
+                        and manifest.get("model_file") ==
+                        self.model_file(model_key)):
+                    table = np.load(os.path.join(self.lookup_dir,
+                                                 manifest["file"]),
+                                    mmap_mode="r")
+            except (OSError, ValueError):
+                pass
+            # Remembered even if missing so every prediction doesn't look
+            # for it again, until either manifest changes
+            self.tables[pair] = (stamp, table)
+            return table
+
+    def predict(self, pair, model_key, features, interpolate=True):
+        """
+        Looks up the delays for journeys from pair
+
+        Parameters
+        ----------
+        pair - tuple - (departure station, arrival station) codes
+        model_key - tuple - as save
+        features - (rows, len(FEATURE_COLUMNS)) array, the delays must be
+            whole minutes to be in the table
+        interpolate - bool - interpolate linearly between the departure
+            buckets either side, rather than taking the nearest
+
+        Returns
+        -------
+        array of delays (seconds), NaN for rows not in the table (or all of
+            them if the pair hasn't got one)
+        """
+        features = np.asarray(features, dtype=np.float64)
+        predictions = np.full(len(features), np.nan)
+        table = self.load(pair, model_key)
+        if table is None or not len(features):
+            return predictions
+
+        delays = features[:, 1] / 60
+        days = features[:, 2]
+        found = ((delays >= 0) & (delays < table.shape[2]) &
+                 (delays == np.round(delays)) & (days >= 0) & (days < 7) &
+                 (features[:, 0] >= 0))
+        delays = delays[found].astype(np.intp)
+        days = days[found].astype(np.intp)
+        buckets = (features[found, 0] % 86400) / DEPARTURE_STEP
+        # Past the last bucket of a day is the first bucket of the next
+        if interpolate:
+            before = np.floor(buckets).astype(np.intp)
+            after = before + 1
+            weight = buckets - before
+            after_days = np.where(after == DEPARTURE_BUCKETS, (days + 1) % 7,
+                                  days)
+            after %= DEPARTURE_BUCKETS
+            predictions[found] = (
+                (1 - weight) * table[days, before, delays] +
+                weight * table[after_days, after, delays])
+        else:
+            nearest = np.rint(buckets).astype(np.intp)
+            days = np.where(nearest == DEPARTURE_BUCKETS, (days + 1) % 7, days)
+            nearest %= DEPARTURE_BUCKETS
+            predictions[found] = table[days, nearest, delays]
+        return predictions
+
+
+_lookup_table = None
+_lookup_table_lock = threading.Lock()
+
+
+def get_lookup_table():
+    """
+    Returns
+    -------
+    The LookupTable shared by every Predictions instance in this process
+    """
+    global _lookup_table
+    if _lookup_table is None:
+        with _lookup_table_lock:
+            if _lookup_table is None:
+                _lookup_table = LookupTable()
+    return _lookup_table
+
+
+def parse_pairs(pairs):
+    from DelayPrediction.Corridor import CORRIDOR
+    if not pairs:
+        return [(a, b) for a in CORRIDOR for b in CORRIDOR if a != b]
+    return [tuple(pair.upper().split(":")) for pair in pairs]
+
+
+def build(args):
+    from DelayPrediction.newPrediction import Predictions
+    predictions = Predictions()
+    lookup_table = get_lookup_table()
+    for pair in parse_pairs(args.pairs):
+        start = time.perf_counter()
+        try:
+            model = predictions.model_for(pair)
+            table = build_table(
+                lambda x: model.predict(predictions.model_inputs(pair, x)),
+                args.max_delay)
+        except Exception as e:
+            print("{}-{}: skipped, {}".format(pair[0], pair[1], e))
+            continue
+        lookup_table.save(pair, table, predictions.model_key(pair))
+        print("{}-{}: {} predictions, {:.0f} KB in {:.1f} s".format(
+            pair[0], pair[1], table.size, table.nbytes / 1024,
+            time.perf_counter() - start))
+
+
+def report(args):
+    from DelayPrediction.newPrediction import Predictions
+    predictions = Predictions()
+    lookup_table = get_lookup_table()
+    random = np.random.default_rng(args.seed)
+    print("{:<18}{:>9}{:>11}{:>11}{:>11}{:>11}{:>11}".format(
+        "pair", "samples", "mae", "p95", "max", "nearest", "speedup"))
+    errors = {"interpolated": [], "nearest": []}
+    timings = {"model": 0.0, "table": 0.0}
+    for pair in parse_pairs(args.pairs):
+        model_key = predictions.model_key(pair)
+        table = lookup_table.load(pair, model_key)
+        if table is None:
+            continue
+        minutes = random.integers(0, 1440, args.samples)
+        hours = minutes // 60
+        features = np.column_stack([
+            minutes * 60,
+            random.integers(0, table.shape[2], args.samples) * 60,
+            random.integers(0, 7, args.samples)]).astype(np.float64)
+        features = np.column_stack([features, features[:, 2] > 4,
+                                    day_segment(hours),
+                                    rush_hour(hours, minutes % 60)])
+
+        model = predictions.model_for(pair)
+        start = time.perf_counter()
+        live = model.predict(predictions.model_inputs(pair, features))
+        model_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        interpolated = lookup_table.predict(pair, model_key, features)
+        table_seconds = time.perf_counter() - start
+        nearest = lookup_table.predict(pair, model_key, features,
+                                       interpolate=False)
+
+        error = np.abs(interpolated - live)
+        errors["interpolated"].append(error)
+        errors["nearest"].append(np.abs(nearest - live))
+        timings["model"] += model_seconds
+        timings["table"] += table_seconds
+        print("{:<18}{:>9}{:>11.1f}{:>11.1f}{:>11.1f}{:>11.1f}"
+              "{:>10.0f}x".format(
+                  "{}-{}".format(*pair), len(error), error.mean(),
+                  np.percentile(error, 95), error.max(),
+                  errors["nearest"][-1].mean(),
+                  model_seconds / table_seconds))
+
+    if not errors["interpolated"]:
+        print("No lookup tables built from the current models")
+        return
+    for name, error in errors.items():
+        error = np.concatenate(error)
+        print("{:<13} mae {:7.1f} s  p95 {:7.1f} s  max {:7.1f} s".format(
+            name, error.mean(), np.percentile(error, 95), error.max()))
+    print("model {:.1f} ms, table {:.1f} ms for {} predictions".format(
+        timings["model"] * 1000, timings["table"] * 1000,
+        sum(len(error) for error in errors["nearest"])))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build delay lookup tables and check them against the "
+                    "models")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser(
+        "build", help="precompute the tables, training models as needed")
+    build_parser.add_argument("pairs", nargs="*",
+                              help="e.g. NRCH:DISS, default every pair on "
+                                   "the line")
+    build_parser.add_argument("--max-delay", type=int, default=MAX_DELAY,
+                              help="largest delay (minutes) in the tables")
+    build_parser.set_defaults(run=build)
+    report_parser = subparsers.add_parser(
+        "report", help="compare the tables with the models they were built "
+                       "from at random times")
+    report_parser.add_argument("pairs", nargs="*")
+    report_parser.add_argument("--samples", type=int, default=2000,
+                               help="per pair")
+    report_parser.add_argument("--seed", type=int, default=0)
+    report_parser.set_defaults(run=report)
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,412 @@
+import sys, os
+currentdir = os.path.dirname(os.path.realpath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.append(parentdir)
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import joblib
+import numpy as np
+
+from DelayPrediction.CompactForest import compact, is_compact
+from DelayPrediction.ModelZoo import CANDIDATES, DEFAULT_CANDIDATE, \
+    model_bytes, read_results, select
+
+# Bump whenever the features passed to the models change so models trained on
+# the old features are never loaded
+# 2 - models are fitted on plain arrays rather than DataFrames
+FEATURE_VERSION = 2
+FEATURE_COLUMNS = ["time_dep", "delay", "day_of_week", "weekend",
+                   "day_segment", "rush_hour"]
+MODEL_DIR = os.environ.get('AKOBOT_MODEL_DIR',
+                           os.path.join(currentdir, 'models'))
+# Written by DelayPrediction/ModelZoo.py
+ZOO_RESULTS = os.path.join(MODEL_DIR, 'zoo.json')
+# The most memory (MB) the models held in memory may take, the least
+# recently used are dropped beyond it
+MODEL_CACHE_MB = float(os.environ.get('AKOBOT_MODEL_CACHE_MB', 512))
+# Hold forests in memory as CompactForests, optionally cut off at a depth
+COMPACT_MODELS = os.environ.get('AKOBOT_COMPACT_MODELS', '0') == '1'
+COMPACT_MAX_DEPTH = int(os.environ['AKOBOT_COMPACT_MAX_DEPTH']) \
+    if os.environ.get('AKOBOT_COMPACT_MAX_DEPTH') else None
+
+
+def default_estimator():
+    """
+    Returns
+    -------
+    A new estimator of the kind the model zoo picked as the most accurate
+    within the latency and memory budgets (preferring those Refresh.py can
+    update, see ModelZoo.REFRESHABLE), a random forest until the zoo has
+    been run
+    """
+    results = read_results(ZOO_RESULTS)
+    return CANDIDATES[select(results) if results else DEFAULT_CANDIDATE]()
+
+
+def estimator_name(model):
+    """
+    Describes the kind of estimator model is, with each setting that isn't
+    the default, e.g. "RandomForestRegressor(max_depth=10)"
+    """
+    if not hasattr(model, "get_params") and hasattr(model, "estimator"):
+        # e.g. Corridor.CorridorModel
+        return "{}({})".format(type(model).__name__,
+                               estimator_name(model.estimator))
+    return " ".join(repr(model).split())
+
+
+def model_nbytes(model, path=None):
+    """
+    The memory model takes, exact for a CompactForest, otherwise the size
+    of its file at path (or of model saved) as an estimate
+    """
+    if is_compact(model):
+        return getattr(model, "estimator", model).nbytes
+    if path is not None and os.path.exists(path):
+        return os.path.getsize(path)
+    return model_bytes(model)
+
+
+class ModelStore:
+    def __init__(self, model_dir=MODEL_DIR,
+                 estimator_factory=default_estimator,
+                 max_bytes=MODEL_CACHE_MB * 2 ** 20,
+                 compact_models=COMPACT_MODELS,
+                 compact_max_depth=COMPACT_MAX_DEPTH):
+        """
+        Trains the delay model for each station pair once, saves it to disk
+        and keeps the most recently used models in memory so they can be
+        reused by every prediction
+
+        Parameters
+        ----------
+        model_dir: str
+            Directory the models and their manifests are saved in
+        estimator_factory: callable
+            Returns a new, unfitted estimator
+        max_bytes: int
+            The most memory the models held in memory may take, the least
+            recently used are dropped beyond it (the newest is always kept)
+        compact_models: bool
+            Hold forests as CompactForests, the full models stay on disk
+        compact_max_depth: int
+            The depth to cut compacted trees off at, None to keep them whole
+        """
+        self.model_dir = model_dir
+        self.estimator_factory = estimator_factory
+        self.max_bytes = max_bytes
+        self.compact_models = compact_models
+        self.compact_max_depth = compact_max_depth
+        # Least recently used first
+        self.models = OrderedDict()
+        self.model_bytes = {}
+        self.manifest_stamps = {}
+        # A lock per pair, held while it's loaded from disk or trained
+        self.loading = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def data_hash(x_data, y_data, previous=None):
+        """
+        Hashes the training data and feature version, so a model is only
+        retrained when either changes
+
+        Parameters
+        ----------
+        x_data - DataFrame/array - the model inputs
+        y_data - array - the model outputs
+        previous - str - the data_hash of the journeys before these, to hash
+            journeys added to a model's data without hashing it all again
+
+        Returns
+        -------
+        Hex digest identifying the training data
+        """
+        digest = hashlib.sha1(str(FEATURE_VERSION).encode())
+        if previous is not None:
+            digest.update(previous.encode())
+        digest.update(np.ascontiguousarray(x_data, dtype=np.float64).tobytes())
+        digest.update(np.ascontiguousarray(y_data, dtype=np.float64).tobytes())
+        return digest.hexdigest()
+
+    def manifest_path(self, pair):
+        return os.path.join(self.model_dir, "{}_{}.json".format(*pair))
+
+    def model_path(self, pair, data_hash, model):
+        """
+        The file for pair's model trained on data_hash, which is different
+        for each kind of estimator (see estimator_name) so a model of
+        another kind is never loaded in its place
+        """
+        estimator = hashlib.sha1(estimator_name(model).encode()).hexdigest()
+        return os.path.join(self.model_dir,
+                            "{}_{}_{}_{}.joblib".format(pair[0], pair[1],
+                                                        data_hash[:16],
+                                                        estimator[:8]))
+
+    def read_manifest(self, pair):
+        """
+        Returns
+        -------
+        The manifest for the pair's current model or None if there isn't a
+        model trained on the current feature version
+        """
+        try:
+            with open(self.manifest_path(pair)) as manifest_file:
+                manifest = json.load(manifest_file)
+        except (OSError, ValueError):
+            return None
+        if manifest.get("feature_version") != FEATURE_VERSION:
+            return None
+        return manifest
+
+    def load(self, pair):
+        """
+        Gets the model for pair from memory or, failing that, from disk
+
+        Parameters
+        ----------
+        pair - tuple - (departure station, arrival station) codes
+
+        Returns
+        -------
+        The fitted model or None if one hasn't been trained
+        """
+        # A model replaced on disk (e.g. by Refresh.py in another process)
+        # has a new manifest, so the one in memory is only used while the
+        # manifest is the one it was loaded with
+        stamp = self.manifest_stamp(pair)
+        model = self.cached(pair, stamp)
+        if model is not None:
+            return model
+        # Models are read and compacted without holding self.lock so other
+        # pairs are served meanwhile. Only one thread loads each pair, the
+        # rest wait for it.
+        with self.pair_lock(pair):
+            model = self.cached(pair, stamp)
+            if model is not None:
+                return model
+            with self.lock:
+                self.misses += 1
+            manifest = self.read_manifest(pair)
+            if manifest is None:
+                return None
+            path = os.path.join(self.model_dir, manifest["file"])
+            try:
+                model = joblib.load(path)
+            except OSError:
+                return None
+            return self.cache(pair, model, path, stamp)
+
+    def pair_lock(self, pair):
+        """
+        Returns
+        -------
+        The lock held while the pair's model is loaded or trained, so only
+        one thread does either
+        """
+        with self.lock:
+            return self.loading.setdefault(pair, threading.RLock())
+
+    def cached(self, pair, stamp):
+        """
+        Returns
+        -------
+        The pair's model in memory if it was loaded with the manifest_stamp
+        stamp (a cache hit), otherwise None
+        """
+        with self.lock:
+            model = self.models.get(pair)
+            if model is None or self.manifest_stamps.get(pair) != stamp:
+                return None
+            self.hits += 1
+            self.models.move_to_end(pair)
+            return model
+
+    def manifest_stamp(self, pair):
+        """
+        Identifies the current version of the pair's manifest, which is
+        replaced rather than written in place, None if there isn't one
+        """
+        try:
+            stat = os.stat(self.manifest_path(pair))
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def read_model(self, pair):
+        """
+        Reads the pair's full model from disk, leaving the models in memory
+        alone. For updating a model, which a CompactForest can't be.
+
+        Returns
+        -------
+        The fitted model or None if one hasn't been trained
+        """
+        manifest = self.read_manifest(pair)
+        if manifest is None:
+            return None
+        try:
+            return joblib.load(os.path.join(self.model_dir, manifest["file"]))
+        except OSError:
+            return None
+
+    def cache(self, pair, model, path=None, stamp=None):
+        """
+        Holds model in memory as the pair's model, compacted if the store
+        compacts models, dropping the least recently used models until they
+        all fit in max_bytes. stamp is the manifest_stamp it was loaded
+        with.
+
+        Returns
+        -------
+        The model held
+        """
+        if self.compact_models:
+            model = compact(model, self.compact_max_depth)
+        nbytes = model_nbytes(model, path)
+        with self.lock:
+            self.models.pop(pair, None)
+            self.models[pair] = model
+            self.model_bytes[pair] = nbytes
+            self.manifest_stamps[pair] = stamp
+            while (len(self.models) > 1 and
+                   sum(self.model_bytes.values()) > self.max_bytes):
+                evicted, _ = self.models.popitem(last=False)
+                del self.model_bytes[evicted]
+                del self.manifest_stamps[evicted]
+                self.evictions += 1
+        return model
+
+    def train(self, pair, x_data, y_data, estimator_factory=None):
+        """
+        Fits and saves the model for pair, unless a model of the same kind
+        has already been trained on exactly this data in which case that one
+        is loaded
+
+        Parameters
+        ----------
+        pair - tuple - (departure station, arrival station) codes
+        x_data - DataFrame/array - the model inputs
+        y_data - array - the model outputs
+        estimator_factory - callable - returns the unfitted model
+            default: the store's estimator_factory
+
+        Returns
+        -------
+        The fitted model, as held in memory
+        """
+        data_hash = self.data_hash(x_data, y_data)
+        model = (estimator_factory or self.estimator_factory)()
+        path = self.model_path(pair, data_hash, model)
+        if os.path.exists(path):
+            model = joblib.load(path)
+        else:
+            model.fit(x_data, y_data)
+        return self.save(pair, model, data_hash, len(y_data))
+
+    def save(self, pair, model, data_hash, rows, overwrite=False):
+        """
+        Saves model as the pair's current model
+
+        Parameters
+        ----------
+        pair - tuple - (departure station, arrival station) codes
+        model - the fitted model
+        data_hash - str - data_hash of the data it was trained on
+        rows - int - the number of journeys it was trained on
+        overwrite - bool - write model even if a model of the same kind has
+            already been saved for this data, e.g. when retraining
+
+        Returns
+        -------
+        model, as held in memory
+        """
+        path = self.model_path(pair, data_hash, model)
+        if overwrite or not os.path.exists(path):
+            os.makedirs(self.model_dir, exist_ok=True)
+            # Write then rename so other processes never load half a model
+            joblib.dump(model, path + ".tmp")
+            os.replace(path + ".tmp", path)
+        manifest = {"pair": list(pair),
+                    "feature_version": FEATURE_VERSION,
+                    "data_hash": data_hash,
+                    "rows": rows,
+                    "file": os.path.basename(path),
+                    "estimator": estimator_name(model),
+                    "trained_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        os.makedirs(self.model_dir, exist_ok=True)
+        with open(self.manifest_path(pair) + ".tmp", "w") as manifest_file:
+            json.dump(manifest, manifest_file)
+        os.replace(self.manifest_path(pair) + ".tmp", self.manifest_path(pair))
+        return self.cache(pair, model, path, self.manifest_stamp(pair))
+
+    def get(self, pair, training_data, estimator_factory=None):
+        """
+        Gets the model for pair, training it if it hasn't been trained yet
+
+        Parameters
+        ----------
+        pair - tuple - (departure station, arrival station) codes
+        training_data - callable - returns (x_data, y_data) to train on,
+            only called if the model needs training
+        estimator_factory - callable - as train
+
+        Returns
+        -------
+        The fitted model
+        """
+        # Requests for a pair that isn't trained yet wait for the first one
+        # to train it rather than training it too
+        with self.pair_lock(pair):
+            model = self.load(pair)
+            if model is None:
+                model = self.train(pair, *training_data(),
+                                   estimator_factory=estimator_factory)
+        return model
+
+    def stats(self):
+        """
+        Returns
+        -------
+        dict of the memory budget, the memory the models take, the cache
+        hits, misses and evictions so far, and each model held in memory
+        with its size, most recently used first
+        """
+        with self.lock:
+            return {"max_bytes": int(self.max_bytes),
+                    "bytes": sum(self.model_bytes.values()),
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "evictions": self.evictions,
+                    "models": [{"pair": "{}-{}".format(*pair),
+                                "bytes": self.model_bytes[pair],
+                                "compact": is_compact(model)}
+                               for pair, model in
+                               reversed(self.models.items())]}
+
+
+_model_store = None
+_model_store_lock = threading.Lock()
+
+
+def get_model_store():
+    """
+    Returns
+    -------
+    The ModelStore shared by every Predictions instance in this process
+    """
+    global _model_store
+    if _model_store is None:
+        with _model_store_lock:
+            if _model_store is None:
+                _model_store = ModelStore()
+    return _model_store
@@ -0,0 +1,266 @@
+"""
+ModelZoo.py
+
+The estimators the delay models can be trained with, and how each does on
+the real journeys: fit time, single journey predict latency, size and
+error. The results are saved next to the models and the most accurate
+estimator within the latency and memory budgets is used for every model
+trained after that (see ModelStore.default_estimator). Run from the
+repository root:
+
+    python DelayPrediction/ModelZoo.py
+    python DelayPrediction/ModelZoo.py NRCH:DISS IPSWICH:LIVST --candidates \
+        random_forest shallow_forest hist_gradient_boosting
+"""
+import sys, os
+currentdir = os.path.dirname(os.path.realpath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.append(parentdir)
+
+import argparse
+import io
+import json
+import time
+
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.neighbors import KNeighborsRegressor
+from sklearn.neural_network import MLPRegressor
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.svm import LinearSVR
+try:
+    from sklearn.ensemble import HistGradientBoostingRegressor
+except ImportError:
+    # Still experimental before scikit-learn 1.0
+    from sklearn.experimental import enable_hist_gradient_boosting  # noqa
+    from sklearn.ensemble import HistGradientBoostingRegressor
+
+# Each candidate returns a new, unfitted estimator
+CANDIDATES = {
+    "random_forest": lambda: RandomForestRegressor(n_estimators=100),
+    "shallow_forest": lambda: RandomForestRegressor(
+        n_estimators=50, max_depth=10, min_samples_leaf=5),
+    "hist_gradient_boosting": lambda: HistGradientBoostingRegressor(),
+    "nearest_neighbour": lambda: KNeighborsRegressor(n_neighbors=1),
+    "knn": lambda: make_pipeline(StandardScaler(),
+                                 KNeighborsRegressor(n_neighbors=10)),
+    "linear_svm": lambda: make_pipeline(StandardScaler(),
+                                        LinearSVR(max_iter=20000)),
+    "mlp": lambda: make_pipeline(StandardScaler(), MLPRegressor(
+        hidden_layer_sizes=(32, 16, 8), max_iter=200, early_stopping=True,
+        random_state=1)),
+}
+# Used until the zoo has been run, and whenever nothing fits the budgets
+DEFAULT_CANDIDATE = "random_forest"
+# Budgets for the 99th percentile time to predict one journey and for the
+# size of one model
+MAX_PREDICT_MS = float(os.environ.get('AKOBOT_MAX_PREDICT_MS', 50))
+MAX_MODEL_MB = float(os.environ.get('AKOBOT_MAX_MODEL_MB', 50))
+# The candidates Refresh.py can update with just the new journeys (by
+# growing more trees) and ModelStore can hold as CompactForests. Any other
+# candidate is refitted on a pair's whole history whenever the pair has new
+# journeys and is held in memory as it is. AKOBOT_PREFER_REFRESHABLE=1
+# serves the most accurate of these within the budgets even if another
+# candidate is more accurate, trading accuracy for cheaper refreshes.
+REFRESHABLE = ["random_forest", "shallow_forest"]
+PREFER_REFRESHABLE = os.environ.get('AKOBOT_PREFER_REFRESHABLE', '0') == '1'
+
+
+def model_bytes(model):
+    """The size of model once saved"""
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer)
+    return buffer.tell()
+
+
+def evaluate(factory, x_train, y_train, x_test, y_test, latency_samples=200,
+             seed=0):
+    """
+    Fits one candidate and measures it
+
+    Parameters
+    ----------
+    factory - callable - returns the unfitted estimator
+    x_train, y_train - arrays - the journeys to fit
+    x_test, y_test - arrays - the journeys to measure the error on
+    latency_samples - int - the number of single journey predictions timed
+    seed - int - picks the journeys that are timed
+
+    Returns
+    -------
+    dict of fit_seconds, predict_p50_ms, predict_p99_ms, model_bytes, the
+        test rows and their squared and absolute errors summed, and how
+        many were within a minute
+    """
+    model = factory()
+    start = time.perf_counter()
+    model.fit(x_train, y_train)
+    fit_seconds = time.perf_counter() - start
+
+    errors = model.predict(x_test) - y_test
+    latencies = []
+    rows = np.random.default_rng(seed).integers(0, len(x_test),
+                                                latency_samples)
+    for row in rows:
+        start = time.perf_counter()
+        model.predict(x_test[row:row + 1])
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {"fit_seconds": fit_seconds,
+            "predict_p50_ms": float(np.percentile(latencies, 50)),
+            "predict_p99_ms": float(np.percentile(latencies, 99)),
+            "model_bytes": model_bytes(model),
+            "rows": len(errors),
+            "squared_error": float((errors ** 2).sum()),
+            "absolute_error": float(np.abs(errors).sum()),
+            "within_60s": int((np.abs(errors) <= 60).sum())}
+
+
+def summarise(name, evaluations):
+    """
+    Combines a candidate's evaluations on several pairs. Latency and size
+    are the worst seen, as every pair's model has to fit the budgets.
+    """
+    rows = sum(evaluation["rows"] for evaluation in evaluations)
+    return {"name": name,
+            "pairs": len(evaluations),
+            "fit_seconds": sum(evaluation["fit_seconds"]
+                               for evaluation in evaluations),
+            "predict_p50_ms": float(np.median(
+                [evaluation["predict_p50_ms"] for evaluation in evaluations])),
+            "predict_p99_ms": max(evaluation["predict_p99_ms"]
+                                  for evaluation in evaluations),
+            "model_bytes": max(evaluation["model_bytes"]
+                               for evaluation in evaluations),
+            "rmse": float(np.sqrt(sum(evaluation["squared_error"]
+                                      for evaluation in evaluations) / rows)),
+            "mae": sum(evaluation["absolute_error"]
+                       for evaluation in evaluations) / rows,
+            "within_60s": 100 * sum(evaluation["within_60s"]
+                                    for evaluation in evaluations) / rows}
+
+
+def within_budgets(results, max_predict_ms=MAX_PREDICT_MS,
+                   max_model_mb=MAX_MODEL_MB):
+    """
+    Returns
+    -------
+    The results (from summarise) of the candidates whose predict_p99_ms and
+        model_bytes are within the budgets
+    """
+    return [result for result in results
+            if result["name"] in CANDIDATES and
+            result["predict_p99_ms"] <= max_predict_ms and
+            result["model_bytes"] <= max_model_mb * 2 ** 20]
+
+
+def select(results, max_predict_ms=MAX_PREDICT_MS, max_model_mb=MAX_MODEL_MB,
+           prefer_refreshable=PREFER_REFRESHABLE):
+    """
+    Picks the candidate to serve
+
+    Parameters
+    ----------
+    results - list of dict - from summarise
+    max_predict_ms - float - budget for predict_p99_ms
+    max_model_mb - float - budget for model_bytes (in MB)
+    prefer_refreshable - bool - pick from the REFRESHABLE candidates if any
+        are within both budgets
+
+    Returns
+    -------
+    The name of the most accurate (lowest RMSE) candidate within both
+        budgets, or of the fastest if none are (see within_budgets)
+    """
+    results = [result for result in results
+               if result["name"] in CANDIDATES]
+    if not results:
+        return DEFAULT_CANDIDATE
+    within = within_budgets(results, max_predict_ms, max_model_mb)
+    if not within:
+        return min(results, key=lambda result: result["predict_p99_ms"])[
+            "name"]
+    refreshable = [result for result in within
+                   if result["name"] in REFRESHABLE]
+    if prefer_refreshable and refreshable:
+        within = refreshable
+    return min(within, key=lambda result: result["rmse"])["name"]
+
+
+def read_results(path):
+    """The results saved by the zoo at path, None if it hasn't been run"""
+    try:
+        with open(path) as results_file:
+            return json.load(results_file)["results"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the candidate delay model estimators and pick "
+                    "the one to serve")
+    parser.add_argument("pairs", nargs="*",
+                        default=["NRCH:DISS", "NRCH:LIVST", "IPSWICH:LIVST",
+                                 "CLCHSTR:CHLMSFD"],
+                        help="station pairs to measure on, e.g. NRCH:DISS")
+    parser.add_argument("--candidates", nargs="*",
+                        default=list(CANDIDATES), choices=list(CANDIDATES))
+    parser.add_argument("--test-fraction", type=float, default=0.2,
+                        help="latest journeys of each pair held out")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="don't save the results")
+    args = parser.parse_args()
+
+    from DelayPrediction.ModelStore import ZOO_RESULTS
+    from DelayPrediction.newPrediction import Predictions
+    predictions = Predictions()
+    evaluations = {name: [] for name in args.candidates}
+    for pair in [tuple(pair.upper().split(":")) for pair in args.pairs]:
+        predictions.departure_station, predictions.arrival_station = pair
+        x_data, y_data = predictions.training_data()
+        if len(y_data) < 10:
+            print("{}-{}: skipped, {} journeys".format(pair[0], pair[1],
+                                                       len(y_data)))
+            continue
+        # Journeys are in rid (so date) order, the latest are held out
+        split = int(len(y_data) * (1 - args.test_fraction))
+        for name in args.candidates:
+            evaluations[name].append(evaluate(
+                CANDIDATES[name], x_data[:split], y_data[:split],
+                x_data[split:], y_data[split:]))
+
+    results = [summarise(name, evaluation)
+               for name, evaluation in evaluations.items() if evaluation]
+    print("{:<24}{:>10}{:>10}{:>10}{:>10}{:>9}{:>9}{:>8}".format(
+        "candidate", "fit (s)", "p50 (ms)", "p99 (ms)", "size (MB)", "rmse",
+        "mae", "<=60s"))
+    for result in sorted(results, key=lambda result: result["rmse"]):
+        print("{:<24}{:>10.2f}{:>10.2f}{:>10.2f}{:>10.2f}{:>9.1f}{:>9.1f}"
+              "{:>7.1f}%".format(
+                  result["name"], result["fit_seconds"],
+                  result["predict_p50_ms"], result["predict_p99_ms"],
+                  result["model_bytes"] / 2 ** 20, result["rmse"],
+                  result["mae"], result["within_60s"]))
+    if results and not within_budgets(results):
+        print("\nNo delay model fits in {} ms and {} MB, using the "
+              "fastest".format(MAX_PREDICT_MS, MAX_MODEL_MB))
+    print("\nserving (p99 <= {} ms, <= {} MB{}): {}".format(
+        MAX_PREDICT_MS, MAX_MODEL_MB,
+        ", refreshable preferred" if PREFER_REFRESHABLE else "",
+        select(results)))
+
+    if not args.dry_run and results:
+        os.makedirs(os.path.dirname(ZOO_RESULTS), exist_ok=True)
+        with open(ZOO_RESULTS + ".tmp", "w") as results_file:
+            json.dump({"pairs": args.pairs, "results": results,
+                       "evaluated_at": time.strftime("%Y-%m-%dT%H:%M:%S")},
+                      results_file, indent=2)
+        os.replace(ZOO_RESULTS + ".tmp", ZOO_RESULTS)
+        print("saved to {}, retrain the models to use it (TrainAll.py "
+              "--retrain)".format(ZOO_RESULTS))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""
+Refresh.py
+
+Brings the saved training data and delay models up to date with journeys
+loaded since they were built (e.g. by Database/Ingest.py), without
+rebuilding them from the whole history. Each station pair's new journeys
+are appended to its saved training data and its random forest grows a few
+trees fitted to just those journeys. Pairs without new journeys are left
+alone. The corridor wide model (AKOBOT_DELAY_MODEL=corridor) isn't updated
+here, it is retrained on everything when next needed. Run from the
+repository root after loading a day's data:
+
+    python Database/Ingest.py data/2019-03-01/*.csv
+    python DelayPrediction/Refresh.py
+"""
+import sys, os
+currentdir = os.path.dirname(os.path.realpath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.append(parentdir)
+
+import argparse
+import math
+import time
+
+from DelayPrediction.Corridor import CORRIDOR
+from DelayPrediction.Features import build_features_from_running
+from DelayPrediction.LookupTable import build_table, get_lookup_table
+from DelayPrediction.ModelStore import FEATURE_COLUMNS
+
+# Forests stop growing at this many trees, the oldest are dropped first
+MAX_TREES = int(os.environ.get('AKOBOT_MAX_TREES', 300))
+# newPrediction.RunningQuery for just the trains loaded after a rowid of
+# main.Data, which are looked up by the primary key of main.Running
+NewRunningQuery = """
+    SELECT x.rid, x.service_date, x.ptd, x.dep_at, y.pta, y.arr_at
+    FROM main.Locations AS a
+        JOIN main.Running AS x ON x.location_id = a.id
+        JOIN main.Locations AS b
+        JOIN main.Running AS y ON y.location_id = b.id AND y.rid = x.rid
+    WHERE a.tpl = ? AND b.tpl = ?
+        AND x.rid IN (SELECT CAST(rid AS INTEGER) FROM main.Data
+                      WHERE rowid > ?)
+        AND x.ptd IS NOT NULL AND x.dep_at IS NOT NULL
+        AND y.pta IS NOT NULL AND y.arr_at IS NOT NULL
+    ORDER BY x.rid"""
+
+
+def warm_start(model, x_new, y_new, old_rows, max_trees=MAX_TREES):
+    """
+    Updates a fitted model with new journeys only
+
+    Random forests keep their trees and add new ones fitted to the new
+    journeys, in proportion to how many there are compared with the
+    journeys already seen. Models with partial_fit are passed the new
+    journeys.
+
+    Parameters
+    ----------
+    model - the fitted model
+    x_new, y_new - arrays - the new journeys' inputs and arrival delays
+    old_rows - int - the number of journeys the model has already seen
+    max_trees - int - the most trees a forest is allowed
+
+    Returns
+    -------
+    The updated model, or None if it can't be updated without refitting
+    """
+    if hasattr(model, "partial_fit"):
+        model.partial_fit(x_new, y_new)
+        return model
+    if not (hasattr(model, "warm_start") and hasattr(model, "estimators_")):
+        return None
+    trees = len(model.estimators_)
+    new_trees = min(max(math.ceil(trees * len(y_new) / max(old_rows, 1)), 1),
+                    trees)
+    model.set_params(warm_start=True, n_estimators=trees + new_trees)
+    model.fit(x_new, y_new)
+    model.set_params(warm_start=False)
+    if len(model.estimators_) > max_trees:
+        model.estimators_ = model.estimators_[-max_trees:]
+        model.n_estimators = max_trees
+    return model
+
+
+def refresh(predictions=None, pairs=None):
+    """
+    Updates the saved training data, models and lookup tables of every
+    pair that has had journeys added since they were built
+
+    Parameters
+    ----------
+    predictions - newPrediction.Predictions - used for its database
+        connection and stores
+        default: a new Predictions
+    pairs - list of tuple - the (departure, arrival) codes to refresh
+        default: every pair on the line
+
+    Returns
+    -------
+    dict
+        The pairs that were updated, refitted from scratch or had no new
+        journeys, the number of new journeys and the time taken
+    """
+    if predictions is None:
+        from DelayPrediction.newPrediction import Predictions
+        predictions = Predictions()
+    if pairs is None:
+        pairs = [(a, b) for a in CORRIDOR for b in CORRIDOR if a != b]
+    start = time.perf_counter()
+    source_version = predictions.source_version()
+    feature_store = predictions.feature_store
+    model_store = predictions.model_store
+    lookup_table = get_lookup_table()
+    report = {"updated": [], "refitted": [], "unchanged": [], "journeys": 0}
+
+    for pair in pairs:
+        manifest = feature_store.read_manifest(pair)
+        # Pairs never built, or built before main.Data's rowid was part of
+        # the version, are built from everything when they're next needed
+        if (manifest is None or
+                manifest["source_version"] == source_version or
+                len(manifest["source_version"]) < 3):
+            continue
+        new_data, _ = build_features_from_running(
+            predictions.db_connection.send_query(
+                NewRunningQuery,
+                pair + (manifest["source_version"][2] or 0,)).fetchall())
+        if not len(new_data):
+            feature_store.set_source_version(pair, source_version)
+            report["unchanged"].append(pair)
+            continue
+        arrays = feature_store.append(pair, new_data, source_version)
+        report["journeys"] += len(new_data)
+        if arrays is None:
+            # The saved arrays couldn't be added to, e.g. they're in another
+            # layout or the disk is full, so the pair is built from scratch
+            print("Couldn't add to the saved data for {}-{}, rebuilding "
+                  "it".format(*pair))
+            predictions.departure_station, predictions.arrival_station = pair
+            x_data, y_data = predictions.training_data()
+        else:
+            x_data, y_data = arrays
+
+        # The full forest, the one held in memory may be compacted
+        model = model_store.read_model(pair)
+        model_manifest = model_store.read_manifest(pair)
+        if model is None or model_manifest is None:
+            continue
+        had_table = lookup_table.load(pair, pair) is not None
+        x_new = new_data[FEATURE_COLUMNS].values
+        y_new = new_data["arrival_time"].values
+        if arrays is not None:
+            model = warm_start(model, x_new, y_new, manifest["rows"])
+        if arrays is None or model is None:
+            model = model_store.train(pair, x_data, y_data)
+            report["refitted"].append(pair)
+        else:
+            # Only the new journeys are hashed, onto the old data's hash
+            model = model_store.save(
+                pair, model, model_store.data_hash(
+                    x_new, y_new, previous=model_manifest["data_hash"]),
+                len(y_data))
+            report["updated"].append(pair)
+        if had_table:
+            lookup_table.save(pair, build_table(model.predict), pair)
+
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Update the delay models with newly loaded journeys")
+    parser.add_argument("pairs", nargs="*",
+                        help="e.g. NRCH:DISS, default every pair on the line")
+    args = parser.parse_args()
+    pairs = [tuple(pair.upper().split(":")) for pair in args.pairs] or None
+
+    report = refresh(pairs=pairs)
+    print("new journeys: {}".format(report["journeys"]))
+    for name in ["updated", "refitted", "unchanged"]:
+        print("{:<13} {}".format(name + ":", " ".join(
+            "{}-{}".format(*pair) for pair in report[name]) or "-"))
+    print("time:         {:.2f} s".format(report["seconds"]))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,304 +1,201 @@
+"""
+TestPredictions.py
+
+Compares the delay model estimators (see DelayPrediction/ModelZoo.py) on
+each feature set with k-fold cross validation. Every model, feature set
+and fold is fitted in parallel with fixed seeds, and the results can be
+saved as JSON or CSV. Run from the repository root:
+
+    python DelayPrediction/TestPredictions.py
+    python DelayPrediction/TestPredictions.py norwich manningtree \
+        --models random_forest knn --feature-sets 4 5 --json results.json
+"""
 import sys, os
 currentdir = os.path.dirname(os.path.realpath(__file__))
 parentdir = os.path.dirname(currentdir)
 sys.path.append(parentdir)
 
-import numpy as np
-from sklearn import preprocessing, neighbors, svm
-from sklearn import metrics
-from sklearn.metrics import mean_squared_error, f1_score, accuracy_score
-from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
-from sklearn.neural_network import MLPRegressor, MLPClassifier
-import pandas as pd
+import argparse
 import csv
-from datetime import datetime, timedelta
-from Database.DatabaseConnector import DBConnection
-from difflib import SequenceMatcher, get_close_matches
-from DelayPrediction.newPrediction import Predictions
-
-class TestPredictions(Predictions):
-
-    def __init__(self):
-        super().__init__()
-
-    def prepare_datasets(self, x):
-        result = super().harvest_data()
-        data = []
-
-        for journey in range(len(result)):
-            if (result[journey][2] != '' and result[journey][3] != '' and 
-                    result[journey][5] != '' and result[journey][6] != ''):
-                rid = str(result[journey][0])
-                day_of_week = datetime(int(rid[:4]), int(rid[4:6]),
-                                        int(rid[6:8])).weekday()
-                hour_of_day = int(result[journey][3].split(":")[0])
-                minute_of_day = int(result[journey][3].split(":")[1])
-                weekend = super().is_weekend(day_of_week)
-                day_segment = super().check_day_segment(hour_of_day)
-                rush_hour = super().is_rush_hour(hour_of_day, minute_of_day)
-                try:
-                    time_dep = (datetime.strptime(result[journey][3], '%H:%M') -
-                                datetime(1900, 1, 1)).total_seconds()
-                except:
-                    print("Unable to get time_dep")
-                try:
-                    journey_delay = ((datetime.strptime(result[journey][3], '%H:%M') -
-                                datetime(1900, 1, 1)).total_seconds() -
-                                (datetime.strptime(result[journey][2], '%H:%M') -
-                                datetime(1900, 1, 1)).total_seconds())
-                except:
-                    print("Unable to get journey_delay")
-                try:
-                    time_arr = ((datetime.strptime(result[journey][6], '%H:%M') -
-                                    datetime(1900, 1, 1)).total_seconds() -
-                                    (datetime.strptime(result[journey][5], '%H:%M') -
-                                    datetime(1900, 1, 1)).total_seconds())
-                except:
-                    print("Unable to get  time_arrival")
-                if x == 2:
-                    data.append([rid, time_dep, journey_delay, day_of_week,  time_arr])
-                elif x == 3:
-                    data.append([rid, time_dep, journey_delay, day_of_week, weekend,
-                                    time_arr])
-                elif x == 4:
-                    data.append([rid, time_dep, journey_delay, day_of_week, weekend,
-                                     day_segment, time_arr])
-                elif x == 5:
-                    data.append([rid, time_dep, journey_delay, day_of_week, 
-                                weekend, day_segment, rush_hour,  time_arr])
-        return data
-
-    def predict_nn(self, data, num_x):
-        dep_time_s = (datetime.strptime(self.exp_dep, '%H:%M') - datetime(
-                            1900, 1, 1)).total_seconds()
-        delay_s = int(self.delay) * 60
-
-        if num_x == 2:
-            journeys = pd.DataFrame(data, columns=["rid", "time_dep", 
-                            "delay","day_of_week", "arrival_time"])
-        elif num_x == 3:
-            journeys = pd.DataFrame(data, columns=["rid", "time_dep", 
-                            "delay","day_of_week","weekend", "arrival_time"])
-        elif num_x == 4:
-            journeys = pd.DataFrame(data, columns=["rid", "time_dep", 
-                            "delay","day_of_week","weekend",
-                            "day_segment", "arrival_time"])
-        elif num_x == 5:
-            journeys = pd.DataFrame(data, columns=["rid", "time_dep", 
-                            "delay", "day_of_week","weekend", 
-                            "day_segment", "rush_hour", "arrival_time"])
-        
-
-        X = journeys.drop(['rid','arrival_time'], axis=1)
-        y = journeys['arrival_time'].values
-        
-        x_training_data, x_test_data, y_training_data, y_test_data = train_test_split(X, y, test_size = 0.3, random_state=5)
-        
-        clf = neighbors.NearestNeighbors(n_neighbors=1)
-        clf.fit(x_training_data)
-
-        counter = 0
-        i = 0
-        for row in x_test_data.iterrows():
-            time = row[1][0]
-            delay  = row[1][1]
-            if num_x == 2:
-                day_of_week = row[1][2]
-                predict = clf.kneighbors([[time, delay, day_of_week]])
-            if num_x == 3:
-                day_of_week = row[1][2]
-                weekend = row[1][3]
-                predict = clf.kneighbors([[time, delay, day_of_week, weekend]])
-            if num_x == 4:
-                day_of_week = row[1][2]
-                weekend = row[1][3]
-                day_segment = row[1][4]
-                predict = clf.kneighbors([[time, delay, day_of_week, weekend, day_segment]])
-            if num_x == 5:
-                day_of_week = row[1][2]
-                weekend = row[1][3]
-                day_segment = row[1][4]
-                rush_hour = row[1][5]
-                predict = clf.kneighbors([[time, delay, day_of_week, weekend, day_segment, rush_hour]])
-
-            predict_arrival = y_training_data[predict[1]][0][0]
-            p_time = x_training_data.iloc[predict[1][0][0]][0]
-            p_delay = x_training_data.iloc[predict[1][0][0]][1]
-            if abs(y_test_data[i] - predict_arrival ) <= 60:
-                counter += 1
-            i += 1
-
-        y_pred = clf.kneighbors(x_test_data)
-        print("NN accuracy w/ user input:", (counter / len(x_test_data) * 100))
-        # print("NN r2:", metrics.r2_score(y_test_data,y_pred) * 100)
-        # print("NN f1_score", f1_score(y_test_data, y_pred, average="weighted") * 100)
-        # print("NN MSE:", mean_squared_error(y_test_data, y_pred) / 60)
-
-    def predict_knn(self, data, num_x):
-        dep_time_s = (datetime.strptime(self.exp_dep, '%H:%M') - datetime(
-                            1900, 1, 1)).total_seconds()
-        delay_s = int(self.delay) * 60
+import json
+import time
 
-        if num_x == 2:
-            journeys = pd.DataFrame(data, columns=["rid", "time_dep", 
-                            "delay","day_of_week", "arrival_time"])
-        elif num_x == 3:
-            journeys = pd.DataFrame(data, columns=["rid", "time_dep", 
-                            "delay","day_of_week","weekend", "arrival_time"])
-        elif num_x == 4:
-            journeys = pd.DataFrame(data, columns=["rid", "time_dep", 
-                            "delay","day_of_week","weekend",
-                            "day_segment", "arrival_time"])
-        elif num_x == 5:
-            journeys = pd.DataFrame(data, columns=["rid", "time_dep", 
-                            "delay", "day_of_week","weekend", 
-                            "day_segment", "rush_hour", "arrival_time"])
-        
-
-        X = journeys.drop(['rid','arrival_time'], axis=1)
-        y = journeys['arrival_time'].values
-        
-        x_training_data, x_test_data, y_training_data, y_test_data = train_test_split(X, y, test_size = 0.3, random_state=5)
-        
-        clf = neighbors.KNeighborsRegressor(n_neighbors= 3)
-        clf.fit(x_training_data, y_training_data)
-
-        y_pred = clf.predict(x_test_data)
-        
-        print("KNN accuracy", accuracy_score(y_test_data, y_pred) * 100)
-        print("KNN r2:", metrics.r2_score(y_test_data,y_pred) * 100)
-        print("KNN f1_score", f1_score(y_test_data, y_pred, average="weighted") * 100)
-        print("KNN RMSE:", np.sqrt(mean_squared_error(y_test_data, y_pred)))
-
-
-   
-    def predict_svm(self, data, num_x):
-        dep_time_s = (datetime.strptime(self.exp_dep, '%H:%M') - datetime(
-                            1900, 1, 1)).total_seconds()
-        delay_s = int(self.delay) * 60
-        if num_x == 2:
-            journeys = pd.DataFrame(data, columns=["rid", "time_dep", 
-                            "delay","day_of_week", "arrival_time"])
-        elif num_x == 3:
-            journeys = pd.DataFrame(data, columns=["rid", "time_dep", 
-                            "delay","day_of_week","weekend", "arrival_time"])
-        elif num_x == 4:
-            journeys = pd.DataFrame(data, columns=["rid", "time_dep", 
-                            "delay","day_of_week","weekend",
-                            "day_segment", "arrival_time"])
-        elif num_x == 5:
-            journeys = pd.DataFrame(data, columns=["rid", "time_dep", 
-                            "delay", "day_of_week","weekend", 
-                            "day_segment", "rush_hour", "arrival_time"])
-    
-
-        X = journeys.drop(['rid','arrival_time'], axis=1)
-        y = journeys['arrival_time'].values
-        
-        x_training_data, x_test_data, y_training_data, y_test_data = train_test_split(X, y, test_size = 0.3, random_state=42)
-        
-        clf = svm.LinearSVC(max_iter=200000)
-        clf.fit(x_training_data, y_training_data)
-
-        y_pred = clf.predict(x_test_data)
-        print("SVM accuracy:", accuracy_score(y_test_data, y_pred)  *  100)
-        print("SVM r2:", metrics.r2_score(y_test_data,y_pred) * 100)
-        print("SVm f1_score", f1_score(y_test_data, y_pred, average="weighted") * 100)
-        print("SVM RMSE", np.sqrt(mean_squared_error(y_test_data, y_pred)))
-
-    def predict_rf(self, data, num_x):
-        dep_time_s = (datetime.strptime(self.exp_dep, '%H:%M') - datetime(
-                            1900, 1, 1)).total_seconds()
-        delay_s = int(self.delay) * 60
-        if num_x == 2:
-            journeys = pd.DataFrame(data, columns=["rid", "time_dep", 
-                            "delay","day_of_week", "arrival_time"])
-        elif num_x == 3:
-            journeys = pd.DataFrame(data, columns=["rid", "time_dep", 
-                            "delay","day_of_week","weekend", "arrival_time"])
-        elif num_x == 4:
-            journeys = pd.DataFrame(data, columns=["rid", "time_dep", 
-                            "delay","day_of_week","weekend",
-                            "day_segment", "arrival_time"])
-        elif num_x == 5:
-            journeys = pd.DataFrame(data, columns=["rid", "time_dep", 
-                            "delay", "day_of_week","weekend", 
-                            "day_segment", "rush_hour", "arrival_time"])
-
-        X = journeys.drop(['rid','arrival_time'], axis=1)
-        y = journeys['arrival_time'].values
-        
-        x_training_data, x_test_data, y_training_data, y_test_data = train_test_split(X, y, test_size = 0.3, random_state=5)
-        
-        clf = RandomForestClassifier(n_estimators = 100)
-        clf.fit(x_training_data, y_training_data)
-
-        y_pred = clf.predict(x_test_data)
-        print("RF acc_sc:", accuracy_score(y_test_data, y_pred) * 100)
-        print("RF r2:", metrics.r2_score(y_test_data,y_pred) * 100)
-        print("RF f1_score", f1_score(y_test_data, y_pred, average="weighted") * 100)
-        print("RF RMSE", np.sqrt(mean_squared_error(y_test_data, y_pred)))
-        
-        # print("KNN MSE  is :", ((mse_total / mse_counter) / 60))
-
-    def predict_mlp(self, data, num_x):
-        dep_time_s = (datetime.strptime(self.exp_dep, '%H:%M') - datetime(
-                            1900, 1, 1)).total_seconds()
-        delay_s = int(self.delay) * 60
-        if num_x == 2:
-            journeys = pd.DataFrame(data, columns=["rid", "time_dep", 
-                            "delay","day_of_week", "arrival_time"])
-        elif num_x == 3:
-            journeys = pd.DataFrame(data, columns=["rid", "time_dep", 
-                            "delay","day_of_week","weekend", "arrival_time"])
-        elif num_x == 4:
-            journeys = pd.DataFrame(data, columns=["rid", "time_dep", 
-                            "delay","day_of_week","weekend",
-                            "day_segment", "arrival_time"])
-        elif num_x == 5:
-            journeys = pd.DataFrame(data, columns=["rid", "time_dep", 
-                            "delay", "day_of_week","weekend", 
-                            "day_segment", "rush_hour", "arrival_time"])
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.model_selection import KFold
 
-        X = journeys.drop(['rid','arrival_time'], axis=1)
-        y = journeys['arrival_time'].values
-        
-        x_training_data, x_test_data, y_training_data, y_test_data = train_test_split(X, y, test_size = 0.3, random_state=5)
-        
-        clf = MLPClassifier(hidden_layer_sizes = (32,16,8), activation="relu", solver="adam", random_state=1, max_iter = 5000)
-        clf.fit(x_training_data, y_training_data.ravel())
+from DelayPrediction.ModelStore import FEATURE_COLUMNS
+from DelayPrediction.ModelZoo import CANDIDATES
+from DelayPrediction.newPrediction import Predictions
 
-        y_pred = clf.predict(x_test_data)
-        print("MLP acc_sc:", accuracy_score(y_test_data, y_pred) * 100)
-        print("MLP r2:", metrics.r2_score(y_test_data, y_pred) * 100)
-        print("MLP f1_score", f1_score(y_test_data, y_pred, average="weighted") * 100)
-        print("MLP RMSE:", np.sqrt(mean_squared_error(y_test_data, y_pred)))
+# The inputs of each feature set, numbered as before by how many there
+# are after time_dep
+FEATURE_SETS = {
+    2: ["time_dep", "delay", "day_of_week"],
+    3: ["time_dep", "delay", "day_of_week", "weekend"],
+    4: ["time_dep", "delay", "day_of_week", "weekend", "day_segment"],
+    5: ["time_dep", "delay", "day_of_week", "weekend", "day_segment",
+        "rush_hour"],
+}
+# The estimators compared before the model zoo
+MODELS = ["nearest_neighbour", "knn", "linear_svm", "random_forest", "mlp"]
+CSV_COLUMNS = ["model", "feature_set", "folds", "rows", "rmse", "rmse_std",
+               "mae", "within_60s", "r2", "fit_seconds", "predict_seconds"]
+
+
+def seeded(name, seed):
+    """A new estimator for candidate name, with every random_state set"""
+    model = CANDIDATES[name]()
+    model.set_params(**{param: seed for param in model.get_params()
+                        if param.endswith("random_state")})
+    return model
+
+
+def evaluate_fold(name, feature_set, x_data, y_data, train, test, seed):
+    """
+    Fits one model on one fold and predicts all of its test journeys at once
+
+    Returns
+    -------
+    dict of the fold's errors and timings
+    """
+    columns = [FEATURE_COLUMNS.index(column)
+               for column in FEATURE_SETS[feature_set]]
+    x_train = np.asarray(x_data[train][:, columns])
+    x_test = np.asarray(x_data[test][:, columns])
+    model = seeded(name, seed)
+    start = time.perf_counter()
+    model.fit(x_train, y_data[train])
+    fit_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    errors = model.predict(x_test) - y_data[test]
+    predict_seconds = time.perf_counter() - start
+    squared = float((errors ** 2).sum())
+    return {"model": name, "feature_set": feature_set, "rows": len(errors),
+            "rmse": float(np.sqrt(squared / len(errors))),
+            "mae": float(np.abs(errors).mean()),
+            "within_60s": float((np.abs(errors) <= 60).mean() * 100),
+            "r2": float(1 - squared / max(
+                ((y_data[test] - y_data[test].mean()) ** 2).sum(), 1e-9)),
+            "fit_seconds": fit_seconds, "predict_seconds": predict_seconds}
+
+
+def cross_validate(x_data, y_data, models=MODELS, feature_sets=FEATURE_SETS,
+                   folds=5, seed=5, n_jobs=-1):
+    """
+    Cross validates every model on every feature set
+
+    Parameters
+    ----------
+    x_data - (rows, len(FEATURE_COLUMNS)) array of the journeys
+    y_data - array of their arrival delays (seconds)
+    models - list of str - ModelZoo.CANDIDATES to compare
+    feature_sets - list of int - FEATURE_SETS to compare
+    folds - int - the number of folds
+    seed - int - seeds the folds and the models
+    n_jobs - int - processes fitting folds, -1 for one per CPU
+
+    Returns
+    -------
+    list of dict, one per model and feature set, with the mean of each
+        measure over the folds (and the RMSE's standard deviation)
+    """
+    splits = list(KFold(n_splits=folds, shuffle=True,
+                        random_state=seed).split(x_data))
+    # Memory mapped arrays are shared with the workers rather than copied
+    evaluations = Parallel(n_jobs=n_jobs)(
+        delayed(evaluate_fold)(name, feature_set, x_data, y_data, train,
+                               test, seed)
+        for name in models for feature_set in feature_sets
+        for train, test in splits)
+
+    results = []
+    for name in models:
+        for feature_set in feature_sets:
+            runs = [evaluation for evaluation in evaluations
+                    if evaluation["model"] == name and
+                    evaluation["feature_set"] == feature_set]
+            result = {"model": name, "feature_set": feature_set,
+                      "folds": len(runs),
+                      "rows": sum(run["rows"] for run in runs),
+                      "rmse_std": float(np.std([run["rmse"]
+                                                for run in runs]))}
+            for measure in ["rmse", "mae", "within_60s", "r2",
+                            "fit_seconds", "predict_seconds"]:
+                result[measure] = float(np.mean([run[measure]
+                                                 for run in runs]))
+            results.append(result)
+    return results
 
-    def run_tests(self):
-        depart = "22:00"
-        FROM = "Norwich"
-        TO = "Manningtree"
-        delay = 12
-        x = 5
 
-        print("Departing at:", depart)
-        print("Number of inputs", x)
+class TestPredictions(Predictions):
 
-        self.departure_station = super().station_finder(FROM)
-        self.arrival_station = super().station_finder(TO)
-        self.exp_dep = depart
-        self.delay = delay
-        hour_of_day = int(depart.split(":")[0])
-        minute_of_day = int(depart.split(":")[1])
-        self.segment_of_day = super().check_day_segment(hour_of_day)
-        self.rush_hour = super().is_rush_hour(hour_of_day, minute_of_day)
-        data = self.prepare_datasets(x)
-        # self.predict_nn(data, x)
-        # self.predict_knn(data, x)
-        self.predict_svm(data, x)
-        # self.predict_rf(data, x)
-        # self.predict_mlp(data, x)
+    def __init__(self):
+        super().__init__()
 
-test = TestPredictions()
-test.run_tests()
\ No newline at end of file
+    def run_tests(self, from_station="Norwich", to_station="Manningtree",
+                  models=MODELS, feature_sets=FEATURE_SETS, folds=5, seed=5,
+                  n_jobs=-1):
+        """
+        Cross validates the models on the journeys between two stations
+
+        Returns
+        -------
+        list of dict - as cross_validate
+        """
+        self.departure_station = self.station_code(from_station)
+        self.arrival_station = self.station_code(to_station)
+        x_data, y_data = self.training_data()
+        return cross_validate(x_data, y_data, models, feature_sets, folds,
+                              seed, n_jobs)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Cross validate the delay models on each feature set")
+    parser.add_argument("from_station", nargs="?", default="Norwich")
+    parser.add_argument("to_station", nargs="?", default="Manningtree")
+    parser.add_argument("--models", nargs="*", default=MODELS,
+                        choices=list(CANDIDATES))
+    parser.add_argument("--feature-sets", nargs="*", type=int,
+                        default=list(FEATURE_SETS),
+                        choices=list(FEATURE_SETS))
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=5)
+    parser.add_argument("--jobs", type=int, default=-1,
+                        help="processes fitting folds, default one per CPU")
+    parser.add_argument("--json", help="file to save the results to")
+    parser.add_argument("--csv", help="file to save the results to")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = TestPredictions().run_tests(
+        args.from_station, args.to_station, args.models, args.feature_sets,
+        args.folds, args.seed, args.jobs)
+    seconds = time.perf_counter() - start
+
+    print("{:<24}{:>5}{:>9}{:>9}{:>9}{:>8}{:>7}{:>9}".format(
+        "model", "set", "rmse", "+/-", "mae", "<=60s", "r2", "fit (s)"))
+    for result in results:
+        print("{:<24}{:>5}{:>9.1f}{:>9.1f}{:>9.1f}{:>7.1f}%{:>7.2f}"
+              "{:>9.2f}".format(result["model"], result["feature_set"],
+                                result["rmse"], result["rmse_std"],
+                                result["mae"], result["within_60s"],
+                                result["r2"], result["fit_seconds"]))
+    print("\n{} models x {} feature sets x {} folds in {:.1f} s".format(
+        len(args.models), len(args.feature_sets), args.folds, seconds))
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({"from": args.from_station, "to": args.to_station,
+                       "folds": args.folds, "seed": args.seed,
+                       "results": results}, json_file, indent=2)
+    if args.csv:
+        with open(args.csv, "w", newline="") as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=CSV_COLUMNS)
+            writer.writeheader()
+            writer.writerows(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""
+TrainAll.py
+
+Trains the delay model of every station pair on the line ahead of time,
+spread over a pool of worker processes, and reports how long each took.
+Each worker builds its pairs' training data from main.Running into the
+feature store and fits from the memory mapped arrays, so the journeys are
+never all held in memory at once. Run from the repository root:
+
+    python DelayPrediction/TrainAll.py
+    python DelayPrediction/TrainAll.py --workers 4 --max-memory 1024
+    python DelayPrediction/TrainAll.py --retrain NRCH:DISS NRCH:LIVST
+"""
+import sys, os
+currentdir = os.path.dirname(os.path.realpath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.append(parentdir)
+
+import argparse
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+try:
+    import resource
+except ImportError:
+    # Unix only, so there's no memory cap or peak RSS on Windows
+    resource = None
+
+from DelayPrediction.Corridor import CORRIDOR
+
+# The Predictions used by this worker process
+_predictions = None
+
+
+def init_worker(max_memory):
+    """
+    Caps the address space of a worker process so a pair with too much
+    data fails with a MemoryError rather than taking down the machine
+
+    Parameters
+    ----------
+    max_memory: int
+        The cap in MB, None for no cap
+    """
+    if not max_memory:
+        return
+    # macOS accepts RLIMIT_AS but doesn't enforce it
+    if resource is None or sys.platform == "darwin":
+        print("The worker memory cap isn't supported on {}, workers are "
+              "uncapped".format(sys.platform))
+        return
+    limit = max_memory * 2 ** 20
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def peak_rss_mb():
+    """This process's peak RSS in MB, None if it can't be measured"""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # In bytes on macOS and KB on Linux
+    if sys.platform == "darwin":
+        return max_rss / 2 ** 20
+    return max_rss / 1024
+
+
+def train_pair(pair, retrain=False):
+    """
+    Trains the model for pair in this worker process
+
+    Parameters
+    ----------
+    pair - tuple - (departure station, arrival station) codes
+    retrain - bool - fit a new model even if the pair already has one
+
+    Returns
+    -------
+    dict with the pair, the number of journeys, the seconds spent getting
+        the training data and fitting, the CPU seconds used, this worker's
+        peak RSS and any error
+    """
+    global _predictions
+    result = {"pair": pair, "pid": os.getpid(), "rows": 0,
+              "data_seconds": 0.0, "fit_seconds": 0.0, "status": "trained"}
+    cpu_start = time.process_time()
+    try:
+        if _predictions is None:
+            from DelayPrediction.newPrediction import Predictions
+            _predictions = Predictions()
+        model_store = _predictions.model_store
+        if not retrain and model_store.read_manifest(pair) is not None:
+            result["status"] = "exists"
+            return result
+
+        _predictions.departure_station, _predictions.arrival_station = pair
+        start = time.perf_counter()
+        x_data, y_data = _predictions.training_data()
+        result["data_seconds"] = time.perf_counter() - start
+        result["rows"] = len(y_data)
+        if not len(y_data):
+            result["status"] = "no journeys"
+            return result
+
+        start = time.perf_counter()
+        model = model_store.estimator_factory()
+        model.fit(x_data, y_data)
+        result["fit_seconds"] = time.perf_counter() - start
+        model_store.save(pair, model, model_store.data_hash(x_data, y_data),
+                         len(y_data), overwrite=retrain)
+    except MemoryError:
+        result["status"] = "out of memory"
+    except Exception as e:
+        result["status"] = "failed: {}".format(e)
+    finally:
+        result["cpu_seconds"] = time.process_time() - cpu_start
+        result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def train_all(pairs, workers=None, max_memory=None, retrain=False,
+              progress=None):
+    """
+    Trains the models for pairs on a pool of worker processes
+
+    Parameters
+    ----------
+    pairs: list of tuple
+        The (departure station, arrival station) codes to train
+    workers: int
+        The number of processes training pairs
+        default: one per CPU
+    max_memory: int
+        The most memory (MB) each worker may use, None for no cap
+    retrain: bool
+        Fit new models for pairs that already have one
+    progress: callable
+        Called with each pair's result as soon as it's finished
+
+    Returns
+    -------
+    results - list of dict - each pair's result from train_pair, slowest
+        first
+    seconds - float - the wall time
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    start = time.perf_counter()
+    results = []
+    # Spawned rather than forked so no worker inherits a database connection
+    # this process has open
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context("spawn"),
+                             initializer=init_worker,
+                             initargs=(max_memory,)) as executor:
+        futures = [executor.submit(train_pair, pair, retrain)
+                   for pair in pairs]
+        for future in as_completed(futures):
+            results.append(future.result())
+            if progress is not None:
+                progress(results[-1])
+    seconds = time.perf_counter() - start
+    results.sort(key=lambda result: result["data_seconds"] +
+                 result["fit_seconds"], reverse=True)
+    return results, seconds
+
+
+def format_mb(mb):
+    return "-" if mb is None else "{:.0f}".format(mb)
+
+
+def print_result(result):
+    print("{:<18}{:>8}{:>10.2f}{:>10.2f}{:>10}  {}".format(
+        "{}-{}".format(*result["pair"]), result["rows"],
+        result["data_seconds"], result["fit_seconds"],
+        format_mb(result["peak_rss_mb"]), result["status"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Train the delay model of every pair on the line")
+    parser.add_argument("pairs", nargs="*",
+                        help="e.g. NRCH:DISS, default every pair on the line")
+    parser.add_argument("--workers", type=int,
+                        help="processes training pairs, default one per CPU")
+    parser.add_argument("--max-memory", type=int,
+                        help="most address space (MB) each worker may use, "
+                             "including the database's memory map "
+                             "(AKOBOT_DB_MMAP_SIZE); ignored on Windows "
+                             "and macOS")
+    parser.add_argument("--retrain", action="store_true",
+                        help="fit pairs that already have a model again")
+    args = parser.parse_args()
+    pairs = [tuple(pair.upper().split(":")) for pair in args.pairs] or \
+        [(a, b) for a in CORRIDOR for b in CORRIDOR if a != b]
+    workers = args.workers or os.cpu_count() or 1
+
+    print("{:<18}{:>8}{:>10}{:>10}{:>10}  {}".format(
+        "pair", "rows", "data (s)", "fit (s)", "rss (MB)", "status"))
+    results, seconds = train_all(pairs, workers, args.max_memory,
+                                 args.retrain, print_result)
+
+    # Workers sharing a CPU each count the time they spend waiting for it,
+    # so how busy the pool was is measured in CPU time
+    cpu_seconds = sum(result["cpu_seconds"] for result in results)
+    trained = [result for result in results if result["status"] == "trained"]
+    print("\nslowest:")
+    for result in results[:5]:
+        print_result(result)
+    print("\ntrained {} of {} pairs on {} workers ({} CPUs)".format(
+        len(trained), len(results), workers, os.cpu_count()))
+    print("wall time:  {:.2f} s".format(seconds))
+    print("cpu time:   {:.2f} s ({:.2f}x the wall time, {:.0f}% of {} "
+          "CPUs)".format(cpu_seconds, cpu_seconds / max(seconds, 1e-9),
+                         100 * cpu_seconds /
+                         max(seconds * min(workers, os.cpu_count() or 1),
+                             1e-9),
+                         min(workers, os.cpu_count() or 1)))
+    peak_rss = [result["peak_rss_mb"] for result in results
+                if result["peak_rss_mb"] is not None]
+    print("peak rss:   {} MB per worker".format(
+        format_mb(max(peak_rss) if peak_rss else None)))
+
+
+if __name__ == '__main__':
+    main()
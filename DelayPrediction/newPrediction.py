@@ -9,15 +9,56 @@ from sklearn import neighbors
 from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
 from sklearn.model_selection import train_test_split
 from sklearn.neural_network import MLPRegressor
+from collections import defaultdict
 from datetime import datetime
 from difflib import SequenceMatcher
 
 from Database.DatabaseConnector import DBConnection
+from DelayPrediction.Corridor import CORRIDOR, CORRIDOR_FEATURE_COLUMNS, \
+    CORRIDOR_KEY, CorridorModel, CorridorQuery, build_corridor_dataset, \
+    stop_order
+from DelayPrediction.Features import DATASET_COLUMNS, \
+    build_features_from_running, day_segment, parse_times, rush_hour
+from DelayPrediction.FeatureStore import get_feature_store
+from DelayPrediction.LookupTable import ENABLED as LOOKUP_ENABLED, \
+    get_lookup_table
+from DelayPrediction.ModelStore import FEATURE_COLUMNS, get_model_store
+
+# "pair" trains one model per station pair, "corridor" one model for every
+# pair on the line (see DelayPrediction/Corridor.py)
+DELAY_MODEL = os.environ.get('AKOBOT_DELAY_MODEL', 'pair')
+# Served by the DataDepartures and DataArrivals indexes (see
+# Database/Migrations.py) without reading main.Data itself. They're named as
+# the planner can otherwise pick the unique DataStops index, which isn't
+# covering, for the arrivals.
+HarvestQuery = """
+    SELECT x.rid, x.tpl, x.ptd, x.dep_at, y.tpl, y.pta, y.arr_at
+    FROM main.Data AS x INDEXED BY DataDepartures
+        JOIN main.Data AS y INDEXED BY DataArrivals ON y.rid = x.rid
+    WHERE x.tpl = ? AND y.tpl = ?
+        AND x.ptd != '' AND x.dep_at != ''
+        AND y.pta != '' AND y.arr_at != ''
+    ORDER BY x.rid"""
+# The same journeys from the typed copy of main.Data, searched by primary key
+RunningQuery = """
+    SELECT x.rid, x.service_date, x.ptd, x.dep_at, y.pta, y.arr_at
+    FROM main.Locations AS a
+        JOIN main.Running AS x ON x.location_id = a.id
+        JOIN main.Locations AS b
+        JOIN main.Running AS y ON y.location_id = b.id AND y.rid = x.rid
+    WHERE a.tpl = ? AND b.tpl = ?
+        AND x.ptd IS NOT NULL AND x.dep_at IS NOT NULL
+        AND y.pta IS NOT NULL AND y.arr_at IS NOT NULL
+    ORDER BY x.rid"""
 
 
 class Predictions:
     def __init__(self):
         self.db_connection = DBConnection('AKODatabase.db')
+        self.model_store = get_model_store()
+        self.feature_store = get_feature_store()
+        self.delay_model = DELAY_MODEL
+        self.lookup_table = get_lookup_table() if LOOKUP_ENABLED else None
         self.stations = {
             "norwich": "NRCH",
             "diss": "DISS",
@@ -45,6 +86,7 @@ class Predictions:
         self.arrival_station = None
         self.exp_dep = None
         self.delay = None
+        self.rejected_rows = 0
 
     def station_finder(self, station):
         """
@@ -79,7 +121,16 @@ class Predictions:
                 raise Exception("No similar cities to " + station + " have "
                                 "been found. Please type again the station")
 
-            return similar
+            return self.stations[similar]
+
+    def station_code(self, station):
+        """
+        As station_finder but station can also be the abbreviation itself,
+        e.g. NRCH
+        """
+        if station.upper() in self.stations.values():
+            return station.upper()
+        return self.station_finder(station)
 
     def harvest_data(self):
         """
@@ -90,18 +141,24 @@ class Predictions:
         # main.TrainingData - contains all CSV data
         # main.TransformedTraining - Contains data with no NULLS
         # main.Data - contains no NULL data from 2018 and 2019
-        query = """
-            SELECT rid_FROM, tpl_FROM, ptd, dep_at, tpl_TO, pta, arr_at FROM
-                (SELECT rid AS rid_FROM, tpl AS tpl_FROM, ptd, dep_at 
-                 FROM main.Data WHERE tpl = '{0}') AS x JOIN
-                (SELECT rid AS rid_TO, tpl AS tpl_TO, pta, arr_at FROM main.Data 
-                 WHERE tpl = '{1}') AS y on x.rid_FROM = y.rid_TO 
-                ORDER BY rid_FROM """.format(self.departure_station,
-                                             self.arrival_station)
-
-        result = self.db_connection.send_query(query).fetchall()
+        result = self.db_connection.send_query(
+            HarvestQuery,
+            (self.departure_station, self.arrival_station)).fetchall()
         return result
 
+    def harvest_running(self):
+        """
+        As harvest_data but from main.Running, so the times are already
+        seconds since midnight on the service date
+
+        Returns
+        -------
+        list of (rid, service_date, ptd, dep_at, pta, arr_at) rows
+        """
+        return self.db_connection.send_query(
+            RunningQuery,
+            (self.departure_station, self.arrival_station)).fetchall()
+
     @staticmethod
     def convert_time(time):
         """
@@ -204,70 +261,143 @@ class Predictions:
 
         Returns
         -------
-        data - List of all data necessary for predictions
-        """
-        result = self.harvest_data()
-        data = []
-
-        for journey in range(len(result)):
-            #   public_departure      |       actual_departure 
-            if (result[journey][2] != '' and result[journey][3] != '' and
-                    # public_arrival      |       actual_arrival
-                    result[journey][5] != '' and result[journey][6] != ''):
-                # Get date based on RID
-                rid = str(result[journey][0])
-                # Convert date to day of the week
-                day_of_week = datetime(int(rid[:4]), int(rid[4:6]),
-                                       int(rid[6:8])).weekday()
-                hour_of_day = int(result[journey][3].split(":")[0])
-                minute_of_day = int(result[journey][3].split(":")[1])
-                # Get day of week based on RID - Monday = 0, Sunday = 6
-                weekend = self.is_weekend(day_of_week)
-                # Checking morning/midday/evening/night
-                day_segment = self.check_day_segment(hour_of_day)
-                # Checking rush hour or not
-                rush_hour = self.is_rush_hour(hour_of_day, minute_of_day)
-                try:
-                    # Departing time  in seconds
-                    time_dep = (datetime.strptime(result[journey][3], '%H:%M') -
-                                datetime(1900, 1, 1)).total_seconds()
-                except:
-                    print("Unable to get time_dep")
-                try:
-                    # Delay : actual departure - public timetable departure in seconds
-                    journey_delay = ((datetime.strptime(result[journey][3],
-                                                        '%H:%M') -
-                                      datetime(1900, 1, 1)).total_seconds() -
-                                     (datetime.strptime(result[journey][2],
-                                                        '%H:%M') -
-                                      datetime(1900, 1, 1)).total_seconds())
-                except:
-                    print("Unable to get journey_delay")
-                try:
-                    # Arrival : actual arrival - public timetable arrival in seonds
-                    time_arr = ((datetime.strptime(result[journey][6],
-                                                   '%H:%M') -
-                                 datetime(1900, 1, 1)).total_seconds() -
-                                (datetime.strptime(result[journey][5],
-                                                   '%H:%M') -
-                                 datetime(1900, 1, 1)).total_seconds())
-                except:
-                    print("Unable to get  time_arrival")
-
-                # Add all above into dataset used for prediction
-                data.append([rid, time_dep, journey_delay, day_of_week,
-                             weekend, day_segment, rush_hour, time_arr])
-
+        data - DataFrame of all data necessary for predictions, one row per
+            journey with DATASET_COLUMNS
+        """
+        data, rejected = build_features_from_running(self.harvest_running())
+        if rejected:
+            print("Rejected {} journeys with unreadable times or "
+                  "dates".format(rejected))
+        self.rejected_rows = rejected
         return data
 
-    def predict(self, data):
+    def source_version(self):
+        """
+        Returns
+        -------
+        list that changes whenever journeys are added to main.Running, so
+            saved training data built from older journeys isn't used. The
+            last item is the last rowid of main.Data, so the journeys added
+            since can be found (see DelayPrediction/Refresh.py).
+        """
+        return list(self.db_connection.send_query(
+            "SELECT count(*), max(rid), (SELECT max(rowid) FROM main.Data) "
+            "FROM main.Running").fetchone())
+
+    def training_data(self):
+        """
+        Prepares the data to train the model for the current station pair.
+        It's built once and saved to the feature store, then memory mapped
+        from there rather than queried again.
+
+        Returns
+        -------
+        x_data - read only array of the model inputs (FEATURE_COLUMNS)
+        y_data - read only array of arrival delays (in seconds)
+        """
+        pair = (self.departure_station, self.arrival_station)
+        return self.feature_store.get(pair, self.source_version(),
+                                      self.prepare_datasets)
+
+    def prepare_corridor_dataset(self):
+        """
+        As prepare_datasets but for every journey between two stops on the
+            line, with the CORRIDOR_FEATURE_COLUMNS
+        """
+        return build_corridor_dataset(self.db_connection.send_query(
+            CorridorQuery, CORRIDOR).fetchall())
+
+    def corridor_training_data(self):
+        """
+        As training_data but for the corridor wide model
+        """
+        return self.feature_store.get(CORRIDOR_KEY, self.source_version(),
+                                      self.prepare_corridor_dataset,
+                                      CORRIDOR_FEATURE_COLUMNS)
+
+    def model_key(self, pair):
+        """The model store key of the model used for pair"""
+        return CORRIDOR_KEY if self.delay_model == "corridor" else pair
+
+    def model_for(self, pair):
+        """
+        Gets the model that predicts delays for pair, training it if needed
+
+        Parameters
+        ----------
+        pair - tuple - (departure station, arrival station) codes
+
+        Returns
+        -------
+        model - the pair's own model, or the corridor wide model if
+            self.delay_model is "corridor"
         """
-        Predicts how long the user will be delayed using nearest neighbours
-            model.
+        if self.model_key(pair) == CORRIDOR_KEY:
+            return self.model_store.get(CORRIDOR_KEY,
+                                        self.corridor_training_data,
+                                        CorridorModel)
+        self.departure_station, self.arrival_station = pair
+        return self.model_store.get(pair, self.training_data)
+
+    def model_inputs(self, pair, features):
+        """
+        Adds the columns the corridor wide model needs to the FEATURE_COLUMNS
+            of journeys from pair, if it's being used
+
+        Parameters
+        ----------
+        pair - tuple - (departure station, arrival station) codes
+        features - (rows, len(FEATURE_COLUMNS)) array
+
+        Returns
+        -------
+        array of the inputs for model_for(pair)
+        """
+        if self.delay_model != "corridor":
+            return features
+        origin, destination = [stop_order(code) for code in pair]
+        if origin is None or destination is None:
+            raise ValueError("{} to {} isn't on the line".format(*pair))
+        # The timetabled running time is filled in by the model
+        return np.column_stack([features, np.tile(
+            [origin, destination, np.nan], (len(features), 1))])
+
+    def predict_features(self, pair, features):
+        """
+        Predicts the delays of journeys from pair, from its lookup table
+            (see DelayPrediction/LookupTable.py) where it has one and
+            otherwise from its model
+
+        Parameters
+        ----------
+        pair - tuple - (departure station, arrival station) codes
+        features - (rows, len(FEATURE_COLUMNS)) array
+
+        Returns
+        -------
+        array of predicted delays (seconds)
+        """
+        predictions = np.full(len(features), np.nan)
+        if self.lookup_table is not None:
+            predictions = self.lookup_table.predict(pair, self.model_key(pair),
+                                                    features)
+        missing = np.isnan(predictions)
+        if missing.any():
+            clf = self.model_for(pair)
+            predictions[missing] = clf.predict(
+                self.model_inputs(pair, features[missing]))
+        return predictions
+
+    def predict(self, data=None):
+        """
+        Predicts how long the user will be delayed using the random forest
+            model for the station pair, trained once and then reused.
         
         Parameters
         ----------
-        data - List of all data needed for predicting
+        data - List of all data needed for predicting. If given, the model
+            is trained on it, otherwise the stored model is used (and only
+            trained if there isn't one)
 
         Returns
         -------
@@ -276,27 +406,20 @@ class Predictions:
         dep_time_s = (datetime.strptime(self.exp_dep, '%H:%M') - datetime(
             1900, 1, 1)).total_seconds()
         delay_s = int(self.delay) * 60
-        journeys = pd.DataFrame(data, columns=["rid", "time_dep",
-                                               "delay", "day_of_week",
-                                               "weekend",
-                                               "day_segment", "rush_hour",
-                                               "arrival_time"])
-
-        X = journeys.drop(['rid', 'arrival_time'], axis=1)
-        y = journeys['arrival_time'].values
-        
-        # clf = neighbors.NearestNeighbors(n_neighbors=1)
-        # clf.fit(X)
+        pair = (self.departure_station, self.arrival_station)
 
-        # prediction = clf.kneighbors([[dep_time_s, delay_s, self.day_of_week, self.weekend, 
-        #                                     self.segment_of_day, self.rush_hour]])
-        # prediction = self.convert_time(prediction[0])
+        features = np.array(
+            [[dep_time_s, delay_s, self.day_of_week, self.weekend,
+              self.segment_of_day, self.rush_hour]], dtype=np.float64)
 
-        clf = RandomForestRegressor(n_estimators = 100)
-        clf.fit(X, y)
-
-        prediction = clf.predict([[dep_time_s, delay_s, self.day_of_week, self.weekend, 
-                                            self.segment_of_day, self.rush_hour]])
+        if data is None:
+            prediction = self.predict_features(pair, features)
+        else:
+            journeys = pd.DataFrame(data, columns=DATASET_COLUMNS)
+            clf = self.model_store.train(pair,
+                                         journeys[FEATURE_COLUMNS].values,
+                                         journeys['arrival_time'].values)
+            prediction = clf.predict(features)
         prediction = self.convert_time([prediction])
 
         print("The total delay of the journey will be " + str(
@@ -331,14 +454,85 @@ class Predictions:
         self.segment_of_day = self.check_day_segment(hour_of_day)
         self.rush_hour = self.is_rush_hour(hour_of_day, minute_of_day)
 
-        data = self.prepare_datasets()
-
-        prediction = self.predict(data)
+        prediction = self.predict()
 
         return ("The total delay of the journey will be " + str(
             prediction[1]).zfill(2) +
                 " minutes and " + str(prediction[2]).zfill(2) + " seconds.")
 
+    def predict_batch(self, queries):
+        """
+        Predicts the delay for many journeys at once. Queries are grouped by
+            station pair and each pair's model predicts all of its queries
+            in one call.
+
+        Parameters
+        ----------
+        queries - list of dict, each with
+            from - String - departing station name or abbreviation
+            to - String - arriving station name or abbreviation
+            departure - String - when the user was expecting to depart (HH:MM)
+            delay - Integer - how long the user was delayed (in minutes)
+            date - String - optional, the day of travel (YYYY-MM-DD),
+                default today
+
+        Returns
+        -------
+        list of dict, one per query in the same order, with the stations'
+            abbreviations and either predicted_delay (seconds) or error
+        """
+        results = [{} for _ in queries]
+        features = np.full((len(queries), len(FEATURE_COLUMNS)), np.nan)
+        departures = parse_times([str(query.get("departure", "")).zfill(5)
+                                  for query in queries])
+        codes = {}
+        groups = defaultdict(list)
+        today = datetime.today().weekday()
+
+        for i, query in enumerate(queries):
+            try:
+                pair = []
+                for station in [query["from"], query["to"]]:
+                    if station not in codes:
+                        codes[station] = self.station_code(station)
+                    pair.append(codes[station])
+                results[i].update({"from": pair[0], "to": pair[1]})
+                if np.isnan(departures[i]):
+                    raise ValueError("Invalid departure time " +
+                                     str(query.get("departure")))
+                day_of_week = today
+                if query.get("date"):
+                    day_of_week = datetime.strptime(query["date"],
+                                                    "%Y-%m-%d").weekday()
+                features[i, :3] = [departures[i],
+                                   int(query.get("delay", 0)) * 60,
+                                   day_of_week]
+                groups[tuple(pair)].append(i)
+            except Exception as e:
+                results[i]["error"] = str(e)
+
+        # Calendar features for every query at once, the invalid ones aren't
+        # predicted so their times are just zeroed
+        departures = np.nan_to_num(departures)
+        hours = (departures // 3600).astype(np.int64)
+        minutes = ((departures % 3600) // 60).astype(np.int64)
+        features[:, 3] = features[:, 2] > 4
+        features[:, 4] = day_segment(hours)
+        features[:, 5] = rush_hour(hours, minutes)
+
+        for pair, indexes in groups.items():
+            try:
+                predictions = self.predict_features(pair, features[indexes])
+            except Exception as e:
+                print(e)
+                for i in indexes:
+                    results[i]["error"] = "Unable to predict delays from " \
+                                          "{} to {}".format(*pair)
+                continue
+            for i, prediction in zip(indexes, predictions):
+                results[i]["predicted_delay"] = float(prediction)
+        return results
+
 # pr = Predictions()
 # a = pr.display_results("norwich", "diss", "7:30", "4")
 # print(a)
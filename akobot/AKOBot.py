@@ -1,18 +1,46 @@
 """
 AKOBot.py
 """
+import os
+import threading
 
 import spacy
+from spacy.matcher import Matcher
 
 from Database.DatabaseConnector import DBConnection
 
+# The SpaCy pipeline to load, a package name or the path to a saved pipeline
+SPACY_MODEL = os.environ.get('AKOBOT_SPACY_MODEL', 'en_core_web_sm')
+
+_nlp = None
+_nlp_lock = threading.Lock()
+
+
+def get_nlp():
+    """
+    Gets the SpaCy pipeline shared by every NLPEngine in this process. The
+    model is only loaded the first time this is called.
+
+    Returns
+    -------
+    spacy.language.Language
+        The loaded SPACY_MODEL pipeline, en_core_web_sm by default
+    """
+    global _nlp
+    if _nlp is None:
+        with _nlp_lock:
+            if _nlp is None:
+                _nlp = spacy.load(SPACY_MODEL)
+    return _nlp
+
 
 class NLPEngine:
     def __init__(self):
         """
-        A basic NLP Engine that takes can process input text
+        A basic NLP Engine that takes can process input text. Every engine
+        uses the same shared SpaCy pipeline (see get_nlp)
         """
-        self.nlp = spacy.load("en_core_web_sm")
+        self.nlp = get_nlp()
 
     def process(self, input_text):
         """
@@ -32,6 +60,207 @@ class NLPEngine:
         return self.nlp(input_text)
 
 
+class MatchResults:
+    def __init__(self, doc, matches, keys):
+        """
+        The result of running a PatternMatcher over a Doc
+
+        Parameters
+        ----------
+        doc: spacy.Doc
+            The Doc the matcher was run over
+        matches: list of tuple
+            The (match_id, start, end) tuples returned by the SpaCy Matcher
+        keys: dict
+            The pattern names mapped to the match IDs of their alternatives,
+            in the order they should be tried
+        """
+        self.doc = doc
+        self.keys = keys
+        self.spans = {}
+        for match_id, start, end in matches:
+            self.spans.setdefault(match_id, []).append((start, end))
+
+    def first(self, name):
+        """
+        Gets the first match for the first alternative of pattern name that
+        matched anything
+
+        Parameters
+        ----------
+        name: str
+            The name the pattern(s) were registered under
+
+        Returns
+        -------
+        spacy.Span or None
+            The matched span or None if none of the alternatives matched
+        """
+        for match_id in self.keys[name]:
+            if match_id in self.spans:
+                start, end = self.spans[match_id][0]
+                return self.doc[start:end]
+        return None
+
+
+class PatternMatcher:
+    def __init__(self, vocab, patterns):
+        """
+        Compiles a dict of named patterns into a single SpaCy Matcher so a Doc
+        only needs to be matched once however many patterns are checked
+
+        Parameters
+        ----------
+        vocab: spacy.Vocab
+            The vocab of the pipeline the Docs will come from
+        patterns: dict
+            Pattern names mapped to a list of alternative patterns. Earlier
+            alternatives take priority over later ones
+        """
+        self.matcher = Matcher(vocab)
+        self.keys = {}
+        for name, alternatives in patterns.items():
+            self.keys[name] = []
+            for i, pattern in enumerate(alternatives):
+                key = "{}_{}".format(name, i)
+                self.matcher.add(key, None, pattern)
+                self.keys[name].append(vocab.strings[key])
+
+    def __call__(self, doc):
+        """
+        Runs every pattern over doc. The results are kept in the Doc's
+        user_data so matching the same Doc again is free
+
+        Parameters
+        ----------
+        doc: spacy.Doc
+            The Doc to match
+
+        Returns
+        -------
+        MatchResults
+            The matches indexed by pattern name
+        """
+        results = doc.user_data.get(id(self))
+        if results is None:
+            results = MatchResults(doc, self.matcher(doc), self.keys)
+            doc.user_data[id(self)] = results
+        return results
+
+
+def separate_am_pm(message_text):
+    """
+    Puts a space before am/pm (e.g. 9am -> 9 am) as SpaCy only recognises
+    the time when they're separate tokens
+
+    Parameters
+    ----------
+    message_text: str
+        The message text input by the user
+
+    Returns
+    -------
+    str
+        The message text with am/pm separated
+    """
+    if (message_text.find("am") > 0 and
+            not message_text[message_text.find("am") - 1].isspace()):
+        message_text = message_text.replace("am", " am")
+    if (message_text.find("AM") > 0 and
+            not message_text[message_text.find("AM") - 1].isspace()):
+        message_text = message_text.replace("AM", " am")
+    if (message_text.find("pm") > 0 and
+            not message_text[message_text.find("pm") - 1].isspace()):
+        message_text = message_text.replace("pm", " pm")
+    if (message_text.find("PM") > 0 and
+            not message_text[message_text.find("PM") - 1].isspace()):
+        message_text = message_text.replace("PM", " pm")
+    return message_text
+
+
+class TurnAnalysis:
+    def __init__(self, nlp_engine, matcher, text, control=None):
+        """
+        Everything the rules need to know about a single user message. Each
+        distinct text is only passed through SpaCy (and the matcher) once per
+        turn, however many rules ask for it, and only when a rule first asks.
+
+        Parameters
+        ----------
+        nlp_engine: NLPEngine
+            The engine used to process the text
+        matcher: PatternMatcher
+            The matcher holding the rule patterns
+        text: str
+            The normalised message text (see Chat.convert_tags_to_nlp_text)
+        control: tuple or None
+            The parsed control tag if the message is a control tag and value
+            that can be used without NLP (see Reasoner.parse_control_tag)
+        """
+        self.nlp_engine = nlp_engine
+        self.matcher = matcher
+        self.text = text
+        self.control = control
+        self.time_text = separate_am_pm(text)
+        self._docs = {}
+
+    def parse(self, text):
+        """
+        Gets the Doc for text, processing it only if it hasn't been already
+        this turn
+
+        Parameters
+        ----------
+        text: str
+            The text to process
+
+        Returns
+        -------
+        spacy.Doc
+            The processed text
+        """
+        doc = self._docs.get(text)
+        if doc is None:
+            doc = self.nlp_engine.process(text)
+            self._docs[text] = doc
+        return doc
+
+    @property
+    def doc(self):
+        """The Doc for the message text"""
+        return self.parse(self.text)
+
+    @property
+    def matches(self):
+        """The MatchResults for the message text"""
+        return self.matcher(self.doc)
+
+    @property
+    def time_doc(self):
+        """
+        The Doc for the message text with am/pm separated, this is the same
+        Doc as doc if there was nothing to separate
+        """
+        return self.parse(self.time_text)
+
+    def payload_doc(self, tag):
+        """
+        Gets the Doc for the message text with a control tag removed, e.g.
+        "3" for "{TAG:ADT}3"
+
+        Parameters
+        ----------
+        tag: str
+            The control tag to remove
+
+        Returns
+        -------
+        spacy.Doc
+            The processed text without the tag
+        """
+        return self.parse(self.text.replace(tag, ""))
+
+
 def get_all_stations():
     query = "SELECT * FROM main.Stations"
     db_connection = DBConnection('AKODatabase.db')
@@ -36,9 +36,12 @@ class Chat:
 
         if author != "bot":
             message_text = convert_tags_to_nlp_text(message_text.strip())
-            self.chat_engine.reset()
-            self.chat_engine.declare(Fact(message_text=message_text))
-            self.chat_engine.run()
+            # Most suggestion clicks are answered without the engine
+            if not self.chat_engine.answer_control_tag(message_text):
+                self.chat_engine.analyse(message_text)
+                self.chat_engine.reset()
+                self.chat_engine.declare(Fact(message_text=message_text))
+                self.chat_engine.run()
             message_dict = self.chat_engine.message.pop(0)
             tags = self.chat_engine.tags
             self.chat_engine.tags = ""
@@ -61,3 +64,7 @@ class Chat:
         return [tags + message_dict['message'],
                 message_dict['suggestions'],
                 message_dict['response_req']]
+
+    def close(self):
+        """Releases the resources held by this chat's engine"""
+        self.chat_engine.close()
@@ -0,0 +1,174 @@
+"""
+Dates.py
+
+Contains classes related to reading dates and times from user input
+"""
+import re
+import threading
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+from dateparser.date import DateDataParser
+from dateutil.parser import parse, ParserError
+
+# The shapes most replies to "When do you want to depart?" take, e.g. 17:30,
+# 7pm, 7:30 pm, tomorrow at 9 and 9am tomorrow
+SimpleTimePattern = re.compile(
+    r"^(?:(?P<day>today|tomorrow)\s+(?:at\s+)?)?"
+    r"(?P<hour>\d{1,2})(?::(?P<minute>\d{2}))?\s*(?P<meridiem>am|pm)?"
+    r"(?:\s+(?P<day_after>today|tomorrow))?$",
+    re.IGNORECASE
+)
+
+
+def normalise_date_text(date_text):
+    """
+    Rewrites am/pm and o'clock in a form the date parsers understand
+
+    Parameters
+    ----------
+    date_text: str
+        The date and/or time input by the user
+
+    Returns
+    -------
+    str
+        The normalised text, e.g. "7 PM" -> "7pm", "7 o'clock" -> "7:00"
+    """
+    date_text = date_text.replace(" am", "am")
+    date_text = date_text.replace(" AM", "am")
+    date_text = date_text.replace(" pm", "pm")
+    date_text = date_text.replace(" PM", "pm")
+    date_text = date_text.replace(" o'clock", ":00")
+    date_text = date_text.replace(" oclock", ":00")
+    date_text = date_text.replace("o'clock", ":00")
+    date_text = date_text.replace("oclock", ":00")
+    return date_text.strip()
+
+
+def parse_simple_time(date_text, reference):
+    """
+    Reads the common date shapes in SimpleTimePattern without the full date
+    parsers
+
+    Parameters
+    ----------
+    date_text: str
+        The normalised date text
+    reference: datetime
+        The date relative dates (today, tomorrow) are taken from
+
+    Returns
+    -------
+    datetime or None
+        The date and time or None if date_text isn't one of the simple
+        shapes (or isn't a valid time)
+    """
+    match = SimpleTimePattern.match(date_text)
+    if match is None:
+        return None
+    day = match.group("day") or match.group("day_after")
+    minute = match.group("minute")
+    meridiem = match.group("meridiem")
+    if minute is None and meridiem is None and day is None:
+        # a lone number is more likely a day of the month than a time
+        return None
+
+    hour = int(match.group("hour"))
+    minute = int(minute) if minute else 0
+    if meridiem:
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if meridiem.lower() == "pm" else 0)
+    if hour > 23 or minute > 59:
+        return None
+
+    date_time = reference.replace(hour=hour, minute=minute, second=0,
+                                  microsecond=0)
+    if day and day.lower() == "tomorrow":
+        date_time += timedelta(days=1)
+    return date_time
+
+
+class DateExtractor:
+    def __init__(self, cache_size=1024):
+        """
+        Reads dates and times from user input. The simple shapes are read by
+        a regex, anything else by a DateDataParser that is kept until the
+        reference time moves on to the next minute. Results are cached on the
+        normalised text and reference time.
+
+        Parameters
+        ----------
+        cache_size: int
+            The number of results to keep in the LRU cache
+        """
+        self.parser = None
+        self.parser_reference = None
+        # DateDataParser isn't documented as thread safe
+        self.parser_lock = threading.Lock()
+        self.cached_extract = lru_cache(maxsize=cache_size)(self._extract)
+
+    def extract(self, date_text, reference=None):
+        """
+        Gets the date and time from date_text
+
+        Parameters
+        ----------
+        date_text: str
+            The date and/or time input by the user
+        reference: datetime
+            The time relative dates are taken from
+            default: now
+
+        Returns
+        -------
+        datetime or None
+            The date and time or None if date_text doesn't contain one
+        """
+        if reference is None:
+            reference = datetime.now()
+        # relative dates are only resolved to the minute so the reference
+        # only needs to be that precise for the cache
+        reference = reference.replace(second=0, microsecond=0)
+        return self.cached_extract(normalise_date_text(date_text), reference)
+
+    def _extract(self, date_text, reference):
+        date_time = parse_simple_time(date_text, reference)
+        if date_time is not None:
+            return date_time
+        try:
+            parse(date_text, fuzzy=True)
+        except (ParserError, OverflowError):
+            return None
+        with self.parser_lock:
+            # Relative dates (e.g. "in 2 hours") are resolved against the
+            # parser's RELATIVE_BASE, which can only be set when it's made
+            if self.parser is None or self.parser_reference != reference:
+                self.parser = DateDataParser(
+                    languages=['en'],
+                    settings={'DATE_ORDER': 'DMY',
+                              'RELATIVE_BASE': reference})
+                self.parser_reference = reference
+            return self.parser.get_date_data(date_text).date_obj
+
+
+_date_extractor = None
+_date_extractor_lock = threading.Lock()
+
+
+def get_date_extractor():
+    """
+    Gets the DateExtractor shared by every ChatEngine in this process
+
+    Returns
+    -------
+    DateExtractor
+        The shared extractor
+    """
+    global _date_extractor
+    if _date_extractor is None:
+        with _date_extractor_lock:
+            if _date_extractor is None:
+                _date_extractor = DateExtractor()
+    return _date_extractor
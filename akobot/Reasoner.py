@@ -3,13 +3,12 @@ Reasoner.py
 
 Contains classes related to reasoning
 """
+import re
+import threading
+from collections import namedtuple
 from datetime import datetime
-from difflib import SequenceMatcher
 
-from dateparser.date import DateDataParser
-from dateutil.parser import parse, ParserError
 from experta import *
-from spacy.matcher import Matcher
 
 from Database.DatabaseConnector import DBConnection
 from DelayPrediction.newPrediction import Predictions
@@ -18,12 +17,15 @@ from akobot import (StationNoMatchError,
                     UnknownPriorityException,
                     UnknownStationTypeException,
                     scraper_1)
-from akobot.AKOBot import NLPEngine, get_all_stations
+from akobot.AKOBot import NLPEngine, PatternMatcher, TurnAnalysis, get_nlp
+from akobot.Dates import get_date_extractor
+from akobot.Stations import get_station_index
 
 TokenDictionary = {
     "book": [{"LEMMA": {"IN": ["book", "booking", "purchase", "buy"]}}],
     "delay": [{"LEMMA": {"IN": ["delay", "predict", "prediction"]}}],
-    "yes": [{"LOWER": {"IN": ["yes", "yeah", "y", "yep", "yeh", "ye", "👍"]}}],
+    "yes": [{"LOWER": {"IN": ["yes", "yeah", "y", "yep", "yeh", "ye",
+                              "👍"]}}],
     "no": [{"LOWER": {"IN": ["no", "nope", "n", "nah", "na", "👎"]}}],
     "return": [{"LEMMA": {"IN": ["return", "returning"]}}],
     "single": [{"LEMMA": {"IN": ["single", "one-way"]}}],
@@ -32,18 +34,21 @@ TokenDictionary = {
     "num_children": [{"LIKE_NUM": True}, {"LEMMA": "child"}]
 }
 
+# The words that come before a departure or arrival station. Known stations
+# are found by the StationRecogniser, these patterns catch the rest
+StationTriggers = {
+    "DEP": ["depart", "from", "departing"],
+    "ARR": ["arrive", "to", "arriving"]
+}
+
 MultiTokenDictionary = {
     "depart": [
-        [{"POS": "ADP", "LEMMA": {"IN": ["depart", "from", "departing"]}},
-         {"POS": "PROPN", "OP": "*"}, {"POS": "PROPN", "DEP": "pobj"}],
-        [{"LEMMA": {"IN": ["depart", "from", "departing"]}},
-         {"LOWER": {"IN": get_all_stations()}}]
+        [{"POS": "ADP", "LEMMA": {"IN": StationTriggers["DEP"]}},
+         {"POS": "PROPN", "OP": "*"}, {"POS": "PROPN", "DEP": "pobj"}]
     ],
     "arrive": [
-        [{"POS": "ADP", "LEMMA": {"IN": ["arrive", "to", "arriving"]}},
-         {"POS": "PROPN", "OP": "*"}, {"POS": "PROPN", "DEP": "pobj"}],
-        [{"LEMMA": {"IN": ["arrive", "to", "arriving"]}},
-         {"LOWER": {"IN": get_all_stations()}}]
+        [{"POS": "ADP", "LEMMA": {"IN": StationTriggers["ARR"]}},
+         {"POS": "PROPN", "OP": "*"}, {"POS": "PROPN", "DEP": "pobj"}]
     ],
     "dep_date": [
         [{"LEMMA": {"IN": ["depart", "departing", "leave", "leaving"]}},
@@ -116,31 +121,102 @@ MultiTokenDictionary = {
     ]
 }
 
+# Messages that are just a control tag and a value, e.g. "{TAG:ADT}3", are
+# sent by the frontend when a suggestion is clicked and can be read without NLP
+ControlTagPattern = re.compile(r"^\{TAG:(DEP|ARR|RET|ADT|CHD|DDL)\}([^{}]*)$")
+ControlTag = namedtuple("ControlTag", ["tag", "value"])
+ReturnWords = set(TokenDictionary['yes'][0]['LOWER']['IN'] +
+                  TokenDictionary['return'][0]['LEMMA']['IN'])
+SingleWords = set(TokenDictionary['no'][0]['LOWER']['IN'] +
+                  TokenDictionary['single'][0]['LEMMA']['IN'])
+CountFacts = {"ADT": ("no_adults", "na_"),
+              "CHD": ("no_children", "nc_"),
+              "DDL": ("departure_delay", "dd_")}
+# The control tags each action reads without NLP
+ControlTagActions = {"book": ["DEP", "ARR", "RET", "ADT", "CHD"],
+                     "delay": ["DEP", "ARR", "DDL"]}
+
+# The question asked for each missing detail and its suggestions, in the
+# order the ask rules ask them (by salience)
+Questions = {
+    "book": {
+        "depart": ("{REQ:DEP}And where are you travelling from?", []),
+        "departure_date": ("{REQ:DDT}When do you want to depart?", []),
+        "arrive": ("{REQ:ARR}And where are you travelling to?", []),
+        "returning": ("{REQ:RET}Are you returning?",
+                      ["{TAG:RET}👍", "{TAG:RET}👎"]),
+        "return_date": ("{REQ:RTD}And when are you returning?", []),
+        "no_adults": ("{REQ:ADT}How many adults (16+) will be travelling?",
+                      ["{TAG:ADT}" + str(i) for i in range(10)]),
+        "no_children": ("{REQ:CHD}How many children (under 16) will be "
+                        "travelling?",
+                        ["{TAG:CHD}" + str(i) for i in range(10)])
+    },
+    "delay": {
+        "depart": ("{REQ:DEP}Where are you travelling from?", []),
+        "arrive": ("{REQ:ARR}Where are you travelling to?", []),
+        "departure_date": ("{REQ:DDT}What time were you expecting to "
+                           "depart the station?", []),
+        "departure_delay": ("{REQ:DDL}How long are you delayed?", [])
+    }
+}
+
+_rule_matcher = None
+_rule_matcher_lock = threading.Lock()
 
-def get_similarity(comparator_a, comparator_b):
+
+def get_rule_matcher():
+    """
+    Gets the PatternMatcher holding every pattern in TokenDictionary and
+    MultiTokenDictionary, compiled the first time this is called
+
+    Returns
+    -------
+    PatternMatcher
+        The shared matcher, keyed by the dictionary keys
+    """
+    global _rule_matcher
+    if _rule_matcher is None:
+        with _rule_matcher_lock:
+            if _rule_matcher is None:
+                patterns = {name: [pattern]
+                            for name, pattern in TokenDictionary.items()}
+                patterns.update(MultiTokenDictionary)
+                _rule_matcher = PatternMatcher(get_nlp().vocab, patterns)
+    return _rule_matcher
+
+
+def parse_control_tag(message_text):
     """
+    Reads a message made up of a single control tag and its value, e.g.
+    "{TAG:ADT}3", "{TAG:RET}👍" or "{TAG:DEP}Norwich"
 
     Parameters
     ----------
-    comparator_a: tuple
-        The tuple from the database when searching for identifier, name
-        from main.Stations table
-    comparator_b: str
-        The departure point input by the user
+    message_text: str
+        The normalised message text passed by the user to the Chat class
+
     Returns
     -------
-    float
-        The SequenceMatcher produced ration between the station name from
-        the database and the departure point passed in by the user
+    ControlTag or None
+        The tag (e.g. "ADT") and its value: an int string for ADT, CHD and
+        DDL, a bool for RET (True if returning) and the station for DEP and
+        ARR. None if the message is free text or the value can't be read
+        without NLP
     """
-    comparator_a = comparator_a[1].replace("(" + comparator_b + ")", "")
-    ratio = SequenceMatcher(None, comparator_a.lower(),
-                            comparator_b.lower()).ratio() * 100
-    if comparator_b.lower() in comparator_a.lower():
-        ratio += 25
-    if comparator_b.lower().startswith(comparator_a.lower()):
-        ratio += 25
-    return ratio
+    match = ControlTagPattern.match(message_text)
+    if match is None:
+        return None
+    tag, value = match.group(1), match.group(2).strip()
+    if tag in ["DEP", "ARR"]:
+        return ControlTag(tag, value) if value else None
+    if tag == "RET":
+        if value.lower() in ReturnWords:
+            return ControlTag(tag, True)
+        if value.lower() in SingleWords:
+            return ControlTag(tag, False)
+        return None
+    return ControlTag(tag, value) if value.isdigit() else None
 
 
 class ChatEngine(KnowledgeEngine):
@@ -150,6 +226,7 @@ class ChatEngine(KnowledgeEngine):
         # Internal connections to AKOBot classes
         self.db_connection = DBConnection('AKODatabase.db')
         self.nlp_engine = NLPEngine()
+        self.rule_matcher = get_rule_matcher()
 
         # Knowledge dict
         self.knowledge = {}
@@ -163,6 +240,11 @@ class ChatEngine(KnowledgeEngine):
         self.message = []
         self.tags = ""
 
+        # The analysis of the message currently being processed
+        self.turn = None
+        # True while a control tag is answered without running the engine
+        self.without_engine = False
+
     def declare(self, *facts):
         """
         Overrides super class' method declare to add the facts to the knowledge
@@ -176,22 +258,68 @@ class ChatEngine(KnowledgeEngine):
                     self.knowledge[g] = val
         return new_fact
 
-    def get_matches(self, doc, pattern):
-        matcher = Matcher(self.nlp_engine.nlp.vocab)
-        matcher.add("pattern", None, pattern)
-        matches = matcher(doc)
-        if len(matches) > 0:
-            for match_id, start, end in matches:
-                return doc[start:end]
-        return None
+    def set_fact(self, **values):
+        """
+        Declares details of the booking or delay prediction. Without the
+        engine running (see answer_control_tag) they're only recorded in
+        the knowledge dictionary, which is declared at the next reset.
+        """
+        if self.without_engine:
+            self.knowledge.update(values)
+        else:
+            self.declare(Fact(**values))
+
+    def close(self):
+        """Closes the engine's connection to the database"""
+        self.db_connection.close()
+
+    def analyse(self, message_text):
+        """
+        Starts a new turn for message_text. The analysis is shared by every
+        rule that fires this turn, so the text is only parsed once.
+
+        Parameters
+        ----------
+        message_text: str
+            The normalised message text passed by the user to the Chat class
+
+        Returns
+        -------
+        TurnAnalysis
+            The analysis for this turn
+        """
+        self.turn = TurnAnalysis(self.nlp_engine, self.rule_matcher,
+                                 message_text, parse_control_tag(message_text))
+        return self.turn
 
-    def get_matches_from_multiple(self, doc, pattern_arr):
-        matches = None
-        for pattern in pattern_arr:
-            matches = self.get_matches(doc, pattern)
-            if matches:
-                break
-        return matches
+    def get_turn(self, message_text):
+        """
+        Gets the analysis for message_text, starting a new turn if the
+        message hasn't been analysed yet (e.g. when a Fact is declared
+        directly rather than through Chat.add_message)
+        """
+        if self.turn is None or self.turn.text != message_text:
+            return self.analyse(message_text)
+        return self.turn
+
+    def get_matches(self, doc, name):
+        """
+        Gets the first match in doc for the TokenDictionary or
+        MultiTokenDictionary pattern(s) called name
+
+        Parameters
+        ----------
+        doc: spacy.Doc
+            The Doc to search
+        name: str
+            The key of the pattern(s) in TokenDictionary/MultiTokenDictionary
+
+        Returns
+        -------
+        spacy.Span or None
+            The matched span or None if nothing matched
+        """
+        return self.rule_matcher(doc).first(name)
 
     def add_to_message_chain(self, message, priority=1, req_response=True,
                              suggestions=None):
@@ -231,54 +359,17 @@ class ChatEngine(KnowledgeEngine):
             raise UnknownPriorityException(priority)
 
     def find_station(self, search_station):
-        query = ("SELECT identifier, name FROM main.Stations WHERE identifier=?"
-                 " COLLATE NOCASE")
-        result = self.db_connection.send_query(query,
-                                               (search_station,)).fetchall()
-
-        if result:
-            return result[0]
-        else:
-            # Station code not input - try searching by station name
-            query = ("SELECT identifier, name FROM main.Stations WHERE name=? "
-                     "COLLATE NOCASE")
-            result = self.db_connection.send_query(query,
-                                                   (search_station,)
-                                                   ).fetchall()
-            if result and len(result) == 1:
-                return result[0]
-            else:
-                # Try finding stations with names close to input name
-                query = "SELECT * FROM main.Stations"
-                result = self.db_connection.send_query(query).fetchall()
-                if result:
-                    result.sort(key=lambda station: get_similarity(
-                        station, search_station), reverse=True)
-                    if len(result) <= 3:
-                        raise StationNoMatchError(result)
-                    else:
-                        raise StationNoMatchError(result[0:3])
-                else:
-                    msg = "Unable to find station {}"
-                    raise StationNotFoundError(msg.format(search_station))
+        """
+        Finds the station with the code or name search_station, see
+        StationIndex.find
+        """
+        return get_station_index().find(search_station)
 
     def get_date_from_text(self, date_text, st_type="DEP"):
-        date_text = date_text.replace(" am", "am")
-        date_text = date_text.replace(" AM", "am")
-        date_text = date_text.replace(" pm", "pm")
-        date_text = date_text.replace(" PM", "pm")
-        date_text = date_text.replace(" o'clock", ":00")
-        date_text = date_text.replace(" oclock", ":00")
-        date_text = date_text.replace("o'clock", ":00")
-        date_text = date_text.replace("oclock", ":00")
-        try:
-            parse(date_text, fuzzy=True)
-        except ParserError:
+        date_time = get_date_extractor().extract(date_text)
+        if date_time is None:
             return None
         else:
-            ddp = DateDataParser(languages=['en'],
-                                 settings={'DATE_ORDER': 'DMY'})
-            date_time = ddp.get_date_data(date_text).date_obj
             date_time_now = datetime.now()
             if date_time and date_time <= date_time_now and st_type != "DLY":
                 return 2
@@ -320,6 +411,73 @@ class ChatEngine(KnowledgeEngine):
         bool
             True if extra info can be asked for from the user and false if not
         """
+        if st_type == "DEP":
+            token = "depart"
+        elif st_type == "ARR":
+            token = "arrive"
+        else:
+            raise UnknownStationTypeException(st_type)
+
+        search_station = None
+        recognised = get_station_index().recogniser.recognise(
+            doc, StationTriggers[st_type]
+        )
+        matches = self.get_matches(doc, token)
+
+        station = None
+        if recognised is not None:
+            search_station = recognised.text
+            # Already resolved unless the name is shared by several stations
+            station = recognised.station
+        elif matches is not None:
+            search_station = str(matches[1:])
+        elif "{TAG:" + st_type + "}" in message_text:
+            # the user has selected one of the selections which will be correct
+            search_station = message_text.replace("{TAG:" + st_type + "}", "")
+
+        if search_station:
+            tags, extra_info_appropriate = self.set_station(
+                search_station, tags, st_type, extra_info_appropriate,
+                station_name, station
+            )
+
+        return tags, extra_info_appropriate
+
+    def set_station(self, search_station, tags, st_type,
+                    extra_info_appropriate=True, station_name=0, station=None):
+        """
+        Looks up search_station and, if it's found, sets it as the arrival or
+        departure station. Otherwise the user is asked to pick from the
+        closest matches or try again.
+
+        Parameters
+        ----------
+        search_station: str
+            The station name or code to look up
+        tags: list of str
+            List of control tags to pass to the frontend to display relevant
+            feedback to the user
+        st_type: str
+            The station type (departure or arrival) that is being set
+            MUST be either "DEP" (departure) or "ARR" (arrival)
+        extra_info_appropriate: bool
+            True if the user can be asked for extra information or False
+            if it's not appropriate
+            default: True
+        station_name: int
+            0 to store the station code or 1 to store the station name
+            default: 0
+        station: tuple
+            The station row if search_station has already been resolved,
+            otherwise it's looked up
+            default: None
+        Returns
+        -------
+        list of str
+            The list of control tags to be passed to the frontend
+        bool
+            True if extra info can be asked for from the user and false if not
+        """
         if st_type == "DEP":
             # Departure Station
             found_mul_msg = ("I found a few departure stations that matched {}."
@@ -327,7 +485,6 @@ class ChatEngine(KnowledgeEngine):
             found_none_msg = ("I couldn't find any departure stations matching "
                               "{}. Please try again.")
             progress_tag = "dl_"
-            token = "depart"
             op_token = "arrive"
             noun_form = "departure"
         elif st_type == "ARR":
@@ -337,76 +494,91 @@ class ChatEngine(KnowledgeEngine):
             found_none_msg = ("I couldn't find any arrival stations matching {}"
                               ". Please try again.")
             progress_tag = "al_"
-            token = "arrive"
             op_token = "depart"
             noun_form = "arrival"
         else:
             raise UnknownStationTypeException(st_type)
 
-        search_station = None
-        matches = self.get_matches_from_multiple(doc,
-                                                 MultiTokenDictionary[token])
-
-        if matches is not None:
-            search_station = str(matches[1:])
-        elif "{TAG:" + st_type + "}" in message_text:
-            # the user has selected one of the selections which will be correct
-            search_station = message_text.replace("{TAG:" + st_type + "}", "")
-
-        if search_station:
-            try:
+        try:
+            if station is None:
                 station = self.find_station(search_station)
-                if (op_token in self.knowledge and
-                        station[station_name] == self.knowledge[op_token]):
-                    request_tag = "{REQ:" + st_type + "}"
-                    msg = ("{}The departure and arrival station cannot be the "
-                           "same. Please enter a new {} station")
-                    self.add_to_message_chain(msg.format(request_tag, 
-                                                         noun_form))
-                    extra_info_appropriate = False
-                else:
-                    tags += "{" + st_type + ":" + station[1] + "}"
-                    if st_type == "DEP":
-                        self.declare(Fact(depart=station[station_name]))
-                    else:
-                        self.declare(Fact(arrive=station[station_name]))
-                self.progress = self.progress.replace(progress_tag, "")
-            except StationNoMatchError as e:
-                extra_info_appropriate = False
-                self.add_to_message_chain(
-                    found_mul_msg.format(search_station),
-                    suggestions=["{TAG:" + st_type + "}" + alternative[1]
-                                 for alternative in e.alternatives]
-                )
-            except StationNotFoundError as e:
+            if (op_token in self.knowledge and
+                    station[station_name] == self.knowledge[op_token]):
+                request_tag = "{REQ:" + st_type + "}"
+                msg = ("{}The departure and arrival station cannot be the "
+                       "same. Please enter a new {} station")
+                self.add_to_message_chain(msg.format(request_tag, 
+                                                     noun_form))
                 extra_info_appropriate = False
-                self.add_to_message_chain(
-                    found_none_msg.format(search_station)
-                )
+            else:
+                tags += "{" + st_type + ":" + station[1] + "}"
+                if st_type == "DEP":
+                    self.set_fact(depart=station[station_name])
+                else:
+                    self.set_fact(arrive=station[station_name])
+            self.progress = self.progress.replace(progress_tag, "")
+        except StationNoMatchError as e:
+            extra_info_appropriate = False
+            self.add_to_message_chain(
+                found_mul_msg.format(search_station),
+                suggestions=["{TAG:" + st_type + "}" + alternative[1]
+                             for alternative in e.alternatives]
+            )
+        except StationNotFoundError as e:
+            extra_info_appropriate = False
+            self.add_to_message_chain(
+                found_none_msg.format(search_station)
+            )
 
         return tags, extra_info_appropriate
 
     def get_if_return(self, doc, message_text, tags, extra_info_appropriate):
         if "{TAG:RET}" in message_text:
-            ret = self.get_matches(doc, TokenDictionary['yes'])
+            ret = self.get_matches(doc, 'yes')
             if ret is None:
-                ret = self.get_matches(doc, TokenDictionary['return'])
-            sgl = self.get_matches(doc, TokenDictionary['no'])
+                ret = self.get_matches(doc, 'return')
+            sgl = self.get_matches(doc, 'no')
             if sgl is None:
-                sgl = self.get_matches(doc, TokenDictionary['single'])
+                sgl = self.get_matches(doc, 'single')
         else:
-            ret = self.get_matches(doc, TokenDictionary['return'])
-            sgl = self.get_matches(doc, TokenDictionary['single'])
-        if ret is not None and sgl is None:
+            ret = self.get_matches(doc, 'return')
+            sgl = self.get_matches(doc, 'single')
+        return self.set_return(ret is not None, sgl is not None, tags,
+                               extra_info_appropriate)
+
+    def set_return(self, ret, sgl, tags, extra_info_appropriate):
+        """
+        Sets whether the user is returning. If the user said both or neither
+        the return status is left unset
+
+        Parameters
+        ----------
+        ret: bool
+            True if the user said they're returning
+        sgl: bool
+            True if the user said they want a single
+        tags: list of str
+            List of control tags to pass to the frontend
+        extra_info_appropriate: bool
+            True if the user can be asked for extra information or False if it's
+            not appropriate
+        Returns
+        -------
+        list of str
+            The list of control tags to be passed to the frontend
+        bool
+            True if extra info can be asked for from the user and false if not
+        """
+        if ret and not sgl:
             tags += "{RET:RETURN}"
-            self.declare(Fact(returning=True))
+            self.set_fact(returning=True)
             self.progress = self.progress.replace("rs_", "")
-        elif sgl is not None and ret is None:
+        elif sgl and not ret:
             tags += "{RET:SINGLE}{RTM:N/A}"
-            self.declare(Fact(returning=False))
+            self.set_fact(returning=False)
             self.progress = self.progress.replace("rs_", "")
             self.progress = self.progress.replace("rt_", "")
-        elif sgl is not None and ret is not None:
+        elif sgl and ret:
             self.add_to_message_chain("{REQ:RET}Sorry, I don't understand. "
                                       "Are you returning? Try answering YES or "
                                       "NO.", 0, suggestions=["{TAG:RET} Yes",
@@ -414,30 +586,158 @@ class ChatEngine(KnowledgeEngine):
             extra_info_appropriate = False
         return tags, extra_info_appropriate
 
+    def set_count(self, st_type, count, tags):
+        """
+        Sets the number of adults (ADT), children (CHD) or minutes delayed
+        (DDL)
+
+        Parameters
+        ----------
+        st_type: str
+            The count being set, MUST be "ADT", "CHD" or "DDL"
+        count: str
+            The count as input by the user
+        tags: list of str
+            List of control tags to pass to the frontend
+
+        Returns
+        -------
+        list of str
+            The list of control tags to be passed to the frontend
+        """
+        fact_name, progress_tag = CountFacts[st_type]
+        self.set_fact(**{fact_name: int(count)})
+        self.progress = self.progress.replace(progress_tag, "")
+        return tags + "{" + st_type + ":" + count + "}"
+
+    def apply_control_tag(self, control, tags, extra_info_appropriate,
+                          station_name=0):
+        """
+        Sets the value of a control tag message directly, without NLP
+
+        Parameters
+        ----------
+        control: ControlTag
+            The parsed control tag message (see parse_control_tag)
+        tags: list of str
+            List of control tags to pass to the frontend
+        extra_info_appropriate: bool
+            True if the user can be asked for extra information or False if it's
+            not appropriate
+        station_name: int
+            0 to store station codes or 1 to store station names
+            default: 0
+        Returns
+        -------
+        list of str
+            The list of control tags to be passed to the frontend
+        bool
+            True if extra info can be asked for from the user and false if not
+        """
+        if control.tag in ["DEP", "ARR"]:
+            return self.set_station(control.value, tags, control.tag,
+                                    extra_info_appropriate, station_name)
+        if control.tag == "RET":
+            return self.set_return(control.value, not control.value, tags,
+                                   extra_info_appropriate)
+        return (self.set_count(control.tag, control.value, tags),
+                extra_info_appropriate)
+
+    def ask_question(self, action, detail):
+        """
+        Asks the user for a missing detail
+
+        Parameters
+        ----------
+        action: str
+            "book" or "delay"
+        detail: str
+            The fact to ask for, a key of Questions[action]
+        """
+        message, suggestions = Questions[action][detail]
+        self.add_to_message_chain(message, 1, suggestions=list(suggestions))
+        if detail == "departure_delay":
+            # only asked once, the user may not be delayed
+            self.set_fact(delay_time_received=True)
+
+    def next_question(self, action):
+        """
+        Gets the detail the ask rules would ask for next, with the same
+        conditions as the rules
+
+        Returns
+        -------
+        str or None
+            The key of Questions[action] or None if nothing is missing
+        """
+        for detail in Questions[action]:
+            if detail in self.knowledge:
+                continue
+            if (detail == "return_date" and
+                    self.knowledge.get("returning") is not True):
+                continue
+            if (detail == "departure_delay" and
+                    self.knowledge.get("delay_time_received")):
+                continue
+            return detail
+        return None
+
+    def answer_control_tag(self, message_text):
+        """
+        Answers a suggestion click (see parse_control_tag) without resetting
+        and running the engine. This is the booking_not_complete and
+        delay_not_complete rules followed by the ask rules, for turns where
+        nothing else can fire. Turns that would complete the booking or
+        delay prediction are left to the engine.
+
+        Parameters
+        ----------
+        message_text: str
+            The normalised message text passed by the user to the Chat class
+
+        Returns
+        -------
+        bool
+            True if the message was answered, False if the engine needs to
+            be run for it
+        """
+        control = parse_control_tag(message_text)
+        action = self.knowledge.get("action")
+        if (control is None or
+                control.tag not in ControlTagActions.get(action, []) or
+                self.knowledge.get("complete") or len(self.progress) == 0):
+            return False
+
+        before = (dict(self.knowledge), self.progress, list(self.message))
+        if len(self.message) == 0:
+            self.message = [self.def_message]
+        self.without_engine = True
+        try:
+            tags, extra_info_appropriate = self.apply_control_tag(
+                control, "", True, 1 if action == "delay" else 0
+            )
+            if len(self.progress) == 0:
+                self.knowledge, self.progress, self.message = before
+                return False
+            self.add_to_message_chain(tags, priority=7)
+            if extra_info_appropriate:
+                detail = self.next_question(action)
+                if detail is not None:
+                    self.ask_question(action, detail)
+        finally:
+            self.without_engine = False
+        self.turn = None
+        return True
+
     def get_dep_arr_date(self, message_text, tags, st_type="DEP",
                          extra_info_appropriate=True):
         if st_type not in ["DEP", "RET", "DLY"]:
             raise UnknownStationTypeException(st_type)
 
-        # replace times to be useful to SpaCy
-        if (message_text.find("am") > 0 and
-                not message_text[message_text.find("am") - 1].isspace()):
-            message_text = message_text.replace("am", " am")
-        if (message_text.find("AM") > 0 and
-                not message_text[message_text.find("AM") - 1].isspace()):
-            message_text = message_text.replace("AM", " am")
-        if (message_text.find("pm") > 0 and
-                not message_text[message_text.find("pm") - 1].isspace()):
-            message_text = message_text.replace("pm", " pm")
-        if (message_text.find("PM") > 0 and
-                not message_text[message_text.find("PM") - 1].isspace()):
-            message_text = message_text.replace("PM", " pm")
-
-        doc = self.nlp_engine.process(message_text)
-
-        dte = self.get_matches_from_multiple(
-            doc, MultiTokenDictionary[st_type.lower() + '_date']
-        )
+        # times are more useful to SpaCy with am/pm separated
+        doc = self.get_turn(message_text).time_doc
+
+        dte = self.get_matches(doc, st_type.lower() + '_date')
 
         if dte:
             date_time = self.get_date_from_text(str(dte[2:]), st_type)
@@ -486,6 +786,65 @@ class ChatEngine(KnowledgeEngine):
 
         return tags, extra_info_appropriate
 
+    def get_booking_details(self, turn, message_text, tags,
+                            extra_info_appropriate):
+        """
+        Uses NLP to get any booking details the user has provided in free text
+
+        Parameters
+        ----------
+        turn: TurnAnalysis
+            The analysis of the message text
+        message_text: str
+            The message text passed by the user to the Chat class
+        tags: list of str
+            List of control tags to pass to the frontend
+        extra_info_appropriate: bool
+            True if the user can be asked for extra information or False
+            if it's not appropriate
+        Returns
+        -------
+        list of str
+            The list of control tags to be passed to the frontend
+        bool
+            True if extra info can be asked for from the user and false if not
+        """
+        doc = turn.doc
+
+        for st_type in ["DEP", "ARR"]:
+            tags, extra_info_appropriate = self.get_dep_arr_station(
+                doc, message_text, tags, st_type, extra_info_appropriate
+            )
+
+        tags, extra_info_appropriate = self.get_if_return(
+            doc, message_text, tags, extra_info_appropriate
+        )
+
+        for st_type in ["DEP", "RET"]:
+            tags, extra_info_appropriate = self.get_dep_arr_date(
+                message_text, tags, st_type, extra_info_appropriate
+            )
+
+        if "{TAG:ADT}" in message_text:
+            adults_doc = turn.payload_doc("{TAG:ADT}")
+            adults = str(self.get_matches(adults_doc, 'dep_delay'))
+            tags = self.set_count("ADT", adults, tags)
+        else:
+            adults = self.get_matches(doc, 'num_adults')
+            if adults:
+                tags = self.set_count("ADT", str(adults[0]), tags)
+
+        if "{TAG:CHD}" in message_text:
+            children_doc = turn.payload_doc("{TAG:CHD}")
+            children = str(self.get_matches(children_doc, 'dep_delay'))
+            tags = self.set_count("CHD", children, tags)
+        else:
+            children = self.get_matches(doc, 'num_children')
+            if children:
+                tags = self.set_count("CHD", str(children[0]), tags)
+
+        return tags, extra_info_appropriate
+
     @DefFacts()
     def _initial_action(self):
         if len(self.message) == 0:
@@ -513,12 +872,13 @@ class ChatEngine(KnowledgeEngine):
         message_text: str
             The message text passed by the user to the Chat class
         """
-        doc = self.nlp_engine.process(message_text)
+        turn = self.get_turn(message_text)
+        if turn.control is not None:
+            # a suggestion was clicked, it won't be asking for a new action
+            return
+        doc = turn.doc
 
-        matcher = Matcher(self.nlp_engine.nlp.vocab)
-        matcher.add("BOOKING_PATTERN", None, TokenDictionary['book'])
-        matches = matcher(doc)
-        if len(matches) > 0:
+        if self.get_matches(doc, 'book') is not None:
             # likely to be a booking
             self.add_to_message_chain("Ok great, let's get your booking "
                                       "started! I'll put all the details on the"
@@ -526,19 +886,16 @@ class ChatEngine(KnowledgeEngine):
                                       req_response=False)
             self.progress = "dl_dt_al_rt_rs_na_nc_"
             self.modify(f1, action="book")
-        else:
-            matcher.add("DELAY_PATTERN", None, TokenDictionary['delay'])
-            matches = matcher(doc)
-            if len(matches) > 0:
-                # likely to be a delay prediction
-                self.add_to_message_chain("Using the latest train data, I can "
-                                          "predict how long you'll be delayed."
-                                          "<br><i>Only available from Norwich "
-                                          "to London Liverpool Street and "
-                                          "intermediate stations.</i>",
-                                          req_response=False)
-                self.progress = "dl_al_dt_dd_"
-                self.modify(f1, action="delay")
+        elif self.get_matches(doc, 'delay') is not None:
+            # likely to be a delay prediction
+            self.add_to_message_chain("Using the latest train data, I can "
+                                      "predict how long you'll be delayed."
+                                      "<br><i>Only available from Norwich "
+                                      "to London Liverpool Street and "
+                                      "intermediate stations.</i>",
+                                      req_response=False)
+            self.progress = "dl_al_dt_dd_"
+            self.modify(f1, action="delay")
 
     # BOOKING ACTIONS
     @Rule(Fact(action="book"),
@@ -563,55 +920,19 @@ class ChatEngine(KnowledgeEngine):
         message_text: str
             The message text passed by the user to the Chat class
         """
-        doc = self.nlp_engine.process(message_text)
+        turn = self.get_turn(message_text)
         tags = ""
         extra_info_appropriate = True
 
-        for st_type in ["DEP", "ARR"]:
-            tags, extra_info_appropriate = self.get_dep_arr_station(
-                doc, message_text, tags, st_type, extra_info_appropriate
-            )
-
-        tags, extra_info_appropriate = self.get_if_return(
-            doc, message_text, tags, extra_info_appropriate
-        )
-
-        for st_type in ["DEP", "RET"]:
-            tags, extra_info_appropriate = self.get_dep_arr_date(
-                message_text, tags, st_type, extra_info_appropriate
+        if (turn.control is not None and
+                turn.control.tag in ControlTagActions["book"]):
+            tags, extra_info_appropriate = self.apply_control_tag(
+                turn.control, tags, extra_info_appropriate
             )
-
-        if "{TAG:ADT}" in message_text:
-            adults_msg = message_text.replace("{TAG:ADT}", "")
-            adults_doc = self.nlp_engine.process(adults_msg)
-            adults = str(self.get_matches(adults_doc,
-                                          TokenDictionary['dep_delay']))
-            self.declare(Fact(no_adults=int(adults)))
-            self.progress = self.progress.replace("na_", "")
-            tags += "{ADT:" + adults + "}"
         else:
-            adults = self.get_matches(doc, TokenDictionary['num_adults'])
-            if adults:
-                adults = str(adults[0])
-                self.declare(Fact(no_adults=int(adults)))
-                self.progress = self.progress.replace("na_", "")
-                tags += "{ADT:" + adults + "}"
-
-        if "{TAG:CHD}" in message_text:
-            children_msg = message_text.replace("{TAG:CHD}", "")
-            children_doc = self.nlp_engine.process(children_msg)
-            children = str(self.get_matches(children_doc,
-                                            TokenDictionary['dep_delay']))
-            self.declare(Fact(no_children=int(children)))
-            self.progress = self.progress.replace("nc_", "")
-            tags += "{CHD:" + children + "}"
-        else:
-            children = self.get_matches(doc, TokenDictionary['num_children'])
-            if children:
-                children = str(children[0])
-                self.declare(Fact(no_children=int(children)))
-                self.progress = self.progress.replace("nc_", "")
-                tags += "{CHD:" + children + "}"
+            tags, extra_info_appropriate = self.get_booking_details(
+                turn, message_text, tags, extra_info_appropriate
+            )
 
         self.add_to_message_chain(tags, priority=7)
 
@@ -628,8 +949,7 @@ class ChatEngine(KnowledgeEngine):
           salience=98)
     def ask_for_departure(self):
         """Decides if need to ask user for the departure point"""
-        self.add_to_message_chain("{REQ:DEP}And where are you travelling from?",
-                                  1)
+        self.ask_question("book", "depart")
         self.declare(Fact(extra_info_requested=True))
 
     @Rule(Fact(action="book"),
@@ -639,7 +959,7 @@ class ChatEngine(KnowledgeEngine):
           salience=97)
     def ask_for_departure_date(self):
         """Decides if need to ask user for the arrival point"""
-        self.add_to_message_chain("{REQ:DDT}When do you want to depart?", 1)
+        self.ask_question("book", "departure_date")
         self.declare(Fact(extra_info_requested=True))
 
     @Rule(Fact(action="book"),
@@ -649,8 +969,7 @@ class ChatEngine(KnowledgeEngine):
           salience=96)
     def ask_for_arrival(self):
         """Decides if need to ask user for the arrival point"""
-        self.add_to_message_chain("{REQ:ARR}And where are you travelling to?",
-                                  1)
+        self.ask_question("book", "arrive")
         self.declare(Fact(extra_info_requested=True))
 
     @Rule(Fact(action="book"),
@@ -660,8 +979,7 @@ class ChatEngine(KnowledgeEngine):
           salience=95)
     def ask_for_return(self):
         """Decides if need to ask user whether they're returning"""
-        self.add_to_message_chain("{REQ:RET}Are you returning?", 1,
-                                  suggestions=["{TAG:RET}👍", "{TAG:RET}👎"])
+        self.ask_question("book", "returning")
         self.declare(Fact(extra_info_requested=True))
 
     @Rule(Fact(action="book"),
@@ -672,7 +990,7 @@ class ChatEngine(KnowledgeEngine):
           salience=94)
     def ask_for_return_date(self):
         """Decides if need to ask user whether they're returning"""
-        self.add_to_message_chain("{REQ:RTD}And when are you returning?", 1)
+        self.ask_question("book", "return_date")
         self.declare(Fact(extra_info_requested=True))
 
     @Rule(AS.adults << Fact(no_adults=0),
@@ -695,13 +1013,7 @@ class ChatEngine(KnowledgeEngine):
           salience=92)
     def ask_for_no_adults(self):
         """Decides if need to ask user for number of adults"""
-        self.add_to_message_chain("{REQ:ADT}How many adults (16+) will be "
-                                  "travelling?", 1,
-                                  suggestions=["{TAG:ADT}0", "{TAG:ADT}1",
-                                               "{TAG:ADT}2", "{TAG:ADT}3",
-                                               "{TAG:ADT}4", "{TAG:ADT}5",
-                                               "{TAG:ADT}6", "{TAG:ADT}7",
-                                               "{TAG:ADT}8", "{TAG:ADT}9"])
+        self.ask_question("book", "no_adults")
         self.declare(Fact(extra_info_requested=True))
 
     @Rule(Fact(action="book"),
@@ -711,13 +1023,7 @@ class ChatEngine(KnowledgeEngine):
           salience=91)
     def ask_for_no_children(self):
         """Decides if need to ask user for number of children"""
-        self.add_to_message_chain("{REQ:CHD}How many children (under 16) will "
-                                  "be travelling?", 1,
-                                  suggestions=["{TAG:CHD}0", "{TAG:CHD}1",
-                                               "{TAG:CHD}2", "{TAG:CHD}3",
-                                               "{TAG:CHD}4", "{TAG:CHD}5",
-                                               "{TAG:CHD}6", "{TAG:CHD}7",
-                                               "{TAG:CHD}8", "{TAG:CHD}9"])
+        self.ask_question("book", "no_children")
         self.declare(Fact(extra_info_requested=True))
 
     @Rule(Fact(action="book"),
@@ -813,7 +1119,7 @@ class ChatEngine(KnowledgeEngine):
         message_text: str
             The message text passed by the user to the Chat class
         """
-        doc = self.nlp_engine.process(message_text)
+        turn = self.get_turn(message_text)
         tags = ""
         extra_info_appropriate = True
 
@@ -821,24 +1127,28 @@ class ChatEngine(KnowledgeEngine):
             self.modify(f1, complete=True)
             self.progress = "ENGINE"
 
-        for st_type in ["DEP", "ARR"]:
-            tags, extra_info_appropriate = self.get_dep_arr_station(
-                doc, message_text, tags, st_type, extra_info_appropriate, 1
+        if (turn.control is not None and
+                turn.control.tag in ControlTagActions["delay"]):
+            tags, extra_info_appropriate = self.apply_control_tag(
+                turn.control, tags, extra_info_appropriate, 1
             )
+        else:
+            doc = turn.doc
 
-        for st_type in ["DLY"]:
-            tags, extra_info_appropriate = self.get_dep_arr_date(
-                message_text, tags, st_type, extra_info_appropriate
-            )
+            for st_type in ["DEP", "ARR"]:
+                tags, extra_info_appropriate = self.get_dep_arr_station(
+                    doc, message_text, tags, st_type, extra_info_appropriate, 1
+                )
+
+            for st_type in ["DLY"]:
+                tags, extra_info_appropriate = self.get_dep_arr_date(
+                    message_text, tags, st_type, extra_info_appropriate
+                )
 
-        if "{TAG:DDL}" in message_text:
-            dep_delay = message_text.replace("{TAG:DDL}", "")
-            dep_delay_doc = self.nlp_engine.process(dep_delay)
-            dep_delay_doc = str(self.get_matches(dep_delay_doc,
-                                                 TokenDictionary['dep_delay']))
-            self.declare(Fact(departure_delay = int(dep_delay_doc)))
-            self.progress = self.progress.replace("dd_", "")
-            tags += "{DDL:" + str(dep_delay_doc) + "}"
+            if "{TAG:DDL}" in message_text:
+                dep_delay_doc = turn.payload_doc("{TAG:DDL}")
+                dep_delay = str(self.get_matches(dep_delay_doc, 'dep_delay'))
+                tags = self.set_count("DDL", dep_delay, tags)
 
         self.add_to_message_chain(tags, priority=7)
 
@@ -856,8 +1166,7 @@ class ChatEngine(KnowledgeEngine):
           salience=98)
     def departure_delay(self):
         """Decides if need to ask user for the departure point"""
-        self.add_to_message_chain("{REQ:DEP}Where are you travelling from?",
-                                  1)
+        self.ask_question("delay", "depart")
         self.declare(Fact(extra_info_requested=True))
 
     @Rule(Fact(action="delay"),
@@ -867,8 +1176,7 @@ class ChatEngine(KnowledgeEngine):
           salience=97)
     def arrival_delay(self):
         """Decides if need to ask user for the arrival point"""
-        self.add_to_message_chain("{REQ:ARR}Where are you travelling to?",
-                                  1)
+        self.ask_question("delay", "arrive")
         self.declare(Fact(extra_info_requested=True))
 
     @Rule(Fact(action="delay"),
@@ -878,9 +1186,7 @@ class ChatEngine(KnowledgeEngine):
           salience=96)
     def departure_time(self):
         """Decides if need to ask user for the arrival point"""
-        self.add_to_message_chain("{REQ:DDT}What time were you expecting "
-                                  "to depart the station?",
-                                  1)
+        self.ask_question("delay", "departure_date")
         self.declare(Fact(extra_info_requested=True))
 
     @Rule(Fact(action="delay"),
@@ -890,10 +1196,8 @@ class ChatEngine(KnowledgeEngine):
           NOT(Fact(delay_time_received=True)),
           salience=95)
     def delay_time(self):
-        self.add_to_message_chain("{REQ:DDL}How long are you delayed?",
-                                  1)
+        self.ask_question("delay", "departure_delay")
         self.declare(Fact(extra_info_requested=True))
-        self.declare(Fact(delay_time_received=True))
 
     @Rule(Fact(action="delay"),
           Fact(complete=True),
@@ -0,0 +1,157 @@
+"""
+Sessions.py
+
+Keeps hold of the Chat belonging to each browser session
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class ChatRegistry:
+    def __init__(self, max_entries=1000, ttl=1800, clock=time.monotonic):
+        """
+        A bounded store of the active chats keyed by session ID. The least
+        recently used chat is evicted once max_entries is reached and chats
+        that have been idle for longer than ttl seconds are expired. Every
+        chat that leaves the registry is closed so its resources (e.g. the
+        ChatEngine's DBConnection) are released straight away.
+
+        Parameters
+        ----------
+        max_entries: int
+            The maximum number of chats to hold at any one time
+        ttl: int or float
+            The number of seconds a chat can be idle before it is expired
+        clock: callable
+            Returns the current time in seconds, only replaced in tests
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._chats = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._chats)
+
+    def __contains__(self, chat_id):
+        return chat_id in self._chats
+
+    def get(self, chat_id):
+        """
+        Gets the chat for chat_id and marks it as recently used
+
+        Parameters
+        ----------
+        chat_id: str
+            The session ID the chat was stored against
+
+        Returns
+        -------
+        Chat or None
+            The chat or None if there is no chat (or it has expired)
+        """
+        with self._lock:
+            closing = self._expire()
+            entry = self._chats.get(chat_id) if chat_id else None
+            if entry is None:
+                self.misses += 1
+                chat = None
+            else:
+                self.hits += 1
+                entry[1] = self.clock()
+                self._chats.move_to_end(chat_id)
+                chat = entry[0]
+        self._close(closing)
+        return chat
+
+    def put(self, chat_id, chat):
+        """
+        Stores chat against chat_id, replacing (and closing) any chat that
+        was already stored against it
+
+        Parameters
+        ----------
+        chat_id: str
+            The session ID to store the chat against
+        chat: Chat
+            The chat to store
+        """
+        with self._lock:
+            closing = self._expire()
+            old_entry = self._chats.pop(chat_id, None)
+            if old_entry is not None and old_entry[0] is not chat:
+                closing.append(old_entry[0])
+            self._chats[chat_id] = [chat, self.clock()]
+            while len(self._chats) > self.max_entries:
+                _, (evicted, _) = self._chats.popitem(last=False)
+                self.evictions += 1
+                closing.append(evicted)
+        self._close(closing)
+
+    def remove(self, chat_id):
+        """Removes and closes the chat stored against chat_id, if any"""
+        with self._lock:
+            entry = self._chats.pop(chat_id, None)
+        if entry is not None:
+            self._close([entry[0]])
+
+    def clear(self):
+        """Removes and closes every chat in the registry"""
+        with self._lock:
+            closing = [entry[0] for entry in self._chats.values()]
+            self._chats.clear()
+        self._close(closing)
+
+    def stats(self):
+        """
+        Returns
+        -------
+        dict
+            The current size and limits of the registry along with the hit,
+            miss, eviction and expiration counts
+        """
+        with self._lock:
+            return {"active": len(self._chats),
+                    "max_entries": self.max_entries,
+                    "ttl": self.ttl,
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "evictions": self.evictions,
+                    "expirations": self.expirations}
+
+    def _expire(self):
+        """
+        Pops every chat that has been idle for longer than the TTL. Chats are
+        kept in order of last use so only the front of the dict is checked.
+        Must be called with the lock held.
+
+        Returns
+        -------
+        list
+            The expired chats, to be closed once the lock is released
+        """
+        expired = []
+        cutoff = self.clock() - self.ttl
+        while self._chats:
+            chat_id, (chat, last_seen) = next(iter(self._chats.items()))
+            if last_seen > cutoff:
+                break
+            del self._chats[chat_id]
+            self.expirations += 1
+            expired.append(chat)
+        return expired
+
+    @staticmethod
+    def _close(chats):
+        for chat in chats:
+            try:
+                chat.close()
+            except Exception as e:
+                print(e)
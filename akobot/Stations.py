@@ -0,0 +1,329 @@
+"""
+Stations.py
+
+Contains classes related to finding stations
+"""
+import heapq
+import os
+import re
+import threading
+from collections import Counter, defaultdict, namedtuple
+from itertools import chain
+from difflib import SequenceMatcher
+from sqlite3 import Error
+
+from Database.DatabaseConnector import DBConnection, database_path
+from akobot import StationNoMatchError, StationNotFoundError
+
+
+def get_similarity(comparator_a, comparator_b):
+    """
+
+    Parameters
+    ----------
+    comparator_a: tuple
+        The tuple from the database when searching for identifier, name
+        from main.Stations table
+    comparator_b: str
+        The departure point input by the user
+    Returns
+    -------
+    float
+        The SequenceMatcher produced ration between the station name from
+        the database and the departure point passed in by the user
+    """
+    comparator_a = comparator_a[1].replace("(" + comparator_b + ")", "")
+    ratio = SequenceMatcher(None, comparator_a.lower(),
+                            comparator_b.lower()).ratio() * 100
+    if comparator_b.lower() in comparator_a.lower():
+        ratio += 25
+    if comparator_b.lower().startswith(comparator_a.lower()):
+        ratio += 25
+    return ratio
+
+
+def get_trigrams(text):
+    """
+    Splits text into its character trigrams, padded so that short strings
+    and the start and end of words still produce trigrams
+
+    Parameters
+    ----------
+    text: str
+        The (lower case) text to split
+
+    Returns
+    -------
+    set of str
+        The trigrams in text
+    """
+    text = " " + text + " "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+StationMatch = namedtuple("StationMatch", ["start", "end", "text",
+                                           "station"])
+FirstWordPattern = re.compile(r"[^\s]+")
+
+
+def get_first_word(text):
+    """Gets the first word of text without any trailing punctuation"""
+    match = FirstWordPattern.match(text)
+    return match.group(0).rstrip(".,!?;:") if match else ""
+
+
+class StationRecogniser:
+    def __init__(self, station_index):
+        """
+        A gazetteer of every station name and code, used to find stations
+        mentioned in a message. Phrases are grouped by their first word and
+        sorted longest first so the longest station name is always the one
+        matched (e.g. "london liverpool street" rather than "london").
+
+        Parameters
+        ----------
+        station_index: StationIndex
+            The index the station names and codes are taken from
+        """
+        self.station_index = station_index
+        self.phrases = defaultdict(set)
+        for code, name in station_index.stations:
+            for phrase in [code.lower(), name.lower()]:
+                self.phrases[get_first_word(phrase)].add(phrase)
+        self.phrases = {word: sorted(phrases, key=len, reverse=True)
+                        for word, phrases in self.phrases.items()}
+
+    def match_at(self, text, start=0):
+        """
+        Gets the longest station name or code at position start of text
+
+        Parameters
+        ----------
+        text: str
+            The text to search
+        start: int
+            The character offset the station must start at
+
+        Returns
+        -------
+        StationMatch or None
+            The matched station or None if there isn't a station at start
+        """
+        lower_text = text.lower()
+        for phrase in self.phrases.get(get_first_word(lower_text[start:]), []):
+            end = start + len(phrase)
+            if (lower_text.startswith(phrase, start) and
+                    (end == len(text) or not text[end].isalnum())):
+                station = self.station_index.by_code.get(phrase)
+                if station is None:
+                    stations = self.station_index.by_name[phrase]
+                    station = stations[0] if len(stations) == 1 else None
+                return StationMatch(start, end, text[start:end], station)
+        return None
+
+    def recognise(self, doc, triggers):
+        """
+        Finds the first station that directly follows one of the trigger
+        words (e.g. "from" or "to") in doc
+
+        Parameters
+        ----------
+        doc: spacy.Doc
+            The processed message text
+        triggers: list of str
+            The lemmas of the words that can come before the station
+
+        Returns
+        -------
+        StationMatch or None
+            The station found, with its character offsets in the text. The
+            station is None if more than one station has the matched name
+        """
+        for token in doc:
+            if token.lemma_.lower() in triggers or token.lower_ in triggers:
+                start = token.idx + len(token.text)
+                while start < len(doc.text) and doc.text[start].isspace():
+                    start += 1
+                match = self.match_at(doc.text, start)
+                if match is not None:
+                    return match
+        return None
+
+
+class StationIndex:
+    def __init__(self, stations):
+        """
+        An in-memory index of every station, for exact lookups by code or
+        name and fuzzy lookups by name
+
+        Parameters
+        ----------
+        stations: iterable of tuple
+            The (identifier, name) rows from main.Stations
+        """
+        self.stations = [(station[0], station[1]) for station in stations]
+        self.by_code = {}
+        self.by_name = defaultdict(list)
+        self.trigrams = defaultdict(list)
+        self.trigram_counts = []
+        for i, station in enumerate(self.stations):
+            self.by_code.setdefault(station[0].lower(), station)
+            self.by_name[station[1].lower()].append(station)
+            grams = get_trigrams(station[1].lower())
+            for gram in grams:
+                self.trigrams[gram].append(i)
+            self.trigram_counts.append(len(grams))
+        self.recogniser = StationRecogniser(self)
+
+    @classmethod
+    def from_database(cls, db_file_name='AKODatabase.db'):
+        """Builds the index from the main.Stations table"""
+        db_connection = DBConnection(db_file_name)
+        try:
+            query = "SELECT identifier, name FROM main.Stations"
+            return cls(db_connection.send_query(query).fetchall())
+        finally:
+            db_connection.close()
+
+    def __len__(self):
+        return len(self.stations)
+
+    def find(self, search_station):
+        """
+        Finds the station with the code or name search_station (case
+        insensitive)
+
+        Parameters
+        ----------
+        search_station: str
+            The station code or name input by the user
+
+        Returns
+        -------
+        tuple
+            The (identifier, name) of the station
+
+        Raises
+        ------
+        StationNoMatchError
+            If there isn't exactly one match, alternatives holds the closest
+            three stations
+        StationNotFoundError
+            If there are no stations at all
+        """
+        station = self.by_code.get(search_station.lower())
+        if station is not None:
+            return station
+        # Station code not input - try searching by station name
+        stations = self.by_name.get(search_station.lower(), [])
+        if len(stations) == 1:
+            return stations[0]
+        # Try finding stations with names close to input name
+        if not self.stations:
+            msg = "Unable to find station {}"
+            raise StationNotFoundError(msg.format(search_station))
+        raise StationNoMatchError(self.closest(search_station))
+
+    def closest(self, search_station, k=3, shortlist=5):
+        """
+        Finds the k stations with names closest to search_station. Stations
+        sharing the most trigrams with search_station are shortlisted and the
+        shortlist is ranked by get_similarity, so only a handful of stations
+        are compared in full however many there are.
+
+        Parameters
+        ----------
+        search_station: str
+            The station name input by the user
+        k: int
+            The number of stations to return
+        shortlist: int
+            The number of stations per result to rank by get_similarity
+
+        Returns
+        -------
+        list of tuple
+            The (identifier, name) of the closest stations, closest first
+        """
+        grams = get_trigrams(search_station.lower())
+        shared = Counter(chain.from_iterable(self.trigrams.get(gram, [])
+                                             for gram in grams))
+
+        if len(shared) >= k:
+            # Dice coefficient of the trigram sets
+            candidates = heapq.nlargest(
+                k * shortlist, shared,
+                key=lambda i: (2 * shared[i] /
+                               (len(grams) + self.trigram_counts[i]))
+            )
+            candidates = [self.stations[i] for i in candidates]
+        else:
+            # Too few stations share a trigram so compare against them all
+            candidates = self.stations
+
+        return heapq.nlargest(
+            k, candidates,
+            key=lambda station: get_similarity(station, search_station)
+        )
+
+
+_station_index = None
+_station_index_version = None
+_station_index_lock = threading.Lock()
+
+
+def get_stations_version(db_file_name='AKODatabase.db'):
+    """
+    Gets the version of main.Stations, which the triggers added by migration
+    4 (see Database/Migrations.py) count up whenever a station changes
+
+    Returns
+    -------
+    int or None
+        The version or None if the database hasn't been migrated
+    """
+    db_connection = DBConnection(db_file_name)
+    try:
+        row = db_connection.send_query(
+            "SELECT version FROM main.TableVersions WHERE name = 'Stations'"
+        ).fetchone()
+    except Error:
+        return None
+    finally:
+        db_connection.close()
+    return None if row is None else row[0]
+
+
+def get_station_index(db_file_name='AKODatabase.db'):
+    """
+    Gets the StationIndex shared by every ChatEngine in this process. It is
+    built the first time this is called and rebuilt whenever main.Stations
+    changes.
+
+    Parameters
+    ----------
+    db_file_name: str
+        The database file holding main.Stations
+
+    Returns
+    -------
+    StationIndex
+        The index of every station
+    """
+    global _station_index, _station_index_version
+    version = [db_file_name, get_stations_version(db_file_name)]
+    if version[1] is None:
+        # Without the version any write could have changed the stations.
+        # Writes land in the write-ahead log until it is checkpointed.
+        for suffix in ["", "-wal"]:
+            try:
+                stat = os.stat(database_path(db_file_name) + suffix)
+                version += [stat.st_mtime_ns, stat.st_size]
+            except OSError:
+                version += [None, None]
+    if _station_index is None or _station_index_version != version:
+        with _station_index_lock:
+            if _station_index is None or _station_index_version != version:
+                _station_index = StationIndex.from_database(db_file_name)
+                _station_index_version = version
+    return _station_index
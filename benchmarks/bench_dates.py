@@ -0,0 +1,75 @@
+"""
+bench_dates.py
+
+Times DateExtractor over a corpus of typical date phrases against the
+approach ChatEngine.get_date_from_text used to take (a new DateDataParser
+for every call). Run from the repository root:
+
+    python benchmarks/bench_dates.py
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+currentdir = os.path.dirname(os.path.realpath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.append(parentdir)
+
+from dateparser.date import DateDataParser
+from dateutil.parser import parse, ParserError
+
+from akobot.Dates import DateExtractor, normalise_date_text
+
+CORPUS = ["17:30", "7pm", "7:30 pm", "9 AM", "6 o'clock", "tomorrow at 9",
+          "9am tomorrow", "today at 18:15", "tomorrow 07:05", "12pm",
+          "next friday at 9am", "1st April at 10:30", "monday 8am",
+          "25/12/2021 14:00", "in 2 hours", "this evening"]
+
+
+def old_get_date(date_text):
+    date_text = normalise_date_text(date_text)
+    try:
+        parse(date_text, fuzzy=True)
+    except ParserError:
+        return None
+    ddp = DateDataParser(languages=['en'], settings={'DATE_ORDER': 'DMY'})
+    return ddp.get_date_data(date_text).date_obj
+
+
+def time_calls(function, repeats):
+    timings = []
+    for _ in range(repeats):
+        for phrase in CORPUS:
+            start = time.perf_counter()
+            function(phrase)
+            timings.append((time.perf_counter() - start) * 1000)
+    return sorted(timings)
+
+
+def report(name, timings):
+    print("{:<18} mean {:8.3f} ms   p50 {:8.3f} ms   p99 {:8.3f} ms".format(
+        name, statistics.mean(timings), statistics.median(timings),
+        timings[int(len(timings) * 0.99) - 1]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time date extraction")
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    # load dateparser's language data before timing anything
+    old_get_date(CORPUS[0])
+
+    report("new parser/call", time_calls(old_get_date, args.repeats))
+
+    extractor = DateExtractor(cache_size=0)
+    report("extractor, no LRU", time_calls(extractor.extract, args.repeats))
+
+    extractor = DateExtractor()
+    report("extractor, LRU", time_calls(extractor.extract, args.repeats))
+
+
+if __name__ == '__main__':
+    main()
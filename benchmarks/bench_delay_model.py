@@ -0,0 +1,59 @@
+"""
+bench_delay_model.py
+
+Reports the latency of a delay prediction when the model has to be trained
+(cold), loaded from disk by a fresh process (cold load) and reused from
+memory (warm). Run from the repository root:
+
+    python benchmarks/bench_delay_model.py norwich diss
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+currentdir = os.path.dirname(os.path.realpath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.append(parentdir)
+
+
+def time_prediction(predictions_class, args):
+    start = time.perf_counter()
+    predictions_class().display_results(args.from_station, args.to_station,
+                                        args.departure, args.delay)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time cold and warm delay predictions")
+    parser.add_argument("from_station")
+    parser.add_argument("to_station")
+    parser.add_argument("--departure", default="07:30")
+    parser.add_argument("--delay", default="4")
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    # Train into an empty directory so the first prediction is really cold
+    os.environ['AKOBOT_MODEL_DIR'] = tempfile.mkdtemp(prefix="akobot_models")
+
+    from DelayPrediction import ModelStore
+    from DelayPrediction.newPrediction import Predictions
+
+    cold = time_prediction(Predictions, args)
+    # A new store has nothing in memory so has to load the model from disk
+    ModelStore._model_store = ModelStore.ModelStore(
+        os.environ['AKOBOT_MODEL_DIR'])
+    cold_load = time_prediction(Predictions, args)
+    warm = [time_prediction(Predictions, args) for _ in range(args.repeats)]
+
+    print("cold (train + save): {:9.1f} ms".format(cold))
+    print("cold (load):         {:9.1f} ms".format(cold_load))
+    print("warm p50:            {:9.1f} ms".format(statistics.median(warm)))
+    print("warm max:            {:9.1f} ms".format(max(warm)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+bench_feature_store.py
+
+Reports the peak RSS and latency of a cold Predictions.predict (one that has
+to train the model) when the training data is queried from the database and
+copied into a DataFrame (before) and when it is memory mapped from the
+feature store (after). Each runs in a fresh process with empty model
+directories. Run from the repository root:
+
+    python benchmarks/bench_feature_store.py norwich london liverpool street
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+currentdir = os.path.dirname(os.path.realpath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.append(parentdir)
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(mode, from_station, to_station):
+    from DelayPrediction.ModelStore import FEATURE_COLUMNS
+    from DelayPrediction.newPrediction import Predictions
+
+    predictions = Predictions()
+    if mode == "query":
+        # What predict did before the feature store
+        def training_data():
+            journeys = predictions.prepare_datasets()
+            return (journeys[FEATURE_COLUMNS].values,
+                    journeys['arrival_time'].values)
+        predictions.training_data = training_data
+
+    before = peak_rss_mb()
+    start = time.perf_counter()
+    predictions.display_results(from_station, to_station, "07:30", "4")
+    elapsed = (time.perf_counter() - start) * 1000
+    print(json.dumps({"mode": mode, "ms": elapsed, "peak_before": before,
+                      "peak_after": peak_rss_mb()}))
+
+
+def run_child(mode, args, feature_dir):
+    env = dict(os.environ,
+               AKOBOT_MODEL_DIR=tempfile.mkdtemp(prefix="akobot_models"),
+               AKOBOT_FEATURE_DIR=feature_dir,
+               AKOBOT_SLOW_QUERY_MS="1e9")
+    output = subprocess.run([sys.executable, __file__, "--child", mode,
+                             args.from_station, args.to_station],
+                            env=env, stdout=subprocess.PIPE, check=True,
+                            universal_newlines=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare cold predictions with and without the feature "
+                    "store")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("from_station")
+    parser.add_argument("to_station", nargs="+")
+    args = parser.parse_args()
+    args.to_station = " ".join(args.to_station)
+
+    if args.child:
+        child(args.child, args.from_station, args.to_station)
+        return
+
+    feature_dir = tempfile.mkdtemp(prefix="akobot_features")
+    query = run_child("query", args, feature_dir)
+    # The first run builds the store, the second maps it
+    run_child("store", args, feature_dir)
+    store = run_child("store", args, feature_dir)
+
+    for result in [query, store]:
+        print("{:6} cold predict {:8.1f} ms   peak RSS {:7.1f} MB "
+              "(+{:.1f} MB during predict)".format(
+                  result["mode"], result["ms"], result["peak_after"],
+                  result["peak_after"] - result["peak_before"]))
+
+
+if __name__ == '__main__':
+    main()
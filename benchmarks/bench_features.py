@@ -0,0 +1,117 @@
+"""
+bench_features.py
+
+Compares building the prediction dataset row by row, as
+Predictions.prepare_datasets used to, with the vectorised
+DelayPrediction.Features.build_features. By default every journey between
+every pair of stations in main.Data is used. Run from the repository root:
+
+    python benchmarks/bench_features.py
+    python benchmarks/bench_features.py --from NRCH --to DISS
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+currentdir = os.path.dirname(os.path.realpath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.append(parentdir)
+
+import numpy as np
+
+from Database.DatabaseConnector import DBConnection
+from DelayPrediction.Features import build_features
+from DelayPrediction.newPrediction import Predictions
+
+
+def seconds(time_text):
+    return (datetime.strptime(time_text, '%H:%M') -
+            datetime(1900, 1, 1)).total_seconds()
+
+
+def build_features_by_row(result):
+    """The loop Predictions.prepare_datasets used before build_features"""
+    data = []
+    rejected = 0
+    for journey in result:
+        if (journey[2] != '' and journey[3] != '' and
+                journey[5] != '' and journey[6] != ''):
+            rid = str(journey[0])
+            try:
+                day_of_week = datetime(int(rid[:4]), int(rid[4:6]),
+                                       int(rid[6:8])).weekday()
+                hour_of_day = int(journey[3].split(":")[0])
+                minute_of_day = int(journey[3].split(":")[1])
+                time_dep = seconds(journey[3])
+                journey_delay = seconds(journey[3]) - seconds(journey[2])
+                time_arr = seconds(journey[6]) - seconds(journey[5])
+            except ValueError:
+                rejected += 1
+                continue
+            data.append([rid, time_dep, journey_delay, day_of_week,
+                         Predictions.is_weekend(day_of_week),
+                         Predictions.check_day_segment(hour_of_day),
+                         Predictions.is_rush_hour(hour_of_day,
+                                                  minute_of_day) or 0,
+                         time_arr])
+        else:
+            rejected += 1
+    return data, rejected
+
+
+def best_of(repeats, function, *args):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function(*args)
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time row by row and vectorised feature building")
+    parser.add_argument("--from", dest="from_station",
+                        help="departure station code, default every station")
+    parser.add_argument("--to", dest="to_station",
+                        help="arrival station code, default every station")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    query = """
+        SELECT x.rid, x.tpl, x.ptd, x.dep_at, y.tpl, y.pta, y.arr_at
+        FROM main.Data AS x JOIN main.Data AS y
+            ON x.rid = y.rid AND x.tpl != y.tpl
+        WHERE (? IS NULL OR x.tpl = ?) AND (? IS NULL OR y.tpl = ?)"""
+    db_connection = DBConnection('AKODatabase.db')
+    start = time.perf_counter()
+    result = db_connection.send_query(
+        query, (args.from_station, args.from_station, args.to_station,
+                args.to_station)).fetchall()
+    query_ms = (time.perf_counter() - start) * 1000
+    db_connection.close()
+
+    by_row_ms, (by_row, by_row_rejected) = best_of(
+        args.repeats, build_features_by_row, result)
+    vectorised_ms, (vectorised, rejected) = best_of(
+        args.repeats, build_features, result)
+
+    by_row = np.array([row[1:] for row in by_row], dtype=np.float64)
+    same = (by_row.shape == vectorised.values[:, 1:].shape and
+            np.array_equal(by_row,
+                           vectorised.values[:, 1:].astype(np.float64)))
+
+    print("journeys:       {}".format(len(result)))
+    print("query:          {:9.1f} ms".format(query_ms))
+    print("row by row:     {:9.1f} ms ({} rejected)".format(by_row_ms,
+                                                             by_row_rejected))
+    print("vectorised:     {:9.1f} ms ({} rejected)".format(vectorised_ms,
+                                                             rejected))
+    print("speedup:        {:9.1f}x".format(by_row_ms / vectorised_ms))
+    print("same features:  {}".format(same))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""
+bench_harvest.py
+
+Records EXPLAIN QUERY PLAN and timings of Predictions.harvest_data for every
+pair of corridor stations, before (string formatted query, no indexes) and
+after (bound parameters, SQL null filtering and the indexes from
+Database/Migrations.py). Both run against temporary copies of the database
+so it isn't changed. Run from the repository root:
+
+    python benchmarks/bench_harvest.py
+    python benchmarks/bench_harvest.py --csv harvest.csv
+"""
+import argparse
+import csv
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+currentdir = os.path.dirname(os.path.realpath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.append(parentdir)
+
+from Database import Migrations
+from Database.DatabaseConnector import database_path
+
+# Corridor order, Norwich to London Liverpool Street
+CORRIDOR = ["NRCH", "DISS", "STWMRKT", "IPSWICH", "MANNGTR", "CLCHSTR",
+            "WITHAME", "CHLMSFD", "INT", "SHENFLD", "STFD", "LIVST"]
+
+BEFORE_QUERY = """
+    SELECT rid_FROM, tpl_FROM, ptd, dep_at, tpl_TO, pta, arr_at FROM
+        (SELECT rid AS rid_FROM, tpl AS tpl_FROM, ptd, dep_at 
+         FROM main.Data WHERE tpl = '{0}') AS x JOIN
+        (SELECT rid AS rid_TO, tpl AS tpl_TO, pta, arr_at FROM main.Data 
+         WHERE tpl = '{1}') AS y on x.rid_FROM = y.rid_TO 
+        ORDER BY rid_FROM """
+
+AFTER_QUERY = """
+    SELECT x.rid, x.tpl, x.ptd, x.dep_at, y.tpl, y.pta, y.arr_at
+    FROM main.Data AS x INDEXED BY DataDepartures
+        JOIN main.Data AS y INDEXED BY DataArrivals ON y.rid = x.rid
+    WHERE x.tpl = ? AND y.tpl = ?
+        AND x.ptd != '' AND x.dep_at != ''
+        AND y.pta != '' AND y.arr_at != ''
+    ORDER BY x.rid"""
+
+
+def best_of(repeats, conn, query, params):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        rows = conn.execute(query, params).fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings), len(rows)
+
+
+def query_plan(conn, query, params):
+    return "; ".join(row[-1] for row in
+                     conn.execute("EXPLAIN QUERY PLAN " + query, params))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare harvest_data before and after indexing")
+    parser.add_argument("--db", default="AKODatabase.db")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--csv", help="also write the results to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="akobot_harvest")
+    before_path = os.path.join(workdir, "before.db")
+    after_path = os.path.join(workdir, "after.db")
+    shutil.copy(database_path(args.db), before_path)
+    shutil.copy(database_path(args.db), after_path)
+
+    before = sqlite3.connect(before_path)
+    for version, description, statements in Migrations.MIGRATIONS:
+        for statement in statements:
+            if statement.split()[:2] in (["CREATE", "INDEX"],
+                                         ["CREATE", "UNIQUE"]):
+                name = statement.split("EXISTS")[1].split()[0]
+                before.execute("DROP INDEX IF EXISTS " + name)
+    before.execute("PRAGMA user_version = 0")
+    before.commit()
+    Migrations.migrate(after_path)
+    after = sqlite3.connect(after_path)
+
+    present = {row[0] for row in
+               before.execute("SELECT DISTINCT tpl FROM main.Data")}
+    stations = [station for station in CORRIDOR if station in present]
+    pairs = [(a, b) for a in stations for b in stations if a != b]
+
+    results = []
+    for pair in pairs:
+        before_query = BEFORE_QUERY.format(*pair)
+        before_ms, before_rows = best_of(args.repeats, before, before_query,
+                                         ())
+        after_ms, after_rows = best_of(args.repeats, after, AFTER_QUERY, pair)
+        results.append({
+            "from": pair[0], "to": pair[1],
+            "before_ms": round(before_ms, 3), "after_ms": round(after_ms, 3),
+            "before_rows": before_rows, "after_rows": after_rows,
+            "before_plan": query_plan(before, before_query, ()),
+            "after_plan": query_plan(after, AFTER_QUERY, pair)
+        })
+
+    print("Plans for {} -> {}".format(*pairs[0]))
+    print("  before: " + results[0]["before_plan"])
+    print("  after:  " + results[0]["after_plan"])
+    print()
+    print("{:8} {:8} {:>10} {:>10} {:>8} {:>11} {:>10}".format(
+        "from", "to", "before ms", "after ms", "speedup", "before rows",
+        "after rows"))
+    for result in results:
+        print("{:8} {:8} {:10.3f} {:10.3f} {:7.1f}x {:11d} {:10d}".format(
+            result["from"], result["to"], result["before_ms"],
+            result["after_ms"],
+            result["before_ms"] / max(result["after_ms"], 1e-6),
+            result["before_rows"], result["after_rows"]))
+    total_before = sum(result["before_ms"] for result in results)
+    total_after = sum(result["after_ms"] for result in results)
+    print("total: {:.1f} ms before, {:.1f} ms after ({:.1f}x) over {} "
+          "pairs".format(total_before, total_after,
+                         total_before / max(total_after, 1e-6), len(results)))
+
+    plans = {(result["before_plan"], result["after_plan"])
+             for result in results}
+    if len(plans) > 1:
+        print("{} different plan combinations, see --csv".format(len(plans)))
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=list(results[0]))
+            writer.writeheader()
+            writer.writerows(results)
+
+    before.close()
+    after.close()
+    shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
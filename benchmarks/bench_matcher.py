@@ -0,0 +1,105 @@
+"""
+bench_matcher.py
+
+Compares matching a turn's rule patterns with one SpaCy Matcher per pattern
+check, as ChatEngine used to, against the shared PatternMatcher. Run from the
+repository root:
+
+    python benchmarks/bench_matcher.py
+    python benchmarks/bench_matcher.py --model path/to/pipeline
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+currentdir = os.path.dirname(os.path.realpath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.append(parentdir)
+
+import spacy
+from spacy.matcher import Matcher
+
+from akobot.AKOBot import PatternMatcher
+from akobot.Reasoner import MultiTokenDictionary, TokenDictionary
+
+MESSAGES = ["I want to book a ticket",
+            "depart from London Liverpool Street to Norwich",
+            "leaving tomorrow at 9am and returning on Friday at 17:30",
+            "3 adults and 2 children",
+            "yes I am returning",
+            "predict my delay leaving Diss at 9:15"]
+
+# The patterns checked by a booking turn, in the order the rules check them
+TURN_PATTERNS = ["book", "delay", "depart", "arrive", "return", "single",
+                 "dep_date", "ret_date", "num_adults", "num_children"]
+
+
+def first_match(vocab, doc, alternatives):
+    """Builds a Matcher per alternative, as ChatEngine used to"""
+    for pattern in alternatives:
+        matcher = Matcher(vocab)
+        matcher.add("pattern", None, pattern)
+        matches = matcher(doc)
+        if len(matches) > 0:
+            for match_id, start, end in matches:
+                return doc[start:end]
+    return None
+
+
+def time_turns(match_turn, docs, repeats):
+    """
+    Returns
+    -------
+    list of float
+        The time taken to match every pattern for each doc, in ms
+    """
+    timings = []
+    for _ in range(repeats):
+        for doc in docs:
+            start = time.perf_counter()
+            match_turn(doc)
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare per-pattern Matchers with the PatternMatcher")
+    parser.add_argument("--model", default="en_core_web_sm",
+                        help="the SpaCy pipeline to parse the messages with")
+    parser.add_argument("--repeats", type=int, default=50)
+    args = parser.parse_args()
+
+    nlp = spacy.load(args.model)
+    patterns = {name: [pattern] for name, pattern in TokenDictionary.items()}
+    patterns.update(MultiTokenDictionary)
+
+    start = time.perf_counter()
+    pattern_matcher = PatternMatcher(nlp.vocab, patterns)
+    print("PatternMatcher compiled in {:.2f} ms".format(
+        (time.perf_counter() - start) * 1000))
+
+    def per_pattern(doc):
+        for name in TURN_PATTERNS:
+            first_match(nlp.vocab, doc, patterns[name])
+
+    def shared(doc):
+        # As if it was a new Doc, so nothing is reused from user_data
+        doc.user_data.pop(id(pattern_matcher), None)
+        results = pattern_matcher(doc)
+        for name in TURN_PATTERNS:
+            results.first(name)
+
+    docs = [nlp(message) for message in MESSAGES]
+    for name, match_turn in [("per pattern", per_pattern),
+                             ("shared", shared)]:
+        timings = sorted(time_turns(match_turn, docs, args.repeats))
+        print("{:<12} p50 {:7.3f} ms   p95 {:7.3f} ms   ({} turns)".format(
+            name, statistics.median(timings),
+            timings[int(len(timings) * 0.95) - 1], len(timings)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+bench_model_cache.py
+
+Compares holding the delay models in memory as full forests against
+CompactForests, whole and cut off at a depth: the memory the store counts,
+the process's RSS with every model loaded, single journey predict latency
+and how far the predictions move from the full forest's. Each form is
+measured in a fresh process. The pairs are trained first if they have no
+model. Run from the repository root:
+
+    python benchmarks/bench_model_cache.py
+    python benchmarks/bench_model_cache.py --depths 8 12 NRCH:DISS NRCH:LIVST
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+currentdir = os.path.dirname(os.path.realpath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.append(parentdir)
+
+
+def rss_mb():
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / \
+            2 ** 20
+
+
+def measure(pairs, compact_models, max_depth, samples):
+    """Loads every pair's model in this process and measures them"""
+    from DelayPrediction.ModelStore import ModelStore
+    from DelayPrediction.newPrediction import Predictions
+
+    predictions = Predictions()
+    # Load the journeys first so they aren't counted with the models
+    data = {}
+    for pair in pairs:
+        predictions.departure_station, predictions.arrival_station = pair
+        x_data, _ = predictions.training_data()
+        rows = np.random.default_rng(0).integers(0, len(x_data), samples)
+        data[pair] = np.asarray(x_data[rows])
+    full_store = ModelStore()
+    expected = {pair: full_store.read_model(pair).predict(data[pair])
+                for pair in pairs}
+    del full_store
+
+    before = rss_mb()
+    model_store = ModelStore(max_bytes=2 ** 40,
+                             compact_models=compact_models,
+                             compact_max_depth=max_depth)
+    latencies, differences = [], []
+    for pair in pairs:
+        model = model_store.load(pair)
+        differences.append(np.abs(model.predict(data[pair]) - expected[pair]))
+        for row in range(samples):
+            start = time.perf_counter()
+            model.predict(data[pair][row:row + 1])
+            latencies.append((time.perf_counter() - start) * 1000)
+    differences = np.concatenate(differences)
+    return {"bytes": model_store.stats()["bytes"],
+            "rss_mb": rss_mb() - before,
+            "p50_ms": statistics.median(latencies),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "mean_difference": float(differences.mean()),
+            "max_difference": float(differences.max())}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure full and compact delay models in memory")
+    parser.add_argument("pairs", nargs="*",
+                        default=["NRCH:DISS", "NRCH:LIVST", "IPSWICH:LIVST",
+                                 "CLCHSTR:CHLMSFD"])
+    parser.add_argument("--depths", nargs="*", type=int, default=[10, 15],
+                        help="depths to cut compact trees off at")
+    parser.add_argument("--samples", type=int, default=200,
+                        help="journeys predicted per pair")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    pairs = [tuple(pair.upper().split(":")) for pair in args.pairs]
+
+    if args.child:
+        compact_models, max_depth = json.loads(args.child)
+        print(json.dumps(measure(pairs, compact_models, max_depth,
+                                 args.samples)))
+        return
+
+    from DelayPrediction.newPrediction import Predictions
+    predictions = Predictions()
+    for pair in pairs:
+        predictions.model_for(pair)
+
+    forms = [("full", False, None), ("compact", True, None)] + \
+        [("compact depth {}".format(depth), True, depth)
+         for depth in args.depths]
+    print("{} pairs, {} journeys each\n".format(len(pairs), args.samples))
+    print("{:<20}{:>11}{:>10}{:>10}{:>10}{:>11}{:>11}".format(
+        "form", "size (MB)", "rss (MB)", "p50 (ms)", "p99 (ms)",
+        "mean diff", "max diff"))
+    for name, compact_models, max_depth in forms:
+        output = subprocess.run(
+            [sys.executable, __file__, "--samples", str(args.samples),
+             "--child", json.dumps([compact_models, max_depth])] +
+            args.pairs, check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print("{:<20}{:>11.1f}{:>10.1f}{:>10.3f}{:>10.3f}{:>10.1f}s"
+              "{:>10.1f}s".format(name, result["bytes"] / 2 ** 20,
+                                  result["rss_mb"], result["p50_ms"],
+                                  result["p99_ms"], result["mean_difference"],
+                                  result["max_difference"]))
+
+
+if __name__ == '__main__':
+    main()
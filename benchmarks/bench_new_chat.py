@@ -0,0 +1,82 @@
+"""
+bench_new_chat.py
+
+Measures the latency and memory cost of starting a new chat, which happens
+every time a page is loaded. Run from the repository root:
+
+    python benchmarks/bench_new_chat.py            # shared SpaCy pipeline
+    python benchmarks/bench_new_chat.py --unshared # spacy.load per chat
+
+--model loads another pipeline in place of en_core_web_sm.
+"""
+import argparse
+import os
+import resource
+import statistics
+import sys
+import time
+
+currentdir = os.path.dirname(os.path.realpath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.append(parentdir)
+
+import spacy
+
+from akobot import AKOBot
+from akobot.Chat import Chat
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB"""
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+        return pages * resource.getpagesize() / 2 ** 20
+    except OSError:
+        # ru_maxrss is the peak rather than the current RSS but it's the best
+        # we can do without /proc
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the cost of starting a new chat")
+    parser.add_argument("--chats", type=int, default=20,
+                        help="number of chats to start")
+    parser.add_argument("--unshared", action="store_true",
+                        help="load a new SpaCy pipeline for every chat, as "
+                             "NLPEngine used to")
+    parser.add_argument("--model", default=AKOBot.SPACY_MODEL,
+                        help="the SpaCy pipeline to load")
+    args = parser.parse_args()
+
+    AKOBot.SPACY_MODEL = args.model
+    if args.unshared:
+        AKOBot.get_nlp = lambda: spacy.load(args.model)
+
+    start_rss = current_rss_mb()
+    chats = []
+    timings = []
+    for _ in range(args.chats):
+        start = time.perf_counter()
+        chats.append(Chat())
+        timings.append((time.perf_counter() - start) * 1000)
+
+    print("mode:            {}".format("unshared" if args.unshared
+                                       else "shared"))
+    print("chats:           {}".format(args.chats))
+    print("first chat:      {:.1f} ms".format(timings[0]))
+    if len(timings) > 1:
+        print("later chats p50: {:.2f} ms".format(
+            statistics.median(timings[1:])))
+        print("later chats max: {:.2f} ms".format(max(timings[1:])))
+    print("RSS growth:      {:.1f} MB ({:.2f} MB per chat)".format(
+        current_rss_mb() - start_rss,
+        (current_rss_mb() - start_rss) / args.chats))
+
+    for chat in chats:
+        chat.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+bench_refresh.py
+
+Compares updating the delay models with a new day of running data
+(DelayPrediction/Refresh.py) against retraining them on the whole history.
+The files, in date order, are split into the history, the new days and the
+days the two sets of models are tested on. Run from the repository root:
+
+    python benchmarks/bench_refresh.py data/2019/*.csv
+    python benchmarks/bench_refresh.py --new 1 --test 5 --pairs NRCH:DISS \
+        data/2019/*.csv
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+currentdir = os.path.dirname(os.path.realpath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.append(parentdir)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time incremental and full delay model updates")
+    parser.add_argument("files", nargs="+", help="running data CSVs, oldest "
+                                                 "first")
+    parser.add_argument("--new", type=int, default=1,
+                        help="files loaded after the models are trained")
+    parser.add_argument("--test", type=int, default=5,
+                        help="files the models are tested on")
+    parser.add_argument("--pairs", nargs="*",
+                        default=["NRCH:DISS", "NRCH:LIVST", "IPSWICH:LIVST",
+                                 "CLCHSTR:CHLMSFD"])
+    args = parser.parse_args()
+    pairs = [tuple(pair.split(":")) for pair in args.pairs]
+    history = args.files[:-(args.new + args.test)]
+    new = args.files[-(args.new + args.test):-args.test]
+    test = args.files[-args.test:]
+
+    # Everything is built in an empty directory so nothing is reused
+    work_dir = tempfile.mkdtemp(prefix="akobot_refresh")
+    for name in ["MODEL", "FEATURE", "LOOKUP"]:
+        os.environ["AKOBOT_{}_DIR".format(name)] = os.path.join(
+            work_dir, name.lower())
+    db_file_name = os.path.join(work_dir, "refresh.db")
+
+    from Database.DatabaseConnector import DBConnection
+    from Database.Ingest import ingest
+    from DelayPrediction.Features import build_features_from_running
+    from DelayPrediction.ModelStore import FEATURE_COLUMNS, default_estimator
+    from DelayPrediction.Refresh import NewRunningQuery, refresh
+    from DelayPrediction.newPrediction import Predictions
+
+    def predictions_for_db():
+        predictions = Predictions()
+        predictions.db_connection = DBConnection(db_file_name)
+        return predictions
+
+    ingest(history, db_file_name)
+    predictions = predictions_for_db()
+    for pair in pairs:
+        predictions.model_for(pair)
+
+    report = ingest(new, db_file_name)
+    start = time.perf_counter()
+    refreshed = refresh(predictions, pairs)
+    refresh_seconds = time.perf_counter() - start
+
+    # The same pairs retrained from scratch
+    start = time.perf_counter()
+    full_models = {}
+    for pair in pairs:
+        predictions.departure_station, predictions.arrival_station = pair
+        data = predictions.prepare_datasets()
+        full_models[pair] = default_estimator().fit(
+            data[FEATURE_COLUMNS].values, data["arrival_time"].values)
+    full_seconds = time.perf_counter() - start
+
+    after_rowid = predictions.source_version()[2]
+    ingest(test, db_file_name)
+    print("{} history, {} new and {} test files, {} new stops".format(
+        len(history), len(new), len(test), report["inserted"]))
+    print("\n{:<18}{:>9}{:>9}{:>7}{:>12}{:>12}".format(
+        "pair", "journeys", "updated", "trees", "update mae", "full mae"))
+    for pair in pairs:
+        model = predictions.model_store.read_model(pair)
+        rows = predictions.model_store.read_manifest(pair)["rows"]
+        test_data, _ = build_features_from_running(
+            predictions.db_connection.send_query(
+                NewRunningQuery, pair + (after_rowid,)).fetchall())
+        x_test = test_data[FEATURE_COLUMNS].values
+        y_test = test_data["arrival_time"].values
+        print("{:<18}{:>9}{:>9}{:>7}{:>12.1f}{:>12.1f}".format(
+            "{}-{}".format(*pair), rows,
+            "yes" if pair in refreshed["updated"] else "no",
+            len(model.estimators_),
+            np.abs(model.predict(x_test) - y_test).mean(),
+            np.abs(full_models[pair].predict(x_test) - y_test).mean()))
+    print("\nincremental update: {:8.2f} s ({} new journeys)".format(
+        refresh_seconds, refreshed["journeys"]))
+    print("full retrain:       {:8.2f} s".format(full_seconds))
+
+
+if __name__ == '__main__':
+    main()
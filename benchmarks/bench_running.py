@@ -0,0 +1,85 @@
+"""
+bench_running.py
+
+Compares main.Data, where times are 'HH:MM' text and the date is inside the
+rid, with its typed copy main.Running: the space each takes (with indexes)
+and how long building the prediction dataset takes from each, over every
+pair of stations. Run from the repository root:
+
+    python benchmarks/bench_running.py
+"""
+import argparse
+import os
+import sys
+import time
+
+currentdir = os.path.dirname(os.path.realpath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.append(parentdir)
+
+import numpy as np
+
+from Database.DatabaseConnector import DBConnection
+from DelayPrediction.Features import build_features, \
+    build_features_from_running
+from DelayPrediction.newPrediction import HarvestQuery, RunningQuery
+
+TABLES = {"Data": ["Data", "DataDepartures", "DataArrivals", "DataStops"],
+          "Running": ["Running", "Locations", "sqlite_autoindex_Locations_1"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare main.Data with main.Running")
+    parser.add_argument("--db", default="AKODatabase.db")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    db_connection = DBConnection(args.db)
+    sizes = dict(db_connection.send_query(
+        "SELECT name, sum(pgsize) FROM dbstat GROUP BY name").fetchall())
+    for table, objects in TABLES.items():
+        print("{:8} {:8.2f} MB".format(table, sum(
+            sizes.get(name, 0) for name in objects) / 2 ** 20))
+
+    stations = [row[0] for row in db_connection.send_query(
+        "SELECT tpl FROM main.Locations ORDER BY tpl")]
+    pairs = [(a, b) for a in stations for b in stations if a != b]
+
+    timings = {"Data": [], "Running": []}
+    journeys = {"Data": 0, "Running": 0}
+    differences = 0
+    for _ in range(args.repeats):
+        totals = {"Data": 0.0, "Running": 0.0}
+        for pair in pairs:
+            start = time.perf_counter()
+            from_data, _ = build_features(
+                db_connection.send_query(HarvestQuery, pair).fetchall())
+            totals["Data"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            from_running, _ = build_features_from_running(
+                db_connection.send_query(RunningQuery, pair).fetchall())
+            totals["Running"] += time.perf_counter() - start
+
+            if not timings["Data"]:
+                journeys["Data"] += len(from_data)
+                journeys["Running"] += len(from_running)
+                # Only journeys over midnight should differ
+                if len(from_data) == len(from_running):
+                    differences += int(np.sum(np.any(
+                        from_data.values[:, 1:] != from_running.values[:, 1:],
+                        axis=1)))
+        for table in totals:
+            timings[table].append(totals[table] * 1000)
+    db_connection.close()
+
+    for table in timings:
+        print("{:8} {:8.1f} ms for {} pairs ({} journeys)".format(
+            table, min(timings[table]), len(pairs), journeys[table]))
+    print("journeys with different features (over midnight): {}".format(
+        differences))
+
+
+if __name__ == '__main__':
+    main()
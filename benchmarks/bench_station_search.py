@@ -0,0 +1,82 @@
+"""
+bench_station_search.py
+
+Times misspelled station lookups through StationIndex against the full
+table scan ChatEngine.find_station used to do. Run from the repository root:
+
+    python benchmarks/bench_station_search.py
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+currentdir = os.path.dirname(os.path.realpath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.append(parentdir)
+
+from akobot.Stations import StationIndex, get_similarity
+
+
+def misspell(name, rng):
+    """Drops, doubles or swaps one character of name"""
+    i = rng.randrange(len(name) - 1)
+    edit = rng.choice(["drop", "double", "swap"])
+    if edit == "drop":
+        return name[:i] + name[i + 1:]
+    if edit == "double":
+        return name[:i] + name[i] + name[i:]
+    return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+
+
+def full_scan(stations, search_station):
+    result = list(stations)
+    result.sort(key=lambda station: get_similarity(station, search_station),
+                reverse=True)
+    return result[0:3]
+
+
+def time_lookups(lookup, searches):
+    timings = []
+    for search_station in searches:
+        start = time.perf_counter()
+        lookup(search_station)
+        timings.append((time.perf_counter() - start) * 1000)
+    return sorted(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time misspelled station lookups")
+    parser.add_argument("--searches", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = StationIndex.from_database()
+    build_ms = (time.perf_counter() - start) * 1000
+
+    rng = random.Random(args.seed)
+    searches = [misspell(rng.choice(index.stations)[1], rng)
+                for _ in range(args.searches)]
+
+    print("stations: {}   index build: {:.1f} ms".format(len(index),
+                                                          build_ms))
+    agree = sum(index.closest(search)[0] == full_scan(index.stations,
+                                                      search)[0]
+                for search in searches)
+    print("same closest station as the full scan: {:.1f}%".format(
+        agree / len(searches) * 100))
+    for name, lookup in [("index", index.closest),
+                         ("full scan", lambda search: full_scan(
+                             index.stations, search))]:
+        timings = time_lookups(lookup, searches)
+        print("{:<10} p50 {:8.3f} ms   p99 {:8.3f} ms".format(
+            name, statistics.median(timings),
+            timings[int(len(timings) * 0.99) - 1]))
+
+
+if __name__ == '__main__':
+    main()
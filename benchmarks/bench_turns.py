@@ -0,0 +1,70 @@
+"""
+bench_turns.py
+
+Compares the latency of a booking turn made by clicking a suggestion (a
+control tag such as {TAG:ADT}3, which skips SpaCy) with the equivalent
+free-text turn. Run from the repository root:
+
+    python benchmarks/bench_turns.py
+"""
+import argparse
+import datetime
+import os
+import statistics
+import sys
+import time
+
+currentdir = os.path.dirname(os.path.realpath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.append(parentdir)
+
+from akobot.Chat import Chat
+
+TAGGED_TURNS = ["{TAG:ADT}3", "{TAG:CHD}0", "{TAG:RET}👍", "{TAG:RET}👎",
+                "{TAG:DEP}Norwich", "{TAG:ARR}Diss"]
+FREE_TEXT_TURNS = ["3 adults", "0 children", "I am returning",
+                   "a single please", "departing from Norwich",
+                   "arriving to Diss"]
+
+
+def time_turns(turns, repeats):
+    """
+    Times each turn in turns, starting a fresh booking for each one
+
+    Returns
+    -------
+    list of float
+        The latency of every turn in ms
+    """
+    timings = []
+    for _ in range(repeats):
+        for turn in turns:
+            chat = Chat()
+            chat.add_message("human", "book a ticket",
+                             datetime.datetime.now())
+            start = time.perf_counter()
+            chat.add_message("human", turn, datetime.datetime.now())
+            timings.append((time.perf_counter() - start) * 1000)
+            chat.close()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare tagged and free-text turn latency")
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    # warm up the shared pipeline and matcher
+    time_turns(FREE_TEXT_TURNS[:1], 1)
+
+    for name, turns in [("tagged", TAGGED_TURNS),
+                        ("free text", FREE_TEXT_TURNS)]:
+        timings = sorted(time_turns(turns, args.repeats))
+        print("{:<10} p50 {:7.2f} ms   p95 {:7.2f} ms   ({} turns)".format(
+            name, statistics.median(timings),
+            timings[int(len(timings) * 0.95) - 1], len(timings)))
+
+
+if __name__ == '__main__':
+    main()
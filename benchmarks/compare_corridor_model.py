@@ -0,0 +1,133 @@
+"""
+compare_corridor_model.py
+
+Compares one model per station pair with the single corridor wide model
+(DelayPrediction/Corridor.py) on training time, size and accuracy. Both are
+trained on the earlier journeys and tested on the latest ones (split by rid,
+which starts with the service date). Run from the repository root:
+
+    python benchmarks/compare_corridor_model.py
+    python benchmarks/compare_corridor_model.py --db y.db --min-samples-leaf 5
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+
+currentdir = os.path.dirname(os.path.realpath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.append(parentdir)
+
+from Database.DatabaseConnector import DBConnection
+from DelayPrediction.Corridor import CORRIDOR, CORRIDOR_FEATURE_COLUMNS, \
+    CorridorModel, CorridorQuery, build_corridor_dataset
+from DelayPrediction.ModelStore import FEATURE_COLUMNS
+
+
+def model_size(model):
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer)
+    return buffer.tell()
+
+
+def errors(actual, predicted):
+    error = np.abs(predicted - actual)
+    return {"n": len(error), "mae": error.mean(),
+            "rmse": np.sqrt((error ** 2).mean()),
+            "within_60s": (error <= 60).mean() * 100}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare per pair and corridor wide delay models")
+    parser.add_argument("--db", default="AKODatabase.db",
+                        help="database file, relative to Database/")
+    parser.add_argument("--test-fraction", type=float, default=0.2)
+    parser.add_argument("--trees", type=int, default=100)
+    parser.add_argument("--min-samples-leaf", type=int, default=1)
+    args = parser.parse_args()
+
+    def estimator():
+        return RandomForestRegressor(n_estimators=args.trees,
+                                     min_samples_leaf=args.min_samples_leaf,
+                                     random_state=0)
+
+    db_connection = DBConnection(args.db)
+    start = time.perf_counter()
+    data = build_corridor_dataset(db_connection.send_query(
+        CorridorQuery, CORRIDOR).fetchall())
+    print("dataset: {} journeys in {:.1f} s".format(
+        len(data), time.perf_counter() - start))
+
+    rids = np.sort(data["rid"].astype(str).unique())
+    split = rids[int(len(rids) * (1 - args.test_fraction))]
+    test_rows = data["rid"].astype(str).values >= split
+    train, test = data[~test_rows], data[test_rows]
+    pairs = sorted(set(zip(test["origin"], test["destination"])))
+
+    # One model per pair
+    start = time.perf_counter()
+    pair_models = {}
+    for (origin, destination), journeys in train.groupby(["origin",
+                                                          "destination"]):
+        pair_models[(origin, destination)] = estimator().fit(
+            journeys[FEATURE_COLUMNS].values, journeys["arrival_time"].values)
+    pair_seconds = time.perf_counter() - start
+    pair_bytes = sum(model_size(model) for model in pair_models.values())
+
+    # One model for the line, predicting without the timetabled running time
+    # as it isn't known when asked from a chat
+    start = time.perf_counter()
+    corridor_model = CorridorModel(estimator()).fit(
+        train[CORRIDOR_FEATURE_COLUMNS].values, train["arrival_time"].values)
+    corridor_seconds = time.perf_counter() - start
+    corridor_bytes = model_size(corridor_model)
+    test_x = test[CORRIDOR_FEATURE_COLUMNS].values.copy()
+    test_x[:, -1] = np.nan
+    corridor_predictions = corridor_model.predict(test_x)
+
+    pair_predictions = np.full(len(test), np.nan)
+    keys = list(zip(test["origin"], test["destination"]))
+    print("\n{:<18}{:>7}{:>12}{:>12}{:>12}{:>12}".format(
+        "pair", "test", "pair mae", "corr mae", "pair <=60s", "corr <=60s"))
+    for pair in pairs:
+        rows = np.array([key == pair for key in keys])
+        actual = test["arrival_time"].values[rows]
+        name = "{}-{}".format(CORRIDOR[int(pair[0])], CORRIDOR[int(pair[1])])
+        corridor = errors(actual, corridor_predictions[rows])
+        if pair in pair_models:
+            pair_predictions[rows] = pair_models[pair].predict(
+                test[FEATURE_COLUMNS].values[rows])
+            per_pair = errors(actual, pair_predictions[rows])
+            print("{:<18}{:>7}{:>12.1f}{:>12.1f}{:>11.1f}%{:>11.1f}%".format(
+                name, len(actual), per_pair["mae"], corridor["mae"],
+                per_pair["within_60s"], corridor["within_60s"]))
+        else:
+            print("{:<18}{:>7}{:>12}{:>12.1f}{:>12}{:>11.1f}%".format(
+                name, len(actual), "no model", corridor["mae"], "-",
+                corridor["within_60s"]))
+
+    covered = ~np.isnan(pair_predictions)
+    actual = test["arrival_time"].values
+    per_pair = errors(actual[covered], pair_predictions[covered])
+    corridor = errors(actual[covered], corridor_predictions[covered])
+    print("\n{:<10}{:>8}{:>12}{:>10}{:>10}{:>10}{:>10}".format(
+        "model", "models", "train (s)", "size MB", "mae", "rmse", "<=60s"))
+    for name, models, seconds, size, result in [
+            ("pair", len(pair_models), pair_seconds, pair_bytes, per_pair),
+            ("corridor", 1, corridor_seconds, corridor_bytes, corridor)]:
+        print("{:<10}{:>8}{:>12.1f}{:>10.1f}{:>10.1f}{:>10.1f}"
+              "{:>9.1f}%".format(name, models, seconds, size / 2 ** 20,
+                                 result["mae"], result["rmse"],
+                                 result["within_60s"]))
+    print("({} test journeys on pairs with a per pair model)".format(
+        per_pair["n"]))
+
+
+if __name__ == '__main__':
+    main()
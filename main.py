@@ -1,18 +1,42 @@
 import datetime
 import os
 import sys
+import uuid
 
-from flask import Flask, jsonify, render_template, request
+from flask import Flask, abort, jsonify, render_template, request, session
 
 from akobot import StationNotFoundError
 from akobot.Chat import Chat
+from akobot.Sessions import ChatRegistry
+from Database.DatabaseConnector import get_connection_pool, \
+    release_connections
+from Database.Migrations import check_schema
+from Database.QueryStats import get_query_stats
+from DelayPrediction.ModelStore import get_model_store
+from DelayPrediction.newPrediction import Predictions
+
+# Migrations are applied once per deploy by python Database/Migrations.py
+# (the release step in the Procfile), not by every process as it starts
+check_schema()
 
 app = Flask(__name__, template_folder='templates')
 app.config.update(
     DEBUG=True,
     TEMPLATES_AUTO_RELOAD=True
 )
-this_chat = None
+# The session cookie only holds the chat ID but it must be signed so users
+# can't pick up each other's chats. Set AKOBOT_SECRET_KEY when running more
+# than one process so cookies stay valid between them.
+app.secret_key = os.environ.get('AKOBOT_SECRET_KEY') or os.urandom(24)
+chats = ChatRegistry(max_entries=int(os.environ.get('AKOBOT_MAX_CHATS', 1000)),
+                     ttl=int(os.environ.get('AKOBOT_CHAT_TTL', 1800)))
+max_batch_size = int(os.environ.get('AKOBOT_MAX_BATCH', 1000))
+# The /debug endpoints expose chat, database and query statistics so are only
+# served when AKOBOT_DEBUG_ENDPOINTS=1
+debug_endpoints = os.environ.get('AKOBOT_DEBUG_ENDPOINTS', '0') == '1'
+chat_error_message = ["Sorry! There has been an issue with this chat, please "
+                      "reload the page to start a new chat.", ["Reload Page"],
+                      True]
 
 
 @app.route('/')
@@ -27,33 +51,36 @@ def chat():
 
 @app.route('/chat', methods=["POST"])
 def process_user_input():
-    global this_chat
-
     user_input = request.form['user_input']
     is_system = request.form['is_system']
 
     if user_input == "":
         response = ("Hi! I'm AKOBot, a kind of bot that can help you travel by "
                     "train smarter. How can I be of assistance today?")
+        # A reload starts a new chat so the old one can be released now
+        chats.remove(session.get('chat_id'))
         this_chat = Chat()
         this_chat.add_message("bot", response, datetime.datetime.now())
+        chat_id = uuid.uuid4().hex
+        session['chat_id'] = chat_id
+        chats.put(chat_id, this_chat)
         suggestions = ['Book a ticket', 'Delay prediction']
         response_req = True
-    elif user_input == "POPMSG" and is_system == "true":
-        message = this_chat.pop_message()
-        response = message[0]
-        suggestions = message[1]
-        response_req = message[2]
     else:
-        try:
-            message = this_chat.add_message("human",
-                                            user_input,
-                                            datetime.datetime.now())
-        except Exception as e:
-            print(e)
-            message = ["Sorry! There has been an issue with this chat, please "
-                       "reload the page to start a new chat.", ["Reload Page"],
-                       True]
+        this_chat = chats.get(session.get('chat_id'))
+        if this_chat is None:
+            # The chat has expired or been evicted
+            message = chat_error_message
+        elif user_input == "POPMSG" and is_system == "true":
+            message = this_chat.pop_message()
+        else:
+            try:
+                message = this_chat.add_message("human",
+                                                user_input,
+                                                datetime.datetime.now())
+            except Exception as e:
+                print(e)
+                message = chat_error_message
         response = message[0]
         suggestions = message[1]
         response_req = message[2]
@@ -63,6 +90,52 @@ def process_user_input():
                     "response_req": response_req})
 
 
+@app.route('/predict', methods=["POST"])
+def predict_delays():
+    """
+    Delay predictions for many journeys without a chat, e.g.
+    {"queries": [{"from": "norwich", "to": "diss", "departure": "07:30",
+                  "delay": 4}]}
+    gives {"results": [{"from": "NRCH", "to": "DISS",
+                        "predicted_delay": 378.4}]} (seconds)
+    """
+    body = request.get_json(silent=True) or {}
+    queries = body.get('queries')
+    if not isinstance(queries, list) or not all(isinstance(query, dict)
+                                                for query in queries):
+        return jsonify({"error": "Expected a list of queries"}), 400
+    if len(queries) > max_batch_size:
+        return jsonify({"error": "At most {} queries can be sent at "
+                                 "once".format(max_batch_size)}), 400
+    return jsonify({"results": Predictions().predict_batch(queries)})
+
+
+@app.before_request
+def hide_debug_endpoints():
+    if request.path.startswith('/debug/') and not debug_endpoints:
+        abort(404)
+
+
+@app.teardown_appcontext
+def return_database_connections(exception):
+    # Each request runs on its own thread, so hand its connection on to the
+    # next one rather than leaving it to the finished thread
+    release_connections()
+
+
+@app.route('/debug/sessions')
+def session_stats():
+    return jsonify(dict(chats.stats(), database=get_connection_pool().stats(),
+                        models=get_model_store().stats()))
+
+
+@app.route('/debug/queries')
+def query_stats():
+    # The statements with the highest total time, e.g. /debug/queries?top=5
+    return jsonify(get_query_stats().top(request.args.get('top', 20,
+                                                          type=int)))
+
+
 if __name__ == '__main__':
     # If there's any arg then we're deploying over the web
     if len(sys.argv) > 1:
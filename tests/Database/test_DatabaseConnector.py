@@ -0,0 +1,142 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from Database.DatabaseConnector import ConnectionPool, DBConnection, \
+    close_connection_pools, get_connection_pool, release_connections
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.workdir, "test.db")
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE Stations (identifier TEXT, name TEXT)")
+        conn.execute("INSERT INTO Stations VALUES ('NRW', 'Norwich')")
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        close_connection_pools()
+        shutil.rmtree(self.workdir)
+
+    def test_one_connection_per_thread(self):
+        handles = [DBConnection(self.db_path) for _ in range(50)]
+        for handle in handles:
+            handle.send_query("SELECT * FROM Stations").fetchall()
+        self.assertIs(handles[0].conn, handles[-1].conn)
+        self.assertEqual(get_connection_pool(self.db_path).stats()["open"], 1)
+
+    def test_connections_are_reused_by_other_threads(self):
+        pool = ConnectionPool(self.db_path)
+        thread_conns = []
+
+        def use_connection():
+            thread_conns.append(pool.connection())
+            pool.release()
+
+        for _ in range(5):
+            thread = threading.Thread(target=use_connection)
+            thread.start()
+            thread.join()
+        self.assertEqual(len(set(map(id, thread_conns))), 1)
+        self.assertEqual(pool.stats()["opened"], 1)
+        self.assertEqual(pool.stats()["idle"], 1)
+        pool.close()
+
+    def test_connections_of_finished_threads_are_reclaimed(self):
+        pool = ConnectionPool(self.db_path, max_connections=2, timeout=0)
+        for _ in range(5):
+            # Finishes without releasing its connection
+            thread = threading.Thread(target=pool.connection)
+            thread.start()
+            thread.join()
+        pool.connection()
+        self.assertLessEqual(pool.stats()["opened"], 2)
+        pool.close()
+
+    def test_waits_for_a_connection_to_be_returned(self):
+        pool = ConnectionPool(self.db_path, max_connections=1, timeout=5)
+        checked_out = threading.Event()
+        finish = threading.Event()
+
+        def hold_connection():
+            pool.connection()
+            checked_out.set()
+            finish.wait()
+            pool.release()
+
+        thread = threading.Thread(target=hold_connection)
+        thread.start()
+        checked_out.wait()
+        threading.Timer(0.1, finish.set).start()
+        conn = pool.connection()
+        thread.join()
+        self.assertEqual(pool.stats()["opened"], 1)
+        self.assertEqual(conn.execute("SELECT name FROM Stations").fetchall(),
+                         [("Norwich",)])
+        pool.close()
+
+    def test_no_connection_returned_in_time(self):
+        pool = ConnectionPool(self.db_path, max_connections=1, timeout=0.05)
+        checked_out = threading.Event()
+        finish = threading.Event()
+
+        def hold_connection():
+            pool.connection()
+            checked_out.set()
+            finish.wait()
+
+        thread = threading.Thread(target=hold_connection)
+        thread.start()
+        checked_out.wait()
+        with self.assertRaises(sqlite3.OperationalError):
+            pool.connection()
+        finish.set()
+        thread.join()
+        pool.close()
+
+    def test_pragmas(self):
+        conn = DBConnection(self.db_path).conn
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0],
+                         "wal")
+        self.assertLess(conn.execute("PRAGMA cache_size").fetchone()[0], 0)
+
+    def test_read_only(self):
+        pool = ConnectionPool(self.db_path, read_only=True)
+        conn = pool.connection()
+        self.assertEqual(conn.execute("SELECT name FROM Stations").fetchall(),
+                         [("Norwich",)])
+        with self.assertRaises(sqlite3.OperationalError):
+            conn.execute("INSERT INTO Stations VALUES ('DIS', 'Diss')")
+        pool.close()
+
+    def test_closed_handle_has_no_connection(self):
+        handle = DBConnection(self.db_path)
+        handle.close()
+        self.assertIsNone(handle.conn)
+
+    def test_close_returns_the_connection_it_checked_out(self):
+        pool = get_connection_pool(self.db_path)
+        outer = DBConnection(self.db_path)
+        outer.send_query("SELECT * FROM Stations").fetchall()
+        inner = DBConnection(self.db_path)
+        inner.send_query("SELECT * FROM Stations").fetchall()
+        # Still in use by outer
+        inner.close()
+        self.assertEqual(pool.stats()["in_use"], 1)
+        outer.close()
+        self.assertEqual(pool.stats()["in_use"], 0)
+        self.assertEqual(pool.stats()["idle"], 1)
+
+    def test_release_connections(self):
+        DBConnection(self.db_path).send_query("SELECT * FROM Stations")
+        release_connections()
+        self.assertEqual(get_connection_pool(self.db_path).stats()["idle"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import csv
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from Database.DatabaseConnector import close_connection_pools
+from Database.Ingest import DATA_COLUMNS, ingest
+
+
+class TestIngest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.workdir, "test.db")
+
+    def tearDown(self):
+        close_connection_pools()
+        shutil.rmtree(self.workdir)
+
+    def write_csv(self, name, stops):
+        file_name = os.path.join(self.workdir, name)
+        with open(file_name, "w", newline="") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(DATA_COLUMNS)
+            for rid, tpl, pta, ptd in stops:
+                row = dict.fromkeys(DATA_COLUMNS, "")
+                row.update(rid=rid, tpl=tpl, pta=pta, ptd=ptd)
+                writer.writerow([row[column] for column in DATA_COLUMNS])
+        return file_name
+
+    def test_ingest_is_idempotent(self):
+        files = [
+            self.write_csv("a.csv", [("201902011", "NRCH", "", "07:30"),
+                                     ("201902011", "TROWSEJ", "", ""),
+                                     ("201902011", "DISS", "07:50", "07:51"),
+                                     ("", "DISS", "07:50", "07:51")]),
+            self.write_csv("b.csv", [("201902011", "DISS", "07:50", "07:51"),
+                                     ("201902012", "NRCH", "", "08:00")]),
+        ]
+        report = ingest(files, self.db_path, chunk_size=2, workers=1)
+        self.assertEqual(report["read"], 6)
+        self.assertEqual(report["inserted"], 3)
+        self.assertEqual(report["duplicates"], 1)
+        self.assertEqual(report["rejected"], 1)
+
+        report = ingest(files, self.db_path, workers=1)
+        self.assertEqual(report["inserted"], 0)
+
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(conn.execute(
+            "SELECT rid, tpl FROM Data ORDER BY rid, tpl").fetchall(),
+            [("201902011", "DISS"), ("201902011", "NRCH"),
+             ("201902012", "NRCH")])
+        conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from Database.Migrations import SCHEMA_VERSION, SchemaError, check_schema, \
+    migrate
+from DelayPrediction.newPrediction import HarvestQuery
+
+
+class TestMigrate(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.workdir, "test.db")
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE Data (rid TEXT, tpl TEXT, pta TEXT, "
+                     "ptd TEXT, arr_at TEXT, dep_at TEXT)")
+        conn.execute("CREATE TABLE Stations (identifier TEXT, name TEXT)")
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_applies_each_migration_once(self):
+        self.assertEqual(migrate(self.db_path)[-1], SCHEMA_VERSION)
+        self.assertEqual(migrate(self.db_path), [])
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(conn.execute("PRAGMA user_version").fetchone()[0],
+                         SCHEMA_VERSION)
+        conn.close()
+
+    def test_running_times_roll_over_midnight(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.executemany("INSERT INTO Data (rid, tpl, pta, ptd, arr_at, "
+                         "dep_at) VALUES (?, ?, ?, ?, ?, ?)",
+                         [("201902017628973", "NRCH", "", "23:50", "",
+                           "23:52"),
+                          ("201902017628973", "LIVST", "00:30", "", "", "")])
+        conn.commit()
+        conn.close()
+        migrate(self.db_path)
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(conn.execute(
+            "SELECT tpl, rid, service_date, pta, ptd, arr_at, dep_at "
+            "FROM Running JOIN Locations ON id = location_id "
+            "ORDER BY tpl").fetchall(),
+            [("LIVST", 201902017628973, 20190201, 88200, None, None, None),
+             ("NRCH", 201902017628973, 20190201, None, 85800, None, 85920)])
+        conn.close()
+
+    def test_unread_columns_dropped(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("ALTER TABLE Data ADD COLUMN wta TEXT")
+        conn.executemany("INSERT INTO Data (rowid, rid, tpl, ptd, wta) "
+                         "VALUES (?, ?, ?, ?, ?)",
+                         [(3, "201902017628973", "NRCH", "23:50", "23:49"),
+                          (7, "201902017628973", "DISS", "00:10", "")])
+        conn.commit()
+        conn.close()
+        migrate(self.db_path)
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual([row[1] for row in conn.execute(
+            "PRAGMA table_info(Data)")],
+            ["rid", "tpl", "pta", "ptd", "arr_at", "dep_at"])
+        # Refresh.py relies on the rowids
+        self.assertEqual(conn.execute(
+            "SELECT rowid, tpl, ptd FROM Data ORDER BY rowid").fetchall(),
+            [(3, "NRCH", "23:50"), (7, "DISS", "00:10")])
+        conn.close()
+        check_schema(self.db_path)
+
+    def test_check_schema(self):
+        with self.assertRaises(SchemaError) as context:
+            check_schema(self.db_path)
+        self.assertIn("index DataDepartures", str(context.exception))
+        migrate(self.db_path)
+        check_schema(self.db_path)
+
+    def test_harvest_query_only_reads_indexes(self):
+        migrate(self.db_path)
+        conn = sqlite3.connect(self.db_path)
+        plan = [row[-1] for row in conn.execute(
+            "EXPLAIN QUERY PLAN " + HarvestQuery, ("NRCH", "DISS"))]
+        conn.close()
+        self.assertEqual(len(plan), 2)
+        self.assertTrue(all("COVERING INDEX" in step for step in plan))
+
+
+if __name__ == '__main__':
+    unittest.main()
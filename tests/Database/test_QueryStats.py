@@ -0,0 +1,68 @@
+import io
+import sqlite3
+import unittest
+from contextlib import redirect_stdout
+
+from Database.QueryStats import InstrumentedCursor, QueryStats
+
+
+class TestQueryStats(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.execute("CREATE TABLE Stations (identifier TEXT, name TEXT)")
+        self.conn.executemany("INSERT INTO Stations VALUES (?, ?)",
+                              [("NRW", "Norwich"), ("DIS", "Diss")])
+        self.stats = QueryStats(slow_query_ms=None)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def run_query(self, query, params=()):
+        return InstrumentedCursor(self.conn.execute(query, params),
+                                  self.stats, query, params, 0)
+
+    def test_records_rows_once_fetched(self):
+        query = "SELECT * FROM Stations WHERE identifier != ?"
+        cursor = self.run_query(query, ("X",))
+        self.assertEqual(self.stats.top(), [])
+        self.assertEqual(len(cursor.fetchall()), 2)
+        self.assertEqual(len(list(self.run_query(query, ("NRW",)))), 1)
+
+        top = self.stats.top()
+        self.assertEqual(len(top), 1)
+        self.assertEqual(top[0]["count"], 2)
+        self.assertEqual(top[0]["rows"], 3)
+        self.assertEqual(sum(top[0]["histogram"].values()), 2)
+
+    def test_records_partly_fetched_cursors(self):
+        query = "SELECT * FROM Stations"
+        self.assertIsNotNone(self.run_query(query).fetchone())
+        cursor = self.run_query(query)
+        cursor.fetchone()
+        cursor.close()
+        self.run_query(query).fetchall()
+
+        top = self.stats.top()
+        self.assertEqual(top[0]["count"], 3)
+        self.assertEqual(top[0]["rows"], 4)
+
+    def test_statements_ranked_by_total_time(self):
+        self.stats.record("SELECT 1", 5, 1)
+        self.stats.record("SELECT   2", 1, 1)
+        self.stats.record("SELECT 2", 6, 1)
+        self.assertEqual([s["statement"] for s in self.stats.top()],
+                         ["SELECT 2", "SELECT 1"])
+        self.assertEqual(len(self.stats.top(1)), 1)
+
+    def test_slow_query_logged_with_plan(self):
+        self.stats.slow_query_ms = 0
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.run_query("SELECT name FROM Stations WHERE identifier = ?",
+                           ("NRW",)).fetchall()
+        self.assertIn("Slow query", output.getvalue())
+        self.assertIn("SCAN Stations", output.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
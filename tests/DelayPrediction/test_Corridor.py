@@ -0,0 +1,39 @@
+import unittest
+
+import numpy as np
+from sklearn.dummy import DummyRegressor
+
+from DelayPrediction.Corridor import CORRIDOR_FEATURE_COLUMNS, \
+    CorridorModel, build_corridor_dataset
+
+
+class TestCorridor(unittest.TestCase):
+    def test_every_later_stop_is_a_journey(self):
+        # rid, service_date, tpl, pta, ptd, arr_at, dep_at
+        result = [
+            (201903017, 20190301, "NRCH", None, 25200, None, 25260),
+            (201903017, 20190301, "DISS", 26100, 26160, 26220, 26280),
+            (201903017, 20190301, "IPSWICH", 27600, 27660, 27600, 27720),
+        ]
+        data = build_corridor_dataset(result)
+        self.assertEqual(len(data), 3)
+        self.assertEqual(
+            sorted(zip(data["origin"], data["destination"],
+                       data["scheduled_time"], data["arrival_time"])),
+            [(0, 1, 900, 120), (0, 3, 2400, 0), (1, 3, 1440, 0)])
+        self.assertFalse(data[CORRIDOR_FEATURE_COLUMNS].isnull().any().any())
+
+    def test_missing_scheduled_time_is_filled(self):
+        x_data = np.zeros((3, len(CORRIDOR_FEATURE_COLUMNS)))
+        x_data[:, -3:] = [[0, 1, 900], [0, 1, 1100], [1, 3, 1400]]
+        model = CorridorModel(DummyRegressor()).fit(x_data, [60, 120, 0])
+
+        filled = model.fill_scheduled_times(
+            [[0] * 6 + [0, 1, np.nan], [0] * 6 + [2, 4, np.nan]])
+        self.assertEqual(filled[0, -1], 1000)
+        # Never seen, so the median time per stop (900 s) times two stops
+        self.assertEqual(filled[1, -1], 1800)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from DelayPrediction.FeatureStore import FeatureStore
+from DelayPrediction.ModelStore import FEATURE_COLUMNS
+
+
+class TestFeatureStore(unittest.TestCase):
+    def setUp(self):
+        self.feature_dir = tempfile.mkdtemp()
+        self.store = FeatureStore(self.feature_dir)
+        self.data = pd.DataFrame(np.arange(14.0).reshape(2, 7),
+                                 columns=FEATURE_COLUMNS + ["arrival_time"])
+
+    def tearDown(self):
+        shutil.rmtree(self.feature_dir)
+
+    def test_arrays_are_memory_mapped(self):
+        self.store.save(("NRCH", "DISS"), self.data, [2, 1])
+        x_data, y_data = self.store.load(("NRCH", "DISS"), [2, 1])
+        self.assertIsInstance(x_data, np.memmap)
+        self.assertFalse(x_data.flags.writeable)
+        self.assertEqual(x_data.shape, (2, len(FEATURE_COLUMNS)))
+        self.assertEqual(list(y_data), [6.0, 13.0])
+
+    def test_rebuilt_when_source_changes(self):
+        built = []
+
+        def dataset():
+            built.append(True)
+            return self.data
+
+        self.store.get(("NRCH", "DISS"), [2, 1], dataset)
+        self.store.get(("NRCH", "DISS"), [2, 1], dataset)
+        self.assertEqual(len(built), 1)
+
+        self.assertIsNone(self.store.load(("NRCH", "DISS"), [3, 1]))
+        self.store.get(("NRCH", "DISS"), [3, 1], dataset)
+        self.assertEqual(len(built), 2)
+        # Only the arrays for the current manifest are kept
+        self.assertEqual(len([name for name in os.listdir(self.feature_dir)
+                              if name.endswith(".npy")]), 2)
+
+    def test_append(self):
+        self.store.save(("NRCH", "DISS"), self.data, [2, 1])
+        files = self.store.read_manifest(("NRCH", "DISS"))["x"]
+        old_x, _ = self.store.load(("NRCH", "DISS"), [2, 1])
+        x_data, y_data = self.store.append(("NRCH", "DISS"), self.data[:1],
+                                           [3, 2])
+        self.assertEqual(list(y_data), [6.0, 13.0, 6.0])
+        np.testing.assert_array_equal(x_data[2], self.data.values[0, :6])
+        # Written to the end of the same files, arrays already mapped are
+        # unchanged
+        self.assertEqual(self.store.read_manifest(("NRCH", "DISS"))["x"],
+                         files)
+        self.assertEqual(len(old_x), 2)
+        self.assertIsNone(self.store.load(("NRCH", "DISS"), [2, 1]))
+        self.assertIsNone(self.store.append(("NRCH", "LIVST"), self.data,
+                                            [3, 2]))
+
+    def test_unfinished_append_is_overwritten(self):
+        self.store.save(("NRCH", "DISS"), self.data, [2, 1])
+        manifest = self.store.read_manifest(("NRCH", "DISS"))
+        # Rows written by an append that stopped before its manifest
+        with open(os.path.join(self.feature_dir, manifest["y"]), "ab") as f:
+            f.write(np.array([99.0]).tobytes())
+        _, y_data = self.store.append(("NRCH", "DISS"), self.data[1:],
+                                      [3, 2])
+        self.assertEqual(list(y_data), [6.0, 13.0, 13.0])
+
+    def test_set_source_version(self):
+        self.store.save(("NRCH", "DISS"), self.data, [2, 1])
+        self.assertTrue(self.store.set_source_version(("NRCH", "DISS"),
+                                                      [2, 2]))
+        self.assertEqual(len(self.store.load(("NRCH", "DISS"), [2, 2])[1]), 2)
+        self.assertFalse(self.store.set_source_version(("NRCH", "LIVST"),
+                                                       [2, 2]))
+
+
+if __name__ == '__main__':
+    unittest.main()
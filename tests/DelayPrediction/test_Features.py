@@ -0,0 +1,88 @@
+import unittest
+
+import numpy as np
+
+from DelayPrediction.Features import build_features, \
+    build_features_from_running, day_of_week, parse_times
+from DelayPrediction.newPrediction import Predictions
+
+
+class TestParseTimes(unittest.TestCase):
+    def test_valid_times(self):
+        self.assertEqual(list(parse_times(["00:00", "07:30", "23:59"])),
+                         [0.0, 27000.0, 86340.0])
+
+    def test_invalid_times_are_nan(self):
+        seconds = parse_times(["", "7:30", "24:00", "07:60", "07:30:00",
+                               "ab:cd", None])
+        self.assertTrue(all(second != second for second in seconds))
+
+
+class TestBuildFeatures(unittest.TestCase):
+    def test_matches_row_by_row_features(self):
+        journeys = []
+        for hour in range(24):
+            for minute in [0, 30, 45]:
+                dep_at = "{:02d}:{:02d}".format(hour, minute)
+                journeys.append((201902040000000 + hour, "NRCH", dep_at,
+                                 dep_at, "DISS", "12:00", "12:05"))
+        data, rejected = build_features(journeys)
+
+        self.assertEqual(rejected, 0)
+        for row in data.itertuples():
+            hour, minute = int(row.time_dep // 3600), int(row.time_dep % 3600
+                                                          // 60)
+            self.assertEqual(row.day_of_week, 0)
+            self.assertEqual(row.weekend, Predictions.is_weekend(0))
+            self.assertEqual(row.day_segment,
+                             Predictions.check_day_segment(hour))
+            expected_rush_hour = Predictions.is_rush_hour(hour, minute)
+            self.assertEqual(row.rush_hour, expected_rush_hour or 0)
+            self.assertEqual(row.delay, 0)
+            self.assertEqual(row.arrival_time, 300)
+
+    def test_rejected_rows_are_counted(self):
+        journeys = [
+            ("201902090000001", "NRCH", "07:30", "07:34", "DISS", "07:50",
+             "07:55"),
+            ("201902090000002", "NRCH", "07:30", "", "DISS", "07:50", "07:55"),
+            ("201902090000003", "NRCH", "07:30", "07:34", "DISS", "07:50",
+             "7.55"),
+            ("2019XX090000004", "NRCH", "07:30", "07:34", "DISS", "07:50",
+             "07:55"),
+        ]
+        data, rejected = build_features(journeys)
+
+        self.assertEqual(rejected, 3)
+        self.assertEqual(list(data["rid"]), ["201902090000001"])
+        self.assertEqual(data["delay"][0], 240)
+        self.assertEqual(data["arrival_time"][0], 300)
+        # 9th Feb 2019 was a Saturday
+        self.assertEqual(data["day_of_week"][0], 5)
+        self.assertEqual(data["weekend"][0], 1)
+
+
+class TestBuildFeaturesFromRunning(unittest.TestCase):
+    def test_day_of_week(self):
+        days = day_of_week(np.array([20190201.0, 20190203, 20200229,
+                                     20181231, 20191301]))
+        self.assertEqual(list(days[:4]), [4, 6, 5, 0])
+        self.assertTrue(np.isnan(days[4]))
+
+    def test_journey_over_midnight(self):
+        data, rejected = build_features_from_running([
+            # Left at 23:59, a minute late, and arrived at 00:05 the next day
+            (201902017628973, 20190201, 86280, 86340, 86520, 86700),
+            (201902017628974, 20190201, 86280, None, 86520, 86700),
+        ])
+        self.assertEqual(rejected, 1)
+        self.assertEqual(list(data["rid"]), [201902017628973])
+        self.assertEqual(data["time_dep"][0], 86340)
+        self.assertEqual(data["delay"][0], 60)
+        self.assertEqual(data["arrival_time"][0], 180)
+        self.assertEqual(data["day_of_week"][0], 4)
+        self.assertEqual(data["day_segment"][0], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from DelayPrediction.LookupTable import DEPARTURE_BUCKETS, LookupTable, \
+    build_table
+
+
+class FakeModelStore:
+    def __init__(self, model_dir):
+        self.model_dir = model_dir
+        self.set_file(("NRCH", "DISS"), "NRCH_DISS_1.joblib")
+
+    def manifest_path(self, pair):
+        return os.path.join(self.model_dir, "{}_{}.json".format(*pair))
+
+    def set_file(self, pair, file_name):
+        with open(self.manifest_path(pair) + ".tmp", "w") as manifest_file:
+            json.dump({"file": file_name}, manifest_file)
+        os.replace(self.manifest_path(pair) + ".tmp", self.manifest_path(pair))
+
+    def read_manifest(self, pair):
+        try:
+            with open(self.manifest_path(pair)) as manifest_file:
+                return json.load(manifest_file)
+        except OSError:
+            return None
+
+
+def fake_predict(features):
+    # One second per minute past midnight plus the delay
+    return features[:, 0] / 60 + features[:, 1]
+
+
+class TestLookupTable(unittest.TestCase):
+    def setUp(self):
+        self.lookup_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.lookup_dir, "models"))
+        self.model_store = FakeModelStore(os.path.join(self.lookup_dir,
+                                                       "models"))
+        self.pair = ("NRCH", "DISS")
+        table = build_table(fake_predict, max_delay=10)
+        self.assertEqual(table.shape, (7, DEPARTURE_BUCKETS, 11))
+        LookupTable(self.lookup_dir, self.model_store).save(
+            self.pair, table, self.pair)
+        self.lookup_table = LookupTable(self.lookup_dir, self.model_store)
+
+    def tearDown(self):
+        shutil.rmtree(self.lookup_dir)
+
+    def test_lookup(self):
+        # time_dep, delay, day_of_week, weekend, day_segment, rush_hour
+        features = [[27000, 240, 0, 0, 1, 1],  # 07:30, on the grid
+                    [27120, 240, 0, 0, 1, 1],  # 07:32, between buckets
+                    [27000, 30, 0, 0, 1, 1],  # not whole minutes
+                    [27000, 3600, 0, 0, 1, 1]]  # longer than max_delay
+        predicted = self.lookup_table.predict(self.pair, self.pair, features)
+        np.testing.assert_array_equal(predicted[:2], [690, 692])
+        self.assertTrue(np.isnan(predicted[2:]).all())
+        nearest = self.lookup_table.predict(self.pair, self.pair, features,
+                                            interpolate=False)
+        self.assertEqual(nearest[1], 690)
+
+    def test_lookup_across_midnight(self):
+        def predict_by_day(features):
+            # As fake_predict plus 1000 seconds per day of the week
+            return fake_predict(features) + features[:, 2] * 1000
+
+        LookupTable(self.lookup_dir, self.model_store).save(
+            self.pair, build_table(predict_by_day, max_delay=10), self.pair)
+        # 23:57:30 on a Tuesday and a Sunday, between the last bucket of
+        # the day (23:55) and the first of the next
+        features = [[86250, 0, 2, 0, 4, 0],
+                    [86250, 0, 6, 1, 4, 0]]
+        predicted = self.lookup_table.predict(self.pair, self.pair, features)
+        np.testing.assert_array_equal(predicted, [(3435 + 3000) / 2,
+                                                  (7435 + 0) / 2])
+        # 23:58 is nearest the first bucket of the next day
+        features = [[86280, 0, 2, 0, 4, 0],
+                    [86280, 0, 6, 1, 4, 0]]
+        nearest = self.lookup_table.predict(self.pair, self.pair, features,
+                                            interpolate=False)
+        np.testing.assert_array_equal(nearest, [3000, 0])
+
+    def test_not_used_once_model_changes(self):
+        features = [[27000, 240, 0, 0, 1, 1]]
+        self.assertEqual(self.lookup_table.predict(self.pair, self.pair,
+                                                   features)[0], 690)
+        self.model_store.set_file(self.pair, "NRCH_DISS_2.joblib")
+        self.assertTrue(np.isnan(self.lookup_table.predict(
+            self.pair, self.pair, features)).all())
+
+        # A table built for the new model by another process is picked up
+        LookupTable(self.lookup_dir, self.model_store).save(
+            self.pair, build_table(fake_predict, max_delay=10) + 1, self.pair)
+        self.assertEqual(self.lookup_table.predict(self.pair, self.pair,
+                                                   features)[0], 691)
+
+
+if __name__ == '__main__':
+    unittest.main()
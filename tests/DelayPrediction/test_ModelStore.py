@@ -0,0 +1,186 @@
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.linear_model import LinearRegression
+
+from DelayPrediction.CompactForest import CompactForest, compact
+from DelayPrediction import ModelStore as ModelStoreModule
+from DelayPrediction.ModelStore import ModelStore
+
+
+def forest(seed=0):
+    rng = np.random.default_rng(seed)
+    x_data = rng.uniform(0, 86400, (500, 6))
+    x_data[:, 2] = rng.integers(0, 7, 500)
+    y_data = x_data[:, 0] / 60 + 100 * x_data[:, 2] + rng.normal(0, 30, 500)
+    model = RandomForestRegressor(n_estimators=10, random_state=seed)
+    return model.fit(x_data, y_data), x_data
+
+
+class TestCompactForest(unittest.TestCase):
+    def test_matches_forest(self):
+        model, x_data = forest()
+        x_test = np.vstack([x_data[:50], np.random.default_rng(1).uniform(
+            0, 86400, (50, 6))])
+        compacted = CompactForest(model)
+        np.testing.assert_allclose(compacted.predict(x_test),
+                                   model.predict(x_test), rtol=1e-5)
+        nodes = sum(estimator.tree_.node_count
+                    for estimator in model.estimators_)
+        self.assertEqual(compacted.nbytes, 17 * nodes + 4 * 10)
+
+    def test_max_depth(self):
+        model, x_data = forest()
+        compacted = CompactForest(model, max_depth=3)
+        self.assertEqual(compacted.depth, 3)
+        # Only the nodes down to depth 3 are kept
+        self.assertEqual(len(compacted.value), 15 * 10)
+        # A tree cut off at a node predicts the mean below it
+        expected = np.mean([
+            estimator.tree_.value[self.node_at_depth(estimator, x_data[:20],
+                                                     3), 0, 0]
+            for estimator in model.estimators_], axis=0)
+        np.testing.assert_allclose(compacted.predict(x_data[:20]), expected,
+                                   rtol=1e-5)
+
+    @staticmethod
+    def node_at_depth(estimator, x_data, depth):
+        tree = estimator.tree_
+        nodes = np.zeros(len(x_data), dtype=int)
+        for _ in range(depth):
+            left = tree.children_left[nodes]
+            go_left = x_data[np.arange(len(x_data)), tree.feature[nodes]] \
+                .astype(np.float32) <= tree.threshold[nodes]
+            nodes = np.where(left < 0, nodes, np.where(
+                go_left, left, tree.children_right[nodes]))
+        return nodes
+
+    def test_other_models_unchanged(self):
+        model = object()
+        self.assertIs(compact(model), model)
+
+
+class TestModelCache(unittest.TestCase):
+    def setUp(self):
+        self.model_dir = tempfile.mkdtemp()
+        self.model, self.x_data = forest()
+
+    def tearDown(self):
+        shutil.rmtree(self.model_dir)
+
+    def save(self, model_store, pair):
+        return model_store.save(pair, self.model, pair[0] * 16, 500)
+
+    def test_evicts_least_recently_used(self):
+        compacted = CompactForest(self.model)
+        model_store = ModelStore(self.model_dir, max_bytes=2.5 *
+                                 compacted.nbytes, compact_models=True)
+        for pair in [("A", "B"), ("B", "C"), ("C", "D")]:
+            self.save(model_store, pair)
+        # A-B was least recently used so is dropped for C-D
+        self.assertEqual(list(model_store.models), [("B", "C"), ("C", "D")])
+        model_store.load(("B", "C"))
+        model_store.load(("A", "B"))
+        self.assertEqual(list(model_store.models), [("B", "C"), ("A", "B")])
+
+        stats = model_store.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["evictions"]),
+                         (1, 1, 2))
+        self.assertEqual(stats["models"], [
+            {"pair": "A-B", "bytes": compacted.nbytes, "compact": True},
+            {"pair": "B-C", "bytes": compacted.nbytes, "compact": True}])
+        self.assertEqual(stats["bytes"], 2 * compacted.nbytes)
+        np.testing.assert_allclose(
+            model_store.load(("A", "B")).predict(self.x_data[:10]),
+            self.model.predict(self.x_data[:10]), rtol=1e-5)
+        # The full model is still on disk
+        self.assertIsInstance(model_store.read_model(("C", "D")),
+                              RandomForestRegressor)
+
+    def test_reloaded_when_replaced_on_disk(self):
+        model_store = ModelStore(self.model_dir)
+        self.save(model_store, ("A", "B"))
+        self.assertIs(model_store.load(("A", "B")), self.model)
+        # Another process (e.g. Refresh.py) saves a new model for the pair
+        new_model, _ = forest(seed=1)
+        ModelStore(self.model_dir).save(("A", "B"), new_model, "b" * 16, 500)
+        reloaded = model_store.load(("A", "B"))
+        np.testing.assert_array_equal(reloaded.predict(self.x_data[:10]),
+                                      new_model.predict(self.x_data[:10]))
+        self.assertIs(model_store.load(("A", "B")), reloaded)
+
+    def test_hits_served_while_another_pair_loads(self):
+        model_store = ModelStore(self.model_dir)
+        self.save(model_store, ("A", "B"))
+        ModelStore(self.model_dir).save(("B", "C"), self.model, "b" * 16, 500)
+        reading, finish = threading.Event(), threading.Event()
+        joblib_load = ModelStoreModule.joblib.load
+
+        def slow_load(path):
+            reading.set()
+            finish.wait(5)
+            return joblib_load(path)
+
+        with mock.patch.object(ModelStoreModule.joblib, "load",
+                               side_effect=slow_load):
+            loader = threading.Thread(target=model_store.load,
+                                      args=(("B", "C"),))
+            loader.start()
+            self.assertTrue(reading.wait(5))
+            self.assertIs(model_store.load(("A", "B")), self.model)
+            # Served without waiting for B-C
+            self.assertTrue(loader.is_alive())
+            finish.set()
+            loader.join()
+        self.assertEqual(list(model_store.models), [("A", "B"), ("B", "C")])
+
+    def test_trained_once_for_concurrent_requests(self):
+        model_store = ModelStore(self.model_dir, LinearRegression)
+        y_data = self.model.predict(self.x_data)
+        trained = []
+        waiting = threading.Barrier(4)
+
+        def training_data():
+            trained.append(True)
+            return self.x_data, y_data
+
+        def get():
+            waiting.wait(5)
+            models.append(model_store.get(("A", "B"), training_data))
+
+        models = []
+        threads = [threading.Thread(target=get) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(trained), 1)
+        self.assertEqual(len(models), 4)
+        self.assertTrue(all(model is models[0] for model in models))
+
+    def test_each_kind_of_estimator_saved_separately(self):
+        y_data = self.model.predict(self.x_data)
+        model_store = ModelStore(self.model_dir)
+        model_store.train(("A", "B"), self.x_data, y_data)
+        # The same journeys with another estimator aren't served the forest
+        model_store.train(("A", "B"), self.x_data, y_data, LinearRegression)
+        self.assertIsInstance(ModelStore(self.model_dir).load(("A", "B")),
+                              LinearRegression)
+        self.assertEqual(model_store.read_manifest(("A", "B"))["estimator"],
+                         "LinearRegression()")
+
+    def test_keeps_newest_model_over_budget(self):
+        model_store = ModelStore(self.model_dir, max_bytes=1)
+        self.save(model_store, ("A", "B"))
+        self.save(model_store, ("B", "C"))
+        self.assertEqual(list(model_store.models), [("B", "C")])
+        self.assertIs(model_store.models[("B", "C")], self.model)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+
+import numpy as np
+
+from DelayPrediction.ModelZoo import CANDIDATES, DEFAULT_CANDIDATE, \
+    evaluate, select, summarise
+
+
+def result(name, rmse, p99_ms, mb):
+    return {"name": name, "rmse": rmse, "predict_p99_ms": p99_ms,
+            "model_bytes": mb * 2 ** 20}
+
+
+class TestModelZoo(unittest.TestCase):
+    def test_select_most_accurate_within_budgets(self):
+        results = [result("random_forest", 100, 20, 80),
+                   result("shallow_forest", 110, 15, 5),
+                   result("hist_gradient_boosting", 105, 60, 1),
+                   result("knn", 150, 1, 10)]
+        self.assertEqual(select(results, 50, 50), "shallow_forest")
+        self.assertEqual(select(results, 100, 100), "random_forest")
+        # Nothing fits so the fastest
+        self.assertEqual(select(results, 0.5, 50), "knn")
+        self.assertEqual(select([], 50, 50), DEFAULT_CANDIDATE)
+
+    def test_refreshable_preferred(self):
+        results = [result("mlp", 90, 1, 1),
+                   result("shallow_forest", 110, 15, 5),
+                   result("random_forest", 100, 80, 80)]
+        self.assertEqual(select(results, 50, 50), "mlp")
+        self.assertEqual(select(results, 50, 50, prefer_refreshable=True),
+                         "shallow_forest")
+        # Unless none of them fit
+        self.assertEqual(select(results, 10, 50, prefer_refreshable=True),
+                         "mlp")
+
+    def test_evaluate(self):
+        random = np.random.default_rng(0)
+        x_data = random.random((100, 6))
+        y_data = x_data[:, 1] * 60
+        evaluation = evaluate(CANDIDATES["shallow_forest"], x_data[:80],
+                              y_data[:80], x_data[80:], y_data[80:],
+                              latency_samples=5)
+        summary = summarise("shallow_forest", [evaluation, evaluation])
+        self.assertEqual(summary["pairs"], 2)
+        self.assertGreater(summary["model_bytes"], 0)
+        self.assertLessEqual(summary["predict_p50_ms"],
+                             summary["predict_p99_ms"])
+        self.assertAlmostEqual(summary["rmse"], np.sqrt(
+            evaluation["squared_error"] / evaluation["rows"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
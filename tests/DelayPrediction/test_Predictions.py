@@ -0,0 +1,65 @@
+import unittest
+
+import numpy as np
+
+from DelayPrediction.newPrediction import Predictions
+
+
+class FakeModel:
+    def __init__(self, pair):
+        self.pair = pair
+        self.calls = []
+
+    def predict(self, features):
+        self.calls.append(features.copy())
+        # The delay in, so each prediction can be traced back to its query
+        return features[:, 1]
+
+
+class FakeModelStore:
+    def __init__(self):
+        self.models = {}
+
+    def get(self, pair, training_data):
+        return self.models.setdefault(pair, FakeModel(pair))
+
+
+class TestPredictBatch(unittest.TestCase):
+    def setUp(self):
+        self.predictions = Predictions()
+        self.predictions.model_store = FakeModelStore()
+        self.predictions.lookup_table = None
+
+    def test_one_predict_per_station_pair(self):
+        results = self.predictions.predict_batch([
+            {"from": "norwich", "to": "diss", "departure": "7:30",
+             "delay": 4},
+            {"from": "NRCH", "to": "LIVST", "departure": "17:45", "delay": 1,
+             "date": "2019-02-02"},
+            {"from": "Norwich", "to": "DISS", "departure": "08:00",
+             "delay": 2},
+        ])
+        self.assertEqual(results, [
+            {"from": "NRCH", "to": "DISS", "predicted_delay": 240.0},
+            {"from": "NRCH", "to": "LIVST", "predicted_delay": 60.0},
+            {"from": "NRCH", "to": "DISS", "predicted_delay": 120.0},
+        ])
+        models = self.predictions.model_store.models
+        self.assertEqual(len(models[("NRCH", "DISS")].calls), 1)
+        # time_dep, delay, day_of_week, weekend, day_segment, rush_hour
+        np.testing.assert_array_equal(models[("NRCH", "LIVST")].calls[0],
+                                      [[63900, 60, 5, 1, 3, 1]])
+
+    def test_invalid_queries_get_errors(self):
+        results = self.predictions.predict_batch([
+            {"from": "norwich", "to": "diss", "departure": "25:00"},
+            {"from": "norwich", "to": "diss", "departure": "07:30",
+             "delay": "soon"},
+            {"to": "diss", "departure": "07:30"},
+        ])
+        self.assertTrue(all("error" in result for result in results))
+        self.assertEqual(self.predictions.model_store.models, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.linear_model import LinearRegression
+
+from DelayPrediction import Refresh
+from DelayPrediction.FeatureStore import FeatureStore
+from DelayPrediction.ModelStore import FEATURE_COLUMNS, ModelStore
+from DelayPrediction.Refresh import refresh, warm_start
+
+
+def journeys(rows):
+    data = pd.DataFrame(np.arange(rows * 6.0).reshape(rows, 6),
+                        columns=FEATURE_COLUMNS)
+    data["arrival_time"] = data["delay"] * 2
+    return data
+
+
+class FakePredictions:
+    def __init__(self, workdir, version):
+        self.version = version
+        self.feature_store = FeatureStore(os.path.join(workdir, "features"))
+        self.model_store = ModelStore(os.path.join(workdir, "models"),
+                                      LinearRegression)
+        self.db_connection = mock.Mock()
+        self.departure_station = None
+        self.arrival_station = None
+
+    def source_version(self):
+        return self.version
+
+    def training_data(self):
+        return self.feature_store.get(
+            (self.departure_station, self.arrival_station), self.version,
+            lambda: journeys(15))
+
+
+class TestWarmStart(unittest.TestCase):
+    def setUp(self):
+        random = np.random.default_rng(0)
+        self.x_data = random.random((200, 6))
+        self.y_data = self.x_data[:, 1] * 60
+
+    def test_trees_added_in_proportion_to_new_journeys(self):
+        model = RandomForestRegressor(n_estimators=20, random_state=0).fit(
+            self.x_data[:100], self.y_data[:100])
+        old_trees = list(model.estimators_)
+        model = warm_start(model, self.x_data[100:110], self.y_data[100:110],
+                           old_rows=100)
+        # 10 new journeys to 100 old ones, so 2 trees on top of 20
+        self.assertEqual(len(model.estimators_), 22)
+        self.assertEqual(model.estimators_[:20], old_trees)
+        self.assertFalse(model.warm_start)
+
+    def test_oldest_trees_dropped(self):
+        model = RandomForestRegressor(n_estimators=20, random_state=0).fit(
+            self.x_data[:100], self.y_data[:100])
+        old_trees = list(model.estimators_)
+        model = warm_start(model, self.x_data[100:], self.y_data[100:],
+                           old_rows=100, max_trees=30)
+        self.assertEqual(len(model.estimators_), 30)
+        self.assertEqual(model.estimators_[:10], old_trees[10:])
+        self.assertEqual(len(model.predict(self.x_data)), 200)
+
+    def test_models_that_cant_be_updated(self):
+        model = LinearRegression().fit(self.x_data, self.y_data)
+        self.assertIsNone(warm_start(model, self.x_data, self.y_data, 200))
+
+
+class TestRefresh(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.pair = ("NRCH", "DISS")
+        self.predictions = FakePredictions(self.workdir, [1, 2, 10])
+        # Saved before the last column was added, so the new journeys
+        # can't be added to it
+        self.predictions.feature_store.save(self.pair, journeys(10),
+                                            [1, 2, 10], FEATURE_COLUMNS[:-1])
+        self.predictions.model_store.train(
+            self.pair, journeys(10)[FEATURE_COLUMNS].values,
+            journeys(10)["arrival_time"].values)
+        self.predictions.version = [1, 2, 20]
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_rebuilt_when_the_new_journeys_cant_be_added(self):
+        lookup_table = mock.Mock()
+        lookup_table.load.return_value = None
+        with mock.patch.object(Refresh, "build_features_from_running",
+                               return_value=(journeys(5), None)), \
+                mock.patch.object(Refresh, "get_lookup_table",
+                                  return_value=lookup_table):
+            report = refresh(self.predictions, [self.pair])
+        self.assertEqual(report["refitted"], [self.pair])
+        self.assertEqual(report["journeys"], 5)
+        manifest = self.predictions.feature_store.read_manifest(self.pair)
+        self.assertEqual(manifest["source_version"], [1, 2, 20])
+        self.assertEqual(manifest["rows"], 15)
+        self.assertEqual(self.predictions.model_store.read_manifest(
+            self.pair)["rows"], 15)
+
+
+if __name__ == '__main__':
+    unittest.main()
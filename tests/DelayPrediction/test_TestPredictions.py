@@ -0,0 +1,34 @@
+import unittest
+
+import numpy as np
+
+from DelayPrediction.TestPredictions import cross_validate
+
+
+class TestCrossValidate(unittest.TestCase):
+    def setUp(self):
+        random = np.random.default_rng(0)
+        self.x_data = random.random((60, 6)) * [86400, 600, 7, 1, 4, 1]
+        self.y_data = self.x_data[:, 1] + random.normal(0, 5, 60)
+
+    def test_every_model_and_feature_set(self):
+        results = cross_validate(self.x_data, self.y_data,
+                                 models=["knn", "shallow_forest"],
+                                 feature_sets=[2, 5], folds=3, n_jobs=1)
+        self.assertEqual([(result["model"], result["feature_set"])
+                          for result in results],
+                         [("knn", 2), ("knn", 5), ("shallow_forest", 2),
+                          ("shallow_forest", 5)])
+        self.assertTrue(all(result["folds"] == 3 and result["rows"] == 60
+                            for result in results))
+
+    def test_reproducible(self):
+        runs = [cross_validate(self.x_data, self.y_data,
+                               models=["shallow_forest"], feature_sets=[4],
+                               folds=3, seed=1, n_jobs=1)[0]["rmse"]
+                for _ in range(2)]
+        self.assertEqual(runs[0], runs[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
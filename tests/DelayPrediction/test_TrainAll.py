@@ -0,0 +1,111 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+from sklearn.linear_model import LinearRegression, Ridge
+
+from DelayPrediction import TrainAll
+from DelayPrediction.ModelStore import ModelStore
+
+
+class FakePredictions:
+    def __init__(self, model_dir):
+        self.model_store = ModelStore(model_dir, LinearRegression)
+        self.departure_station = None
+        self.arrival_station = None
+
+    def training_data(self):
+        if self.departure_station == "LIVST":
+            return np.empty((0, 6)), np.empty(0)
+        x_data = np.arange(60.0).reshape(10, 6)
+        return x_data, x_data[:, 1]
+
+
+class TestTrainPair(unittest.TestCase):
+    def setUp(self):
+        self.model_dir = tempfile.mkdtemp()
+        TrainAll._predictions = FakePredictions(self.model_dir)
+
+    def tearDown(self):
+        TrainAll._predictions = None
+        shutil.rmtree(self.model_dir)
+
+    def test_train_pair(self):
+        result = TrainAll.train_pair(("NRCH", "DISS"))
+        self.assertEqual(result["status"], "trained")
+        self.assertEqual(result["rows"], 10)
+        model_store = TrainAll._predictions.model_store
+        self.assertEqual(model_store.read_manifest(("NRCH", "DISS"))["rows"],
+                         10)
+
+        self.assertEqual(TrainAll.train_pair(("NRCH", "DISS"))["status"],
+                         "exists")
+        self.assertEqual(TrainAll.train_pair(("NRCH", "DISS"),
+                                             retrain=True)["status"],
+                         "trained")
+        self.assertEqual(TrainAll.train_pair(("LIVST", "NRCH"))["status"],
+                         "no journeys")
+
+    def test_retrain_saves_the_new_model(self):
+        model_store = TrainAll._predictions.model_store
+        TrainAll.train_pair(("NRCH", "DISS"))
+        path = os.path.join(self.model_dir, model_store.read_manifest(
+            ("NRCH", "DISS"))["file"])
+        inode = os.stat(path).st_ino
+        # The same kind of estimator on the same journeys is still written
+        TrainAll.train_pair(("NRCH", "DISS"), retrain=True)
+        self.assertNotEqual(os.stat(path).st_ino, inode)
+
+        model_store.estimator_factory = Ridge
+        TrainAll.train_pair(("NRCH", "DISS"), retrain=True)
+        self.assertIsInstance(
+            ModelStore(self.model_dir).load(("NRCH", "DISS")), Ridge)
+
+
+class FakeResource:
+    RLIMIT_AS = 9
+    RUSAGE_SELF = 0
+
+    def __init__(self, max_rss):
+        self.max_rss = max_rss
+        self.limits = {}
+
+    def getrusage(self, who):
+        return mock.Mock(ru_maxrss=self.max_rss)
+
+    def setrlimit(self, limit, values):
+        self.limits[limit] = values
+
+
+class TestPlatforms(unittest.TestCase):
+    def test_peak_rss_mb(self):
+        with mock.patch.object(TrainAll, "resource", FakeResource(2048)), \
+                mock.patch.object(TrainAll.sys, "platform", "linux"):
+            self.assertEqual(TrainAll.peak_rss_mb(), 2)
+        with mock.patch.object(TrainAll, "resource",
+                               FakeResource(2 * 2 ** 20)), \
+                mock.patch.object(TrainAll.sys, "platform", "darwin"):
+            self.assertEqual(TrainAll.peak_rss_mb(), 2)
+        with mock.patch.object(TrainAll, "resource", None):
+            self.assertIsNone(TrainAll.peak_rss_mb())
+
+    def test_memory_cap(self):
+        fake_resource = FakeResource(0)
+        with mock.patch.object(TrainAll, "resource", fake_resource):
+            with mock.patch.object(TrainAll.sys, "platform", "darwin"):
+                TrainAll.init_worker(512)
+            self.assertEqual(fake_resource.limits, {})
+            with mock.patch.object(TrainAll.sys, "platform", "linux"):
+                TrainAll.init_worker(512)
+            self.assertEqual(fake_resource.limits,
+                             {FakeResource.RLIMIT_AS: (2 ** 29, 2 ** 29)})
+        with mock.patch.object(TrainAll, "resource", None):
+            # Uncapped rather than failing
+            TrainAll.init_worker(512)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+
+import spacy
+from spacy.matcher import Matcher
+from spacy.tokens import Doc, Span
+
+from akobot.AKOBot import PatternMatcher
+from akobot.Reasoner import MultiTokenDictionary, TokenDictionary
+
+# Messages as the pipeline would tag them, one "text/lemma/POS/dep" per token
+# and the entity spans as (start, end, label)
+MESSAGES = [
+    ("I/I/PRON/nsubj want/want/VERB/ROOT to/to/PART/aux book/book/VERB/xcomp "
+     "from/from/ADP/prep London/London/PROPN/compound "
+     "Liverpool/Liverpool/PROPN/compound Street/Street/PROPN/pobj "
+     "to/to/ADP/prep Norwich/Norwich/PROPN/pobj", []),
+    ("depart/depart/VERB/ROOT from/from/ADP/prep Norwich/Norwich/PROPN/pobj "
+     "leaving/leave/VERB/advcl at/at/ADP/prep 10:30/10:30/NUM/pobj "
+     "tomorrow/tomorrow/NOUN/npadvmod returning/return/VERB/conj "
+     "on/on/ADP/prep Friday/Friday/PROPN/pobj at/at/ADP/prep "
+     "9/9/NUM/nummod am/am/NOUN/pobj",
+     [(5, 6, "TIME"), (6, 7, "DATE"), (9, 10, "DATE"), (11, 13, "TIME")]),
+    ("leaving/leave/VERB/ROOT tomorrow/tomorrow/NOUN/npadvmod "
+     "at/at/ADP/prep 9/9/NUM/nummod am/am/NOUN/pobj",
+     [(1, 2, "DATE"), (3, 5, "TIME")]),
+    ("3/3/NUM/nummod adults/adult/NOUN/ROOT and/and/CCONJ/cc "
+     "2/2/NUM/nummod children/child/NOUN/conj ,/,/PUNCT/punct "
+     "single/single/ADJ/amod please/please/INTJ/intj", []),
+    ("yes/yes/INTJ/intj I/I/PRON/nsubj am/be/AUX/aux "
+     "returning/return/VERB/ROOT 1130/1130/NUM/dobj", []),
+    ("predict/predict/VERB/ROOT my/my/PRON/poss delay/delay/NOUN/dobj "
+     "leaving/leave/VERB/acl 9:15/9:15/NUM/dobj", []),
+    ("arriving/arrive/VERB/ROOT to/to/ADP/prep Great/Great/PROPN/compound "
+     "Yarmouth/Yarmouth/PROPN/pobj from/from/ADP/prep "
+     "Diss/Diss/PROPN/pobj", []),
+]
+
+
+def make_doc(vocab, tokens, ents):
+    tokens = [token.split("/") for token in tokens.split()]
+    doc = Doc(vocab, words=[token[0] for token in tokens])
+    for token, (_, lemma, pos, dep) in zip(doc, tokens):
+        token.lemma_ = lemma
+        token.pos_ = pos
+        token.dep_ = dep
+    doc.ents = [Span(doc, start, end, label=label)
+                for start, end, label in ents]
+    doc.is_tagged = True
+    doc.is_parsed = True
+    return doc
+
+
+def first_match(vocab, doc, alternatives):
+    """How ChatEngine matched a pattern before PatternMatcher"""
+    for pattern in alternatives:
+        matcher = Matcher(vocab)
+        matcher.add("pattern", None, pattern)
+        matches = matcher(doc)
+        if len(matches) > 0:
+            for match_id, start, end in matches:
+                return doc[start:end]
+    return None
+
+
+class TestPatternMatcher(unittest.TestCase):
+    def setUp(self):
+        self.vocab = spacy.blank("en").vocab
+        self.patterns = {name: [pattern]
+                         for name, pattern in TokenDictionary.items()}
+        self.patterns.update(MultiTokenDictionary)
+        self.matcher = PatternMatcher(self.vocab, self.patterns)
+        self.docs = [make_doc(self.vocab, tokens, ents)
+                     for tokens, ents in MESSAGES]
+
+    def test_same_spans_as_a_matcher_per_pattern(self):
+        for doc in self.docs:
+            results = self.matcher(doc)
+            for name, alternatives in self.patterns.items():
+                expected = first_match(self.vocab, doc, alternatives)
+                span = results.first(name)
+                with self.subTest(message=doc.text, pattern=name):
+                    if expected is None:
+                        self.assertIsNone(span)
+                    else:
+                        self.assertEqual((span.start, span.end),
+                                         (expected.start, expected.end))
+
+    def test_expected_spans(self):
+        first = [self.matcher(doc).first for doc in self.docs]
+        self.assertEqual(first[0]("depart").text,
+                         "from London Liverpool Street")
+        self.assertEqual(first[0]("arrive").text, "to Norwich")
+        self.assertEqual(first[6]("arrive").text, "to Great Yarmouth")
+        self.assertEqual(first[2]("dep_date").text, "leaving tomorrow at 9 am")
+        self.assertEqual(first[4]("ret_date").text, "returning 1130")
+        self.assertEqual(first[5]("dly_date").text, "leaving 9:15")
+        self.assertEqual(first[3]("num_children").text, "2 children")
+        self.assertIsNone(first[3]("book"))
+
+    def test_matched_once_per_doc(self):
+        self.assertIs(self.matcher(self.docs[0]), self.matcher(self.docs[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
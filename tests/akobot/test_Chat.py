@@ -1,7 +1,9 @@
 import unittest
+from unittest import mock
 
 from experta import Fact
 
+from akobot.AKOBot import NLPEngine
 from akobot.Chat import Chat
 
 test_case_departure = "ZLS"
@@ -47,6 +49,29 @@ class TestBooking(unittest.TestCase):
                          "I found a few departure stations that matched London."
                          " Is one of these correct?")
 
+    def test_add_adults_from_control_tag_without_nlp(self):
+        booking = Chat()
+        booking.chat_engine.reset()
+        booking.chat_engine.declare(Fact(action="book"))
+        booking.chat_engine.declare(Fact(message_text="{TAG:ADT}3"))
+        with mock.patch.object(NLPEngine, "process", autospec=True,
+                               side_effect=NLPEngine.process) as process:
+            booking.chat_engine.run()
+        self.assertEqual(booking.chat_engine.knowledge['no_adults'], 3)
+        process.assert_not_called()
+
+    def test_message_parsed_once_per_turn(self):
+        booking = Chat()
+        booking.chat_engine.reset()
+        booking.chat_engine.declare(Fact(action="book"))
+        booking.chat_engine.declare(Fact(message_text="depart from ZLS"))
+        with mock.patch.object(NLPEngine, "process", autospec=True,
+                               side_effect=NLPEngine.process) as process:
+            booking.chat_engine.run()
+        texts = [call.args[1] for call in process.call_args_list]
+        self.assertIn("depart from ZLS", texts)
+        self.assertEqual(len(texts), len(set(texts)))
+
 
 if __name__ == '__main__':
     unittest.main()
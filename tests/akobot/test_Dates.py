@@ -0,0 +1,62 @@
+import unittest
+from datetime import datetime
+
+from akobot.Dates import DateExtractor, parse_simple_time
+
+reference = datetime(2021, 3, 1, 8, 15)
+
+
+class TestParseSimpleTime(unittest.TestCase):
+    def test_24_hour_time(self):
+        self.assertEqual(parse_simple_time("17:30", reference),
+                         datetime(2021, 3, 1, 17, 30))
+
+    def test_am_pm(self):
+        self.assertEqual(parse_simple_time("7pm", reference),
+                         datetime(2021, 3, 1, 19, 0))
+        self.assertEqual(parse_simple_time("7:45 am", reference),
+                         datetime(2021, 3, 1, 7, 45))
+        self.assertEqual(parse_simple_time("12am", reference),
+                         datetime(2021, 3, 1, 0, 0))
+
+    def test_tomorrow(self):
+        self.assertEqual(parse_simple_time("tomorrow at 9", reference),
+                         datetime(2021, 3, 2, 9, 0))
+        self.assertEqual(parse_simple_time("9pm tomorrow", reference),
+                         datetime(2021, 3, 2, 21, 0))
+
+    def test_other_shapes_are_left_to_the_parser(self):
+        self.assertIsNone(parse_simple_time("9", reference))
+        self.assertIsNone(parse_simple_time("13pm", reference))
+        self.assertIsNone(parse_simple_time("25:00", reference))
+        self.assertIsNone(parse_simple_time("next friday at 9", reference))
+
+
+class TestDateExtractor(unittest.TestCase):
+    def test_normalises_before_parsing(self):
+        extractor = DateExtractor()
+        self.assertEqual(extractor.extract("7 o'clock", reference),
+                         datetime(2021, 3, 1, 7, 0))
+        self.assertEqual(extractor.extract("7 PM", reference),
+                         datetime(2021, 3, 1, 19, 0))
+
+    def test_results_are_cached(self):
+        extractor = DateExtractor()
+        extractor.extract("7pm", reference)
+        extractor.extract("7 pm", reference)
+        self.assertEqual(extractor.cached_extract.cache_info().hits, 1)
+
+    def test_relative_dates_use_the_reference(self):
+        extractor = DateExtractor()
+        self.assertEqual(extractor.extract("in 2 hours", reference),
+                         datetime(2021, 3, 1, 10, 15))
+        self.assertEqual(extractor.extract("in 2 hours",
+                                           datetime(2021, 3, 5, 9, 0)),
+                         datetime(2021, 3, 5, 11, 0))
+
+    def test_no_date(self):
+        self.assertIsNone(DateExtractor().extract("soon", reference))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from experta import Fact
+
+from akobot.Reasoner import ChatEngine, ControlTag, parse_control_tag
+
+
+class TestParseControlTag(unittest.TestCase):
+    def test_counts(self):
+        self.assertEqual(parse_control_tag("{TAG:ADT}3"),
+                         ControlTag("ADT", "3"))
+        self.assertEqual(parse_control_tag("{TAG:CHD} 0"),
+                         ControlTag("CHD", "0"))
+        self.assertEqual(parse_control_tag("{TAG:DDL}15"),
+                         ControlTag("DDL", "15"))
+
+    def test_return(self):
+        self.assertEqual(parse_control_tag("{TAG:RET}👍"),
+                         ControlTag("RET", True))
+        self.assertEqual(parse_control_tag("{TAG:RET} No"),
+                         ControlTag("RET", False))
+
+    def test_station(self):
+        self.assertEqual(parse_control_tag("{TAG:DEP}London Liverpool Street"),
+                         ControlTag("DEP", "London Liverpool Street"))
+
+    def test_free_text_falls_back_to_nlp(self):
+        self.assertIsNone(parse_control_tag("book a ticket"))
+        self.assertIsNone(parse_control_tag("{TAG:ADT} three adults"))
+        self.assertIsNone(parse_control_tag("{TAG:RET} maybe"))
+        self.assertIsNone(parse_control_tag("{TAG:DAT} tomorrow at 9"))
+        self.assertIsNone(parse_control_tag("{TAG:ADT}3{TAG:CHD}2"))
+
+
+class TestAnswerControlTag(unittest.TestCase):
+    booking = {"action": "book", "depart": "NRW", "arrive": "DIS",
+               "departure_date": datetime(2030, 1, 1, 9)}
+
+    def setUp(self):
+        # Control tags never reach SpaCy, so the pipeline isn't loaded
+        for patch in [mock.patch("akobot.Reasoner.NLPEngine"),
+                      mock.patch("akobot.Reasoner.get_rule_matcher")]:
+            patch.start()
+            self.addCleanup(patch.stop)
+        station_index = mock.patch("akobot.Reasoner.get_station_index")
+        station_index.start().return_value.find.return_value = ("NRW",
+                                                                "Norwich")
+        self.addCleanup(station_index.stop)
+
+    @staticmethod
+    def engine(knowledge, progress):
+        engine = ChatEngine()
+        engine.knowledge = dict(knowledge)
+        engine.progress = progress
+        return engine
+
+    def assert_same_as_engine(self, knowledge, progress, message_text):
+        answered = self.engine(knowledge, progress)
+        with mock.patch.object(ChatEngine, "reset") as reset, \
+                mock.patch.object(ChatEngine, "run") as run:
+            self.assertTrue(answered.answer_control_tag(message_text))
+        reset.assert_not_called()
+        run.assert_not_called()
+
+        # As Chat.add_message runs the engine for other messages
+        ruled = self.engine(knowledge, progress)
+        ruled.analyse(message_text)
+        ruled.reset()
+        ruled.declare(Fact(message_text=message_text))
+        ruled.run()
+        for attribute in ["knowledge", "progress", "message", "tags"]:
+            self.assertEqual(getattr(answered, attribute),
+                             getattr(ruled, attribute), attribute)
+        return answered
+
+    def test_booking(self):
+        engine = self.assert_same_as_engine(self.booking, "rt_rs_na_nc_",
+                                            "{TAG:RET}👍")
+        self.assertTrue(engine.message[0]["message"].startswith("{REQ:RTD}"))
+        engine = self.assert_same_as_engine(self.booking, "rt_rs_na_nc_",
+                                            "{TAG:RET}👎")
+        self.assertTrue(engine.message[0]["message"].startswith("{REQ:ADT}"))
+        engine = self.assert_same_as_engine(
+            dict(self.booking, returning=False), "na_nc_", "{TAG:ADT}2")
+        self.assertEqual(engine.knowledge["no_adults"], 2)
+        self.assertEqual(engine.tags, "{ADT:2}")
+
+    def test_same_station(self):
+        engine = self.assert_same_as_engine({"action": "book",
+                                             "arrive": "NRW"},
+                                            "dl_dt_rt_rs_na_nc_",
+                                            "{TAG:DEP}Norwich")
+        self.assertNotIn("depart", engine.knowledge)
+        self.assertEqual(len(engine.message), 1)
+
+    def test_delay(self):
+        engine = self.assert_same_as_engine({"action": "delay",
+                                             "depart": "Diss"},
+                                            "al_dt_dd_", "{TAG:ARR}Norwich")
+        self.assertEqual(engine.knowledge["arrive"], "Norwich")
+        engine = self.assert_same_as_engine({"action": "delay",
+                                             "depart": "Diss",
+                                             "arrive": "Norwich"},
+                                            "dt_dd_", "{TAG:DDL}5")
+        self.assertEqual(engine.knowledge["departure_delay"], 5)
+        self.assertTrue(engine.message[0]["message"].startswith("{REQ:DDT}"))
+
+    def test_completing_turns_left_to_the_engine(self):
+        knowledge = dict(self.booking, returning=False, no_adults=2)
+        engine = self.engine(knowledge, "nc_")
+        self.assertFalse(engine.answer_control_tag("{TAG:CHD}0"))
+        self.assertEqual(engine.knowledge, knowledge)
+        self.assertEqual((engine.progress, engine.message), ("nc_", []))
+
+        self.assertFalse(self.engine({}, "").answer_control_tag("{TAG:ADT}2"))
+        self.assertFalse(self.engine({"action": "delay"}, "dl_al_dt_dd_")
+                         .answer_control_tag("{TAG:ADT}2"))
+        self.assertFalse(self.engine(self.booking, "rs_")
+                         .answer_control_tag("returning please"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+
+from akobot.Sessions import ChatRegistry
+
+
+class FakeChat:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestChatRegistry(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.registry = ChatRegistry(max_entries=2, ttl=60, clock=self.clock)
+
+    def test_get_returns_stored_chat(self):
+        chat = FakeChat()
+        self.registry.put("a", chat)
+        self.assertIs(self.registry.get("a"), chat)
+        self.assertIsNone(self.registry.get("b"))
+        self.assertIsNone(self.registry.get(None))
+        stats = self.registry.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 2)
+
+    def test_least_recently_used_chat_is_evicted_and_closed(self):
+        chat_a, chat_b, chat_c = FakeChat(), FakeChat(), FakeChat()
+        self.registry.put("a", chat_a)
+        self.registry.put("b", chat_b)
+        self.registry.get("a")
+        self.registry.put("c", chat_c)
+        self.assertTrue(chat_b.closed)
+        self.assertFalse(chat_a.closed)
+        self.assertNotIn("b", self.registry)
+        self.assertEqual(len(self.registry), 2)
+        self.assertEqual(self.registry.stats()['evictions'], 1)
+
+    def test_idle_chat_is_expired_and_closed(self):
+        chat_a, chat_b = FakeChat(), FakeChat()
+        self.registry.put("a", chat_a)
+        self.clock.now = 30
+        self.registry.put("b", chat_b)
+        self.clock.now = 61
+        self.assertIsNone(self.registry.get("a"))
+        self.assertTrue(chat_a.closed)
+        self.assertIs(self.registry.get("b"), chat_b)
+        self.assertEqual(self.registry.stats()['expirations'], 1)
+
+    def test_replaced_and_removed_chats_are_closed(self):
+        chat_a, chat_b = FakeChat(), FakeChat()
+        self.registry.put("a", chat_a)
+        self.registry.put("a", chat_b)
+        self.assertTrue(chat_a.closed)
+        self.registry.remove("a")
+        self.assertTrue(chat_b.closed)
+        self.assertEqual(len(self.registry), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from Database.DatabaseConnector import close_connection_pools
+from Database.Migrations import migrate
+from akobot import StationNoMatchError, StationNotFoundError
+from akobot import Stations
+from akobot.Stations import StationIndex, get_station_index
+
+test_stations = [("ZLS", "London Liverpool Street"),
+                 ("LST", "London Liverpool Street"),
+                 ("NRW", "Norwich"),
+                 ("DIS", "Diss"),
+                 ("IPS", "Ipswich"),
+                 ("SRA", "Stratford (London)"),
+                 ("KGX", "London Kings Cross"),
+                 ("EUS", "London Euston")]
+
+
+class TestStationIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = StationIndex(test_stations)
+
+    def test_find_by_code(self):
+        self.assertEqual(self.index.find("nrw"), ("NRW", "Norwich"))
+
+    def test_find_by_unique_name(self):
+        self.assertEqual(self.index.find("ipswich"), ("IPS", "Ipswich"))
+
+    def test_shared_name_gives_alternatives(self):
+        with self.assertRaises(StationNoMatchError) as cm:
+            self.index.find("London Liverpool Street")
+        self.assertIn(("ZLS", "London Liverpool Street"),
+                      cm.exception.alternatives)
+
+    def test_misspelled_name_gives_closest_alternatives(self):
+        with self.assertRaises(StationNoMatchError) as cm:
+            self.index.find("Norwhich")
+        self.assertEqual(cm.exception.alternatives[0], ("NRW", "Norwich"))
+        self.assertEqual(len(cm.exception.alternatives), 3)
+
+    def test_partial_name_prefers_containing_stations(self):
+        with self.assertRaises(StationNoMatchError) as cm:
+            self.index.find("London")
+        for station in cm.exception.alternatives:
+            self.assertIn("London", station[1])
+
+    def test_no_stations(self):
+        with self.assertRaises(StationNotFoundError):
+            StationIndex([]).find("Norwich")
+
+
+class TestStationRecogniser(unittest.TestCase):
+    def setUp(self):
+        self.recogniser = StationIndex(test_stations).recogniser
+
+    def test_longest_name_is_matched(self):
+        match = self.recogniser.match_at("from london kings cross please", 5)
+        self.assertEqual(match.text, "london kings cross")
+        self.assertEqual(match.station, ("KGX", "London Kings Cross"))
+
+    def test_match_by_code(self):
+        match = self.recogniser.match_at("NRW", 0)
+        self.assertEqual(match.station, ("NRW", "Norwich"))
+
+    def test_match_must_end_at_word_boundary(self):
+        self.assertIsNone(self.recogniser.match_at("dissy", 0))
+        self.assertEqual(self.recogniser.match_at("diss.", 0).text, "diss")
+
+    def test_shared_name_has_no_station(self):
+        match = self.recogniser.match_at("london liverpool street", 0)
+        self.assertEqual(match.text, "london liverpool street")
+        self.assertIsNone(match.station)
+
+
+class TestGetStationIndex(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.workdir, "test.db")
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE Data (rid TEXT, tpl TEXT, pta TEXT, "
+                     "ptd TEXT, arr_at TEXT, dep_at TEXT)")
+        conn.execute("CREATE TABLE Stations (identifier TEXT, name TEXT)")
+        conn.executemany("INSERT INTO Stations VALUES (?, ?)", test_stations)
+        conn.commit()
+        conn.close()
+        Stations._station_index = None
+
+    def tearDown(self):
+        Stations._station_index = None
+        close_connection_pools()
+        shutil.rmtree(self.workdir)
+
+    def write(self, sql):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(sql)
+        conn.commit()
+        conn.close()
+
+    def test_only_rebuilt_when_stations_change(self):
+        migrate(self.db_path)
+        index = get_station_index(self.db_path)
+        self.assertEqual(len(index), len(test_stations))
+        self.write("INSERT INTO Data VALUES ('1', 'NRCH', '', '09:00', "
+                   "'', '09:01')")
+        self.assertIs(get_station_index(self.db_path), index)
+
+        self.write("INSERT INTO Stations VALUES ('MNG', 'Manningtree')")
+        index = get_station_index(self.db_path)
+        self.assertEqual(index.find("MNG"), ("MNG", "Manningtree"))
+        self.write("UPDATE Stations SET name = 'Norwich City' "
+                   "WHERE identifier = 'NRW'")
+        self.assertEqual(get_station_index(self.db_path).find("NRW"),
+                         ("NRW", "Norwich City"))
+
+    def test_unmigrated_database_rebuilt_on_any_write(self):
+        index = get_station_index(self.db_path)
+        self.write("INSERT INTO Data VALUES ('1', 'NRCH', '', '09:00', "
+                   "'', '09:01')")
+        self.assertIsNot(get_station_index(self.db_path), index)
+
+
+if __name__ == '__main__':
+    unittest.main()